@@ -0,0 +1,215 @@
+"""
+Docstring for backend.ArchiveReader
+Streaming reader for uploaded archives (.zip, .tar, .tar.gz / .tgz, .tar.zst).
+Members are iterated lazily and filtered by name before anything is decompressed.
+By default a member's bytes are returned in memory. With extract_to=<dir> they are copied to
+<dir>/<name> in chunks instead, so a caller holding many members keeps only their paths.
+
+Uploads are untrusted, so the reader enforces
+- a cap on the number of members
+- a cap on the total uncompressed size
+- a cap on the compression ratio (per member for zip, whole stream for tar)
+- no absolute paths, no .. components, no links
+
+for member in iter_members("uploads/x.tar.gz", wanted=lambda name: name.endswith(".py")):
+    source = member.read()
+for member in iter_members("uploads/x.tar.gz", extract_to="scratch/x"):
+    member.path  # scratch/x/<name>
+"""
+import contextlib
+import os
+import posixpath
+import tarfile
+import time
+import zipfile
+from collections import Counter
+from dataclasses import dataclass
+from typing import Callable
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAX_MEMBERS = 50_000
+MAX_TOTAL_SIZE = 512 * 1024 * 1024
+MAX_RATIO = 100
+MAX_MEMBER_SIZE = 1024 * 1024
+COPY_CHUNK = 64 * 1024
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.zst")
+
+
+class ArchiveLimitError(ValueError):
+    pass
+
+
+@dataclass
+class ArchiveMember:
+    archive: str
+    name: str
+    size: int
+    mtime: float
+    content: bytes | None = None
+    path: str | None = None  # the extracted copy, when iterated with extract_to
+
+    def read(self) -> bytes:
+        if self.content is not None:
+            return self.content
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+def is_archive(name: str) -> bool:
+    return name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def safe_name(name: str) -> str | None:
+    name = name.replace("\\", "/")
+    if name.startswith("/") or (len(name) > 1 and name[1] == ":"):
+        return None
+    normalized = posixpath.normpath(name)
+    if normalized.startswith("..") or normalized == ".":
+        return None
+    return normalized
+
+
+class _Budget:
+    def __init__(self, archive, max_members, max_total_size):
+        self.archive = archive
+        self.max_members = max_members
+        self.max_total_size = max_total_size
+        self.members = 0
+        self.total = 0
+
+    def member(self):
+        self.members += 1
+        if self.members > self.max_members:
+            raise ArchiveLimitError(f"{self.archive}: more than {self.max_members} members")
+
+    def consume(self, size):
+        self.total += size
+        if self.total > self.max_total_size:
+            raise ArchiveLimitError(f"{self.archive}: more than {self.max_total_size} bytes uncompressed")
+
+
+def _read_limited(fileobj, limit, archive, name):
+    data = fileobj.read(limit + 1)
+    if len(data) > limit:
+        # the header lied about the size
+        raise ArchiveLimitError(f"{archive}: {name} is larger than declared")
+    return data
+
+
+def _member(fileobj, archive, name, size, mtime, extract_to) -> ArchiveMember:
+    if extract_to is None:
+        return ArchiveMember(archive, name, size, mtime, _read_limited(fileobj, size, archive, name))
+    target = os.path.join(extract_to, name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    written = 0
+    try:
+        with open(target, "wb") as out:
+            while chunk := fileobj.read(COPY_CHUNK):
+                written += len(chunk)
+                if written > size:
+                    raise ArchiveLimitError(f"{archive}: {name} is larger than declared")
+                out.write(chunk)
+    except BaseException:
+        os.unlink(target)
+        raise
+    os.utime(target, (mtime, mtime))
+    return ArchiveMember(archive, name, size, mtime, path=target)
+
+
+def _iter_zip(path, wanted, budget, max_ratio, max_member_size, skipped, extract_to):
+    with zipfile.ZipFile(path) as zf:
+        for info in zf.infolist():
+            budget.member()
+            name = safe_name(info.filename)
+            is_link = (info.external_attr >> 16) & 0o170000 == 0o120000
+            if info.is_dir() or is_link or name is None or not wanted(name):
+                continue
+            if info.file_size > max_member_size:
+                skipped["oversized"] += 1
+                continue
+            if info.file_size > max_ratio * max(info.compress_size, 1) and info.file_size > 64 * 1024:
+                raise ArchiveLimitError(f"{path}: {name} exceeds compression ratio {max_ratio}")
+            budget.consume(info.file_size)
+            with zf.open(info) as f:
+                member = _member(f, path, name, info.file_size, _zip_mtime(info), extract_to)
+            yield member
+
+
+def _zip_mtime(info):
+    try:
+        return time.mktime(info.date_time + (0, 0, -1))
+    except (OverflowError, ValueError):
+        return 0.0
+
+
+def _open_tar(path):
+    lower = path.lower()
+    if lower.endswith(".tar.zst"):
+        if zstandard is None:
+            raise ArchiveLimitError(f"{path}: .tar.zst needs the zstandard package")
+        raw = open(path, "rb")
+        stream = zstandard.ZstdDecompressor().stream_reader(raw)
+        return tarfile.open(fileobj=stream, mode="r|"), raw
+    # r|* streams the members in order and never seeks
+    return tarfile.open(path, mode="r|*"), None
+
+
+def _iter_tar(path, wanted, budget, max_ratio, max_member_size, skipped, extract_to):
+    compressed = max(os.path.getsize(path), 1)
+    tar, raw = _open_tar(path)
+    try:
+        for info in tar:
+            budget.member()
+            # tar has to decompress everything it walks past, count all of it
+            budget.consume(info.size)
+            if budget.total > max_ratio * compressed and budget.total > 64 * 1024 * 1024:
+                raise ArchiveLimitError(f"{path}: exceeds compression ratio {max_ratio}")
+            name = safe_name(info.name)
+            if not info.isfile() or name is None or not wanted(name):
+                continue
+            if info.size > max_member_size:
+                skipped["oversized"] += 1
+                continue
+            f = tar.extractfile(info)
+            if f is None:
+                continue
+            yield _member(f, path, name, info.size, float(info.mtime), extract_to)
+    finally:
+        tar.close()
+        if raw is not None:
+            raw.close()
+
+
+def iter_members(
+    path,
+    wanted: Callable[[str], bool] = lambda name: True,
+    max_members: int = MAX_MEMBERS,
+    max_total_size: int = MAX_TOTAL_SIZE,
+    max_ratio: float = MAX_RATIO,
+    max_member_size: int = MAX_MEMBER_SIZE,
+    skipped: Counter | None = None,
+    extract_to: str | None = None,
+):
+    """
+    Yields ArchiveMembers for the regular files whose (normalized) name passes `wanted`.
+    Raises ArchiveLimitError as soon as a cap is hit, members already yielded (and extracted) stay valid.
+    """
+    path = str(path)
+    budget = _Budget(path, max_members, max_total_size)
+    skipped = skipped if skipped is not None else Counter()
+    if path.lower().endswith(".zip"):
+        yield from _iter_zip(path, wanted, budget, max_ratio, max_member_size, skipped, extract_to)
+    else:
+        yield from _iter_tar(path, wanted, budget, max_ratio, max_member_size, skipped, extract_to)
+
+
+def read_member(path, name: str) -> bytes:
+    # returning early must still close the archive the generator holds open
+    with contextlib.closing(iter_members(path, wanted=lambda n: n == name)) as members:
+        for member in members:
+            return member.content
+    raise KeyError(f"{name} not found in {path}")
@@ -0,0 +1,322 @@
+"""
+Docstring for backend.Codemod
+Deterministic fast path for mechanical rules, applied before code_generation().
+
+classify_rule() recognises rules that are a single rename, e.g.
+- "BaseModel.parse_obj() must be replaced with BaseModel.model_validate()"      -> call rename
+- "Replace `User.from_orm(row)` with `User.model_validate(row, from_attributes=True)`" -> call rename + keywords
+- "Replace `Model.__fields__` with `Model.model_fields`"                           -> attribute rename
+Anything with conditions, several changes, a different receiver or no receiver at all is left to the llm.
+
+The rewrite locates call sites with ast and edits only those tokens, formatting is kept
+and every changed line gets the same traceability comment code_generation() asks for:
+    user = User.model_validate(data)  # <rule_text> Source: <urls>
+
+A site is rewritten only when its receiver resolves to the rule's class or a subclass of it:
+the class itself (`User.parse_obj`), self / cls inside such a class, a name annotated with it
+(`user: User`) or assigned from its constructor (`user = User(...)`). Generic names like
+`.json()`, `.dict()` or `.copy()` on anything else (`requests.get(url).json()`, `{}.copy()`)
+are left alone and their rule goes to the llm.
+
+code, remaining = codemod(rules, code, subclasses=lambda base: index.subclasses(project, base))
+# remaining are the rules the llm still has to apply, [] means no llm call at all
+"""
+import ast
+import io
+import re
+import tokenize
+from dataclasses import dataclass, field
+
+from .RuleIndex import parse_rules
+
+CODE = r"`?(?:[A-Za-z_][\w]*)?(?:\.[A-Za-z_]\w*)*(?:\([^()`]*\))?`?"
+RENAMES = [
+    re.compile(rf"\breplace\s+(?P<old>{CODE})\s+(?:with|by)\s+(?P<new>{CODE})", re.I),
+    re.compile(rf"(?P<old>{CODE})\s+(?:(?:must|should|has to|needs to)\s+be\s+|is\s+|are\s+)?(?:replaced|renamed|changed)\s+(?:with|by|to)\s+(?P<new>{CODE})", re.I),
+    re.compile(rf"\buse\s+(?P<new>{CODE})\s+instead\s+of\s+(?P<old>{CODE})", re.I),
+]
+# rules that say more than "a becomes b" need judgement
+CONDITIONAL = {"if", "unless", "when", "only", "except", "also", "additionally", "enabled", "configuration", "config"}
+
+
+@dataclass
+class Rewrite:
+    rule: dict
+    old: str
+    new: str
+    call: bool
+    keywords: list[tuple[str, str]] = field(default_factory=list)
+    owner: str | None = None  # class of the old name, None only for renames a verified fix taught (Reflection)
+
+    @property
+    def comment(self) -> str:
+        urls = ", ".join(s.get("url") for s in self.rule.get("sources", []) if s.get("url"))
+        text = " ".join(self.rule.get("rule_text", "").split())
+        return f"{text} Source: {urls}" if urls else text
+
+
+def _split(code: str):
+    """`User.parse_obj(data)` -> ("User", "parse_obj", "data"), args is None for attribute access."""
+    code = code.strip("`")
+    match = re.fullmatch(r"((?:[A-Za-z_]\w*)?(?:\.[A-Za-z_]\w*)*?)\.?([A-Za-z_]\w*)(?:\((.*)\))?", code)
+    if not match:
+        return None
+    return match.group(1), match.group(2), match.group(3)
+
+
+def _arguments(args: str):
+    try:
+        call = ast.parse(f"f({args})", mode="eval").body
+    except SyntaxError:
+        return None
+    return call
+
+
+def classify_rule(rule: dict) -> Rewrite | None:
+    text = rule.get("rule_text", "")
+    for pattern in RENAMES:
+        found = list(pattern.finditer(text))
+        if len(found) == 1:
+            break
+    else:
+        return None
+    match = found[0]
+    rest = text[:match.start()] + " " + text[match.end():]
+    if "`" in rest or "(" in rest or re.search(r"\b\w+_\w+\b|\b\w+\.\w+\b", rest):
+        return None
+    if CONDITIONAL & set(re.findall(r"[a-z]+", rest.lower())):
+        return None
+    old, new = _split(match.group("old")), _split(match.group("new"))
+    if not old or not new or old[1] == new[1]:
+        return None
+    (old_receiver, old_name, old_args), (new_receiver, new_name, new_args) = old, new
+    # "User.parse_obj" -> "User.model_validate" is a rename, "json.dumps" -> "orjson.dumps" is not,
+    # ".json()" -> ".model_dump_json()" names no class to check receivers against
+    if old_receiver != new_receiver or not old_receiver:
+        return None
+    owner = old_receiver.rsplit(".", 1)[-1]
+    if (old_args is None) != (new_args is None):
+        return None
+    if old_args is None:
+        return Rewrite(rule, old_name, new_name, call=False, owner=owner)
+    before, after = _arguments(old_args), _arguments(new_args)
+    if before is None or after is None or before.keywords:
+        return None
+    # new call = old arguments + literal keywords
+    if ast.dump(ast.Tuple(before.args, ast.Load())) != ast.dump(ast.Tuple(after.args, ast.Load())):
+        return None
+    keywords = []
+    for keyword in after.keywords:
+        if keyword.arg is None or not isinstance(keyword.value, ast.Constant):
+            return None
+        keywords.append((keyword.arg, repr(keyword.value.value)))
+    return Rewrite(rule, old_name, new_name, call=True, keywords=keywords, owner=owner)
+
+
+def split_rules(rules) -> tuple[list[Rewrite], list[dict]]:
+    rewrites, remaining = [], []
+    for rule in parse_rules(rules):
+        rewrite = classify_rule(rule)
+        (rewrites if rewrite else remaining).append(rewrite or rule)
+    # two rules renaming the same name differently is a conflict for the llm to resolve
+    targets = {}
+    for rewrite in rewrites:
+        targets.setdefault(rewrite.old, set()).add((rewrite.new, tuple(rewrite.keywords)))
+    conflicting = {old for old, news in targets.items() if len(news) > 1}
+    remaining += [r.rule for r in rewrites if r.old in conflicting]
+    seen = set()
+    unique = []
+    for rewrite in rewrites:
+        if rewrite.old not in conflicting and rewrite.old not in seen:
+            seen.add(rewrite.old)
+            unique.append(rewrite)
+    return unique, remaining
+
+
+def _commentable_lines(source: str) -> set[int] | None:
+    """Lines whose end is outside strings and continuations, a comment can go there."""
+    unsafe = set()
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            if token.type == tokenize.STRING and token.end[0] > token.start[0]:
+                unsafe.update(range(token.start[0], token.end[0]))
+    except (tokenize.TokenError, SyntaxError):
+        return None
+    lines = source.splitlines()
+    return {i for i, line in enumerate(lines, 1) if i not in unsafe and not line.rstrip().endswith("\\")}
+
+
+def _type_name(node) -> str | None:
+    # User, models.User, "User", Optional[User] and User | None all name User
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        try:
+            node = ast.parse(node.value, mode="eval").body
+        except SyntaxError:
+            return None
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Subscript) and _type_name(node.value) == "Optional":
+        return _type_name(node.slice)
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+        names = {_type_name(side) for side in (node.left, node.right)} - {"None", None}
+        return names.pop() if len(names) == 1 else None
+    return None
+
+
+def _called_class(node) -> str | None:
+    return _type_name(node.func) if isinstance(node, ast.Call) else None
+
+
+class _Receivers:
+    """Resolves the receiver of an attribute access to a class name, as far as the file itself tells."""
+
+    SCOPES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)
+
+    def __init__(self, tree: ast.AST):
+        self.parents = {child: parent for parent in ast.walk(tree) for child in ast.iter_child_nodes(parent)}
+        self.bases = {}  # class -> base names
+        self.types = {}  # scope (function node, None for the module) -> {variable: class}
+        for node in ast.walk(tree):
+            if isinstance(node, ast.ClassDef):
+                self.bases.setdefault(node.name, set()).update(filter(None, map(_type_name, node.bases)))
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                names = self.types.setdefault(node, {})
+                args = node.args.posonlyargs + node.args.args + node.args.kwonlyargs
+                for arg in args:
+                    if arg.annotation is not None and _type_name(arg.annotation):
+                        names[arg.arg] = _type_name(arg.annotation)
+                static = any(_type_name(d) == "staticmethod" for d in node.decorator_list)
+                if args and not static and isinstance(self.parents.get(node), ast.ClassDef):
+                    names.setdefault(args[0].arg, self.parents[node].name)  # self / cls
+            elif (isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name) and _type_name(node.annotation)
+                  and not isinstance(self.parents.get(node), ast.ClassDef)):
+                self.types.setdefault(self.scope(node), {})[node.target.id] = _type_name(node.annotation)
+            elif isinstance(node, ast.Assign) and _called_class(node.value):
+                for target in node.targets:
+                    if isinstance(target, ast.Name):
+                        self.types.setdefault(self.scope(node), {})[target.id] = _called_class(node.value)
+
+    def scope(self, node):
+        node = self.parents.get(node)
+        while node is not None and not isinstance(node, self.SCOPES):
+            node = self.parents.get(node)
+        return node
+
+    def subclasses(self, known: set[str]) -> set[str]:
+        """known plus every class of this file that derives from one of them."""
+        found, changed = set(known), True
+        while changed:
+            changed = False
+            for name, bases in self.bases.items():
+                if name not in found and bases & found:
+                    found.add(name)
+                    changed = True
+        return found
+
+    def resolve(self, node) -> str | None:
+        if isinstance(node, ast.Call):
+            # User(...).json()
+            return _called_class(node)
+        if isinstance(node, ast.Attribute):
+            # models.User.parse_obj()
+            return node.attr
+        if not isinstance(node, ast.Name):
+            return None
+        scope = self.scope(node)
+        while True:
+            if node.id in self.types.get(scope, {}):
+                return self.types[scope][node.id]
+            if scope is None:
+                # not a known variable, a class referenced by name
+                return node.id
+            scope = self.scope(scope)
+
+
+def apply_rewrites(code: str, rewrites: list[Rewrite], subclasses=None) -> tuple[str | None, list[Rewrite]]:
+    """
+    (rewritten code, rewrites with sites whose receiver could not be resolved to the rule's class).
+    The code is None when it is not python or an edit could not be placed safely.
+    subclasses(base) -> set of class names adds the project's subclasses (SymbolIndex) to those of the file.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None, []
+    receivers = _Receivers(tree)
+    classes = {}
+    for owner in {r.owner for r in rewrites if r.owner}:
+        classes[owner] = receivers.subclasses({owner} | set(subclasses(owner) if subclasses else ()))
+    unresolved = {}
+    by_name = {r.old: r for r in rewrites}
+    data = code.encode()
+    starts = [0] + [m.end() for m in re.finditer(b"\n", data)]
+
+    def offset(line, col):
+        return starts[line - 1] + col
+
+    edits = []  # (start, end, text)
+    commented = {}  # line -> rewrites
+    for node in ast.walk(tree):
+        target = None
+        if isinstance(node, ast.Call):
+            # rules always name a method, a bare `dict(...)` is never a `.dict()` call site
+            func = node.func
+            if isinstance(func, ast.Attribute) and func.attr in by_name and by_name[func.attr].call:
+                target = func
+        elif isinstance(node, ast.Attribute) and node.attr in by_name and not by_name[node.attr].call:
+            target = node
+        if target is None:
+            continue
+        name = target.attr
+        rewrite = by_name[name]
+        if rewrite.owner and receivers.resolve(target.value) not in classes[rewrite.owner]:
+            unresolved[name] = rewrite
+            continue
+        end = offset(target.end_lineno, target.end_col_offset)
+        edits.append((end - len(name.encode()), end, rewrite.new))
+        commented.setdefault(target.end_lineno, []).append(rewrite)
+        present = {k.arg for k in getattr(node, "keywords", [])}
+        added = [f"{arg}={value}" for arg, value in rewrite.keywords if arg not in present]
+        if added:
+            # right after the last argument, a trailing comma or a ) on its own line stay where they are
+            opened = offset(target.end_lineno, target.end_col_offset)
+            before = data[opened:offset(node.end_lineno, node.end_col_offset) - 1].rstrip()
+            separator = "" if before.endswith(b"(") else (" " if before.endswith(b",") else ", ")
+            at = opened + len(before)
+            edits.append((at, at, separator + ", ".join(added)))
+            commented.setdefault(data.count(b"\n", 0, at) + 1, []).append(rewrite)
+    unresolved = list(unresolved.values())
+    if not edits:
+        return code, unresolved
+    for start, end, text in sorted(edits, reverse=True):
+        data = data[:start] + text.encode() + data[end:]
+    result = data.decode()
+    safe = _commentable_lines(result)
+    if safe is None or not set(commented) <= safe:
+        return None, unresolved
+    lines = result.splitlines(keepends=True)
+    for line, applied in commented.items():
+        body = lines[line - 1]
+        newline = body[len(body.rstrip("\r\n")):]
+        comments = dict.fromkeys(r.comment for r in applied)
+        lines[line - 1] = body.rstrip("\r\n") + "".join(f"  # {c}" for c in comments) + newline
+    result = "".join(lines)
+    try:
+        ast.parse(result)
+    except SyntaxError:
+        return None, unresolved
+    return result, unresolved
+
+
+def codemod(rules, code: str, subclasses=None) -> tuple[str, list[dict]]:
+    """Applies the mechanical rules locally, returns the new code and the rules left for the llm."""
+    rewrites, remaining = split_rules(rules)
+    if not rewrites:
+        return code, remaining
+    result, unresolved = apply_rewrites(code, rewrites, subclasses)
+    if result is None:
+        return code, parse_rules(rules)
+    # sites on other receivers may still need the rule, the llm decides
+    return result, remaining + [r.rule for r in unresolved]
@@ -0,0 +1,142 @@
+"""
+Docstring for backend.Hunks
+Region splitting and a local unified-diff applier for hunk-level patching.
+
+- split_regions() cuts a python file into top-level regions (one per function / class,
+  consecutive module level statements together, leading comments go with the next region),
+  other languages stay one region
+- affected_regions() keeps the regions that contain a symbol of the rules (RuleMatcher)
+- apply_diff() applies a model-written unified diff to a region, every context and removed line
+  has to match the original, hunk headers only decide where to look first
+- parse_diff() reads the line counts of each hunk header, while a hunk still expects lines
+  "--- x" / "+++ x" are a removed "-- x" / added "++ x" line, not file headers
+
+regions = affected_regions(split_regions(code), rules)
+new_text = apply_diff(region.text, diff, first_line=region.start)
+"""
+import ast
+import re
+from dataclasses import dataclass
+
+from .RuleMatcher import AhoCorasick, _bounded, extract_symbols
+from .RuleIndex import parse_rules
+
+
+class PatchError(ValueError):
+    pass
+
+
+@dataclass
+class Region:
+    start: int  # 1-based, inclusive
+    end: int
+    text: str
+
+
+@dataclass
+class Hunk:
+    old_start: int
+    old: list[str]
+    new: list[str]
+
+
+def split_regions(code: str) -> list[Region]:
+    lines = code.splitlines(keepends=True)
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        tree = None
+    if tree is None or not tree.body:
+        return [Region(1, len(lines), code)]
+    bounds = []
+    for node in tree.body:
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+        definition = isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))
+        if bounds and not definition and not bounds[-1][2]:
+            bounds[-1][1] = node.end_lineno
+        else:
+            bounds.append([start, node.end_lineno, definition])
+    # comments and blank lines between nodes belong to the region below them, the tail to the last one
+    bounds[0][0] = 1
+    for previous, current in zip(bounds, bounds[1:]):
+        current[0] = previous[1] + 1
+    bounds[-1][1] = len(lines)
+    return [Region(start, end, "".join(lines[start - 1:end])) for start, end, _ in bounds]
+
+
+def affected_regions(regions: list[Region], rules) -> list[Region]:
+    symbols = {s for rule in parse_rules(rules) for s in extract_symbols(rule)}
+    if not symbols:
+        return regions
+    automaton = AhoCorasick(symbols)
+    return [
+        region for region in regions
+        if any(_bounded(region.text, end - len(p), end, p) for end, p in automaton.iter(region.text))
+    ]
+
+
+HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,(\d+))? @@")
+
+
+def parse_diff(diff: str) -> list[Hunk]:
+    hunks = []
+    old_left = new_left = 0  # lines the current hunk header still announces
+    for line in diff.splitlines():
+        match = HEADER.match(line)
+        if match:
+            hunks.append(Hunk(int(match.group(1)), [], []))
+            old_left = int(match.group(2) or 1)
+            new_left = int(match.group(3) or 1)
+            continue
+        if not hunks or line.startswith(("```", "\\")):
+            continue
+        # file headers only come between hunks, models also get the counts wrong, so past them lines still count
+        if old_left <= 0 and new_left <= 0 and line.startswith(("---", "+++")):
+            continue
+        hunk = hunks[-1]
+        # models tend to drop the leading space of empty context lines
+        tag, body = (line[0], line[1:]) if line else (" ", "")
+        if tag == " ":
+            hunk.old.append(body)
+            hunk.new.append(body)
+            old_left -= 1
+            new_left -= 1
+        elif tag == "-":
+            hunk.old.append(body)
+            old_left -= 1
+        elif tag == "+":
+            hunk.new.append(body)
+            new_left -= 1
+        else:
+            raise PatchError(f"unexpected diff line: {line!r}")
+    if not hunks and diff.strip():
+        raise PatchError("no hunks in diff")
+    return hunks
+
+
+def _matches(lines: list[str], at: int, block: list[str]) -> bool:
+    if at + len(block) > len(lines):
+        return False
+    return all(lines[at + i].rstrip() == block[i].rstrip() for i in range(len(block)))
+
+
+def apply_diff(text: str, diff: str, first_line: int = 1) -> str:
+    """text with the hunks applied, PatchError when a hunk does not fit."""
+    lines = text.splitlines()
+    trailing = "\n" if text.endswith("\n") else ""
+    done = 0  # hunks apply in order and never overlap
+    shift = 0
+    for hunk in parse_diff(diff):
+        expected = hunk.old_start - first_line + shift
+        if not hunk.old:
+            # -N,0 inserts after line N, -0,0 at the top
+            at = min(max(expected + 1, done), len(lines))
+        else:
+            candidates = [i for i in range(done, len(lines) - len(hunk.old) + 1) if _matches(lines, i, hunk.old)]
+            if not candidates:
+                raise PatchError(f"hunk at line {hunk.old_start} does not match the original")
+            at = min(candidates, key=lambda i: abs(i - expected))
+        lines[at:at + len(hunk.old)] = hunk.new
+        done = at + len(hunk.new)
+        shift += len(hunk.new) - len(hunk.old)
+    return "\n".join(lines) + trailing if lines else ""
@@ -1,12 +1,17 @@
 #--------------Assuming the files are already uploaded and we have what to convert from what version to what next version-----------------#
-from huggingface_hub import InferenceClient
-from api_import import HUGGING_FACE ,TAVILY
+from .LLMClient import chat, count_tokens, token_offsets
 from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode ,urljoin
 from langchain_community.document_loaders import WebBaseLoader
-from tavily import TavilyClient
 from pydantic import AnyUrl
 from typing import List
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from .RetrievalEngine import RetrievalEngine, SearchConfigError, extract_text
+from .PageCache import PageCache
+from .SourceAuthority import NEUTRAL, AuthorityStore, hostname_of
+import asyncio
+import logging
+import re
+logger = logging.getLogger(__name__)
 topic = """Library: pydantic
 From version: 1.x
 To version: 2.x
@@ -42,20 +47,42 @@ If you cannot generate valid queries, output NOTHING.
 """
 links=[]
 
-def get_response():
+def get_response(topic=topic):
     model_name = 'Qwen/Qwen2.5-7B-Instruct'
-    client = InferenceClient(model=model_name,token=HUGGING_FACE)
-    response = client.chat.completions.create(
-        messages=[
+    queries = chat(
+        model_name,
+        [
             {"role": "system", "content": GUIDE},
             {"role": "user", "content": f"Generate the answer according to the rules for the topic = {topic}"}
         ],
         max_tokens=100,
-        temperature=0.1
+        temperature=0.1,
+        stage="get_response"
     )
-    queries = response.choices[0].message.content
-    queries = queries.strip().splitlines()[0]
+    queries = queries.splitlines()[0]
     return queries
+
+def make_topic(library, from_version, to_version):
+    return f"""Library: {library}
+From version: {from_version}
+To version: {to_version}
+Goal: migration and breaking changes
+"""
+
+def generate_queries(topic=topic, limit=8):
+    model_name = 'Qwen/Qwen2.5-7B-Instruct'
+    answer = chat(
+        model_name,
+        [
+            {"role": "system", "content": GUIDE},
+            {"role": "user", "content": f"Generate the answer according to the rules for the topic = {topic}"}
+        ],
+        max_tokens=400,
+        temperature=0.1,
+        stage="get_response"
+    )
+    lines = [l.strip().lstrip("-*0123456789. ").strip('"') for l in answer.splitlines()]
+    return list(dict.fromkeys(l for l in lines if l))[:limit]
 ##temp link var to work on the search engine - 
 queries = [['pydantic 1.x to 2.x migration guide', 'pydantic 2.x breaking changes', 'pydantic 1.x to 2.x deprecation list', 'pydantic 1.x to 2.x migration documentation', 'pydantic 2.x migration from 1.x', 'pydantic 1.x to 2.x schema changes', 'pydantic 2.x migration guide official', 'pydantic 1.x to 2.x type changes']]
 query = queries[0]
@@ -69,91 +96,209 @@ UI_PATTERNS = [
     r"previous\s+next",
     r"on this page",
 ]
-def chunking_results(link:AnyUrl):
-    docs = WebBaseLoader(link).load()
-    normalized=[]
+UI_PATTERN = re.compile("|".join(UI_PATTERNS), re.IGNORECASE)
+# chunks must fit the synthesis prompt of RuleSynthesis.get_guidance
+SYNTHESIS_MODEL = 'Qwen/Qwen2.5-7B-Instruct'
+CHUNK_TOKENS = 1500
+CHUNK_OVERLAP = 150
+# bump when normalization / chunking changes, cached chunk lists of older formats are not reused
+CHUNK_FORMAT = f"2:{SYNTHESIS_MODEL}:{CHUNK_TOKENS}:{CHUNK_OVERLAP}"
+
+def iter_lines(text):
+    """Cleaned, non empty lines of a page, one pass and no intermediate copies of the page."""
+    for match in re.finditer(r"[^\n]+", text):
+        line = UI_PATTERN.sub("", match.group(0).replace("\t", " ")).strip()
+        if line:
+            yield line
+
+def _split_long(line, max_tokens, model):
+    # the line is tokenized once, pieces are cut at every max_tokens-th token offset
+    starts = token_offsets(line, model)
+    for i in range(0, len(starts), max_tokens):
+        end = starts[i + max_tokens] if i + max_tokens < len(starts) else len(line)
+        piece = line[starts[i]:end].strip()
+        if piece:
+            yield piece, min(max_tokens, len(starts) - i)
+
+def iter_chunks(lines, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP, model=SYNTHESIS_MODEL):
+    """Packs lines into chunks of at most max_tokens, each chunk repeats about `overlap` tokens of the previous one."""
+    window, used = [], 0
+    for line in lines:
+        line_tokens = count_tokens(line, model)
+        pieces = _split_long(line, max_tokens, model) if line_tokens > max_tokens else ((line, line_tokens),)
+        for piece, tokens in pieces:
+            tokens += 1
+            if window and used + tokens > max_tokens:
+                yield "\n".join(l for l, _ in window)
+                # keep the tail as overlap, but never so much that the new piece does not fit
+                tail, kept = [], 0
+                for l, t in reversed(window):
+                    if kept + t > overlap or kept + t + tokens > max_tokens:
+                        break
+                    tail.append((l, t))
+                    kept += t
+                window, used = tail[::-1], kept
+            window.append((piece, tokens))
+            used += tokens
+    if window:
+        yield "\n".join(l for l, _ in window)
+
+def iter_normalized(docs, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
     for doc in docs:
-        text = doc.page_content
-        text = text.replace("\t"," ")
-        text = "\n".join(l.strip() for l in text.splitlines())
-        text = "\n".join(l for l in text.splitlines() if l)
-        if len(text.split())<10:
-            continue
-        for pattern in UI_PATTERNS:
-            text = text.replace(pattern,"")
-        doc.page_content = text
-        normalized.append(doc)
-    return normalized
+        # numbered after dropping short chunks, chunk_index is the position in the stored chunk list
+        chunks = (c for c in iter_chunks(iter_lines(doc.page_content), max_tokens, overlap) if len(c.split()) >= 10)
+        for i, chunk in enumerate(chunks):
+            yield Document(page_content=chunk, metadata={**doc.metadata, "chunk_index": i})
 
+def normalize_documents(docs, max_tokens=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    return list(iter_normalized(docs, max_tokens, overlap))
+
+def chunking_results(link:AnyUrl, cache=None):
+    if cache is not None:
+        entry = cache.get(link)
+        if entry and cache.is_fresh(entry):
+            cache.hits += 1
+            return entry["chunks"]
+        cache.misses += 1
+    docs = WebBaseLoader(link).load()
+    body = "\n".join(d.page_content for d in docs).encode()
+    docs = normalize_documents(docs)
+    if cache is not None:
+        cache.put(link, body, docs)
+    return docs
+
+async def load_chunks(engine, url, title=None, cache=None):
+    entry = cache.get(url) if cache is not None else None
+    if entry and cache.is_fresh(entry):
+        cache.hits += 1
+        return entry["chunks"]
+    page = await engine.fetch(url, headers=cache.validators(entry) if cache is not None else None)
+    if page.status == 304 and entry:
+        cache.revalidated += 1
+        cache.touch(url)
+        return entry["chunks"]
+    if cache is not None:
+        cache.misses += 1
+    text = await asyncio.to_thread(extract_text, page.body)
+    content = normalize_documents([Document(page_content=text, metadata={"source": url, "title": title})])
+    if cache is not None:
+        cache.put(url, page.body, content, page.etag, page.last_modified)
+    return content
+
+
+authority = None
+
+def get_authority():
+    global authority
+    if authority is None:
+        authority = AuthorityStore()
+    return authority
 
 def priority_assignment(url):
-    url_parsed = urlparse(url)
-    hostname = url_parsed.hostname
-    if hostname == 'github.com':
-        return 'High'
-    elif 'docs.' in hostname:
-        return 'Critical'
-    elif hostname == 'stackoverflow.com':
-        return 'Medium'
-    else:
-        model_name = 'mistralai/Mistral-7B-Instruct-v0.2'
-        guide = """You are a source authority classifier.
-
-Your task is to assign an authority level to a web source
-based only on its origin and role, not on the claims it makes.
-
-Authority levels:
-- high: official documentation, specifications, or primary maintainers
-- medium: widely trusted community-maintained sources
-- low: personal blogs, opinion pieces, SEO content, forums
+    return get_authority().lookup(url)
 
-Rules:
-- If the source is not official, it cannot be high.
-- If unsure, choose the lower authority.
-- Never infer authority from writing quality or popularity.
-- Never override known official domains.
-- Base your decision on source type and domain only.
-
-Output ONLY valid one word answer:
-"Critical | High | Medium | low"
-"""
-        client = InferenceClient(model=model_name,token=HUGGING_FACE)
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content":guide },
-                {"role": "user", "content": f"{url}"}
-            ],
-            max_tokens=100,
-            temperature=0.1
-        )
-        queries = response.choices[0].message.content
-        queries = queries.strip().splitlines()[0]
-        return queries
-    
-def search():
-    client = TavilyClient(api_key=TAVILY)
-    documents = []
-
-    for q in queries:
-        response = client.search(
-            query=q,
-            max_results=5,
-        )
-        for r in response.get("results", []):
-            flag = True
-            url = r.get("url")
-            try:
-                content = chunking_results(url)
-            except Exception as e:
-                flag = False
-                continue
-            documents.append({
-                "priority":priority_assignment(),
-                "query": q,
-                "title": r.get("title"),
-                "url": r.get("url"),
-                "content": r.get("content"),
-                "score": r.get("score"),
-                "chunk":content if flag else 'no_content',
-                "status":'works' if flag else 'broken'
-            })
\ No newline at end of file
+def priority_batch(urls):
+    return get_authority().classify_batch(urls)
+
+def known_priority(url):
+    # runs on the event loop: only what priority_batch() already decided or the static rules, never the llm
+    return get_authority().cached(hostname_of(url)) or NEUTRAL
+
+async def _search_query(engine, q, max_results):
+    try:
+        results = await engine.search(q, max_results=max_results)
+    except SearchConfigError:
+        # every other query would fail the same way, stop the run
+        raise
+    except Exception as e:
+        logger.warning("search for %r failed: %s", q, e)
+        return []
+    # one llm request for every hostname of this query that is not known yet
+    urls = [r.get("url") for r in results]
+    try:
+        await asyncio.to_thread(priority_batch, urls)
+    except Exception as e:
+        # the pages still get the neutral priority
+        logger.warning("classifying the sources of %r failed: %s", q, e)
+    return results
+
+async def _retrieve(engine, q, r, cache, inflight):
+    url = r.get("url")
+    # several queries usually return the same page, fetch it once
+    if url not in inflight:
+        inflight[url] = asyncio.ensure_future(load_chunks(engine, url, r.get("title"), cache))
+    try:
+        content = await asyncio.shield(inflight[url])
+    except Exception as e:
+        logger.info("skipping %s: %s", url, e)
+        return []
+    priority = known_priority(url)
+    # one document per chunk, each one is a separate synthesis input
+    return [{
+        "priority":priority,
+        "query": q,
+        "title": r.get("title"),
+        "url": url,
+        "content": r.get("content"),
+        "score": r.get("score"),
+        "chunk":chunk.page_content,
+        "chunk_index":chunk.metadata.get("chunk_index", i),
+        "status":'works'
+    } for i, chunk in enumerate(content)]
+
+SEARCH = "search"
+RETRIEVE = "retrieve"
+
+async def search_stream(query_list=None, max_results=5, engine=None, cache=None):
+    """
+    Runs every query at once and fetches each result page as soon as its query returns.
+    Documents are yielded in completion order, not query order.
+    Broken pages and failed searches are logged and skipped, a SearchConfigError propagates.
+    Pages are read through cache (a PageCache) when one is given.
+    """
+    query_list = query_list if query_list is not None else query
+    if engine is None:
+        async with RetrievalEngine() as engine:
+            async for doc in search_stream(query_list, max_results, engine, cache):
+                yield doc
+        return
+    pending = {}  # task -> (SEARCH | RETRIEVE, query)
+    inflight = {}
+    for q in query_list:
+        pending[asyncio.create_task(_search_query(engine, q, max_results))] = (SEARCH, q)
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                kind, q = pending.pop(task)
+                if kind == RETRIEVE:
+                    for doc in task.result():
+                        yield doc
+                    continue
+                for r in task.result():
+                    pending[asyncio.create_task(_retrieve(engine, q, r, cache, inflight))] = (RETRIEVE, q)
+    finally:
+        # consumer stopped early or a search failed for good
+        for task in [*pending, *inflight.values()]:
+            task.cancel()
+
+def search(query_list=None, max_results=5, cache=None, on_document=None, check=None, on_stats=None):
+    """
+    on_document(doc) is called for every chunk record as soon as it is ready.
+    check() is called before each one, an exception from it stops the searches and fetches still running.
+    on_stats(stats) gets the page cache hits / misses / revalidations of this search once it is done.
+    """
+    cache = cache if cache is not None else PageCache(version=CHUNK_FORMAT)
+    async def collect():
+        documents = []
+        async for doc in search_stream(query_list, max_results, cache=cache):
+            if check:
+                check()
+            documents.append(doc)
+            if on_document:
+                on_document(doc)
+        return documents
+    documents = asyncio.run(collect())
+    if on_stats:
+        on_stats(cache.stats())
+    return documents
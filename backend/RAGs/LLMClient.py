@@ -0,0 +1,255 @@
+"""
+Docstring for backend.LLMClient
+Single entry point for every llm call of the RAG stages.
+
+- one long-lived InferenceClient per model (async clients per model and event loop, dropped with the loop,
+  `await close_async_clients()` before the loop ends closes their sessions)
+- chat() / achat() return the stripped message content, chat(on_token=...) streams the deltas as they arrive
+- chat_many() / achat_many() submit several requests concurrently, results keep the input order
+- every call is recorded in `calls` with stage, latency and token usage,
+  `with metered() as usage:` counts the calls made inside the block by this thread, its asyncio tasks
+  and the pool threads it hands work to through metering() (chat_many does)
+- low temperature answers are served from ResponseCache, pass cache=False to skip it
+
+Set LLM_BASE_URL to send everything to an OpenAI compatible server instead of the HF router,
+e.g. a local fake server in tests.
+"""
+import asyncio
+import contextlib
+import contextvars
+import functools
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from huggingface_hub import AsyncInferenceClient, InferenceClient
+
+from .api_import import HUGGING_FACE, LLM_BASE_URL
+from .ResponseCache import ResponseCache, cache_key
+
+MAX_WORKERS = 8
+
+
+class CallRecord(NamedTuple):
+    stage: str | None
+    model: str
+    latency: float
+    prompt_tokens: int
+    completion_tokens: int
+    cached: bool = False
+
+
+calls: deque[CallRecord] = deque(maxlen=10000)
+_clients: dict = {}
+_async_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()  # loop -> {model: client}
+_lock = threading.Lock()
+_meters: contextvars.ContextVar[tuple[dict, ...]] = contextvars.ContextVar("meters", default=())
+_meters_lock = threading.Lock()
+response_cache: ResponseCache | None = None
+
+
+def get_cache() -> ResponseCache:
+    global response_cache
+    with _lock:
+        if response_cache is None:
+            response_cache = ResponseCache()
+        return response_cache
+
+
+@contextlib.contextmanager
+def metered():
+    """Token usage of the chat() calls made inside the block, e.g. for a per-run budget."""
+    usage = {"calls": 0, "cached": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    token = _meters.set((*_meters.get(), usage))
+    try:
+        yield usage
+    finally:
+        _meters.reset(token)
+
+
+def metering(fn):
+    """fn counted by the metered() blocks open here, wherever it runs, e.g. pool.map(metering(fn), items)."""
+    meters = _meters.get()
+
+    @functools.wraps(fn)
+    def run(*args, **kwargs):
+        token = _meters.set(meters)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _meters.reset(token)
+    return run
+
+
+def _meter(record: CallRecord):
+    calls.append(record)
+    # pool threads of one run update the same usage dicts
+    with _meters_lock:
+        for usage in _meters.get():
+            usage["calls"] += 1
+            usage["cached"] += record.cached
+            usage["prompt_tokens"] += record.prompt_tokens
+            usage["completion_tokens"] += record.completion_tokens
+
+
+@functools.lru_cache(maxsize=None)
+def _tokenizer(model: str):
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(model)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str | None = None) -> int:
+    tokenizer = _tokenizer(model) if model else None
+    if tokenizer is None:
+        # ~4 characters per token for english prose and code
+        return len(text) // 4 + 1
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+def token_offsets(text: str, model: str | None = None) -> list[int]:
+    """Start offset of every token of text, from a single tokenizer call."""
+    tokenizer = _tokenizer(model) if model else None
+    if tokenizer is not None:
+        try:
+            encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+            return [start for start, _ in encoding["offset_mapping"]]
+        except NotImplementedError:
+            # slow (python) tokenizers have no offset mapping
+            pass
+    # same ~4 characters per token estimate as count_tokens()
+    return list(range(0, len(text), 4))
+
+
+def get_client(model: str) -> InferenceClient:
+    with _lock:
+        if model not in _clients:
+            if LLM_BASE_URL:
+                _clients[model] = InferenceClient(base_url=LLM_BASE_URL, api_key=HUGGING_FACE)
+            else:
+                _clients[model] = InferenceClient(model=model, token=HUGGING_FACE)
+        return _clients[model]
+
+
+def get_async_client(model: str) -> AsyncInferenceClient:
+    # async clients hold a session tied to the running loop, keyed weakly so a finished loop takes them along
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        if model not in clients:
+            if LLM_BASE_URL:
+                clients[model] = AsyncInferenceClient(base_url=LLM_BASE_URL, api_key=HUGGING_FACE)
+            else:
+                clients[model] = AsyncInferenceClient(model=model, token=HUGGING_FACE)
+        return clients[model]
+
+
+async def close_async_clients():
+    """Closes the async clients of the running loop, the next achat() on it opens new ones."""
+    with _lock:
+        clients = _async_clients.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.close()
+
+
+def _request(model, messages, max_tokens, temperature):
+    request = {"messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+    if LLM_BASE_URL:
+        request["model"] = model
+    return request
+
+
+def _lookup(model, messages, max_tokens, temperature, stage, cache):
+    if not cache or not get_cache().enabled(stage, temperature):
+        return None, None
+    key = cache_key(model, messages, max_tokens=max_tokens, temperature=temperature)
+    answer = get_cache().get(key)
+    if answer is not None:
+        _meter(CallRecord(stage, model, 0.0, 0, 0, True))
+    return key, answer
+
+
+def _record(stage, model, started, response, key):
+    return _finish(stage, model, started, response.choices[0].message.content, getattr(response, "usage", None), key)
+
+
+def _finish(stage, model, started, content, usage, key):
+    _meter(CallRecord(
+        stage,
+        model,
+        time.perf_counter() - started,
+        getattr(usage, "prompt_tokens", 0) or 0,
+        getattr(usage, "completion_tokens", 0) or 0,
+    ))
+    answer = (content or "").strip()
+    if key is not None:
+        get_cache().put(key, stage, answer)
+    return answer
+
+
+def _stream(model, messages, max_tokens, temperature, stage, key, on_token):
+    started = time.perf_counter()
+    parts, usage = [], None
+    for chunk in get_client(model).chat.completions.create(**_request(model, messages, max_tokens, temperature), stream=True):
+        usage = getattr(chunk, "usage", None) or usage
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            parts.append(delta)
+            on_token(delta)
+    return _finish(stage, model, started, "".join(parts), usage, key)
+
+
+def chat(model: str, messages: list[dict], max_tokens: int, temperature: float, stage: str | None = None, cache: bool = True, on_token=None) -> str:
+    """on_token(text) is called with every streamed delta, a cached answer arrives as one delta."""
+    key, answer = _lookup(model, messages, max_tokens, temperature, stage, cache)
+    if answer is not None:
+        if on_token:
+            on_token(answer)
+        return answer
+    if on_token:
+        return _stream(model, messages, max_tokens, temperature, stage, key, on_token)
+    started = time.perf_counter()
+    response = get_client(model).chat.completions.create(**_request(model, messages, max_tokens, temperature))
+    return _record(stage, model, started, response, key)
+
+
+async def achat(model: str, messages: list[dict], max_tokens: int, temperature: float, stage: str | None = None, cache: bool = True) -> str:
+    key, answer = _lookup(model, messages, max_tokens, temperature, stage, cache)
+    if answer is not None:
+        return answer
+    started = time.perf_counter()
+    response = await get_async_client(model).chat.completions.create(**_request(model, messages, max_tokens, temperature))
+    return _record(stage, model, started, response, key)
+
+
+def chat_many(requests: list[dict], max_workers: int = MAX_WORKERS) -> list[str]:
+    """requests are chat() keyword arguments"""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(metering(lambda r: chat(**r)), requests))
+
+
+async def achat_many(requests: list[dict], limit: int = MAX_WORKERS) -> list[str]:
+    slots = asyncio.Semaphore(limit)
+
+    async def run(r):
+        async with slots:
+            return await achat(**r)
+
+    return await asyncio.gather(*(run(r) for r in requests))
+
+
+def usage_summary() -> dict:
+    summary = {}
+    for record in list(calls):
+        stage = summary.setdefault(record.stage, {"calls": 0, "cached": 0, "latency": 0.0, "prompt_tokens": 0, "completion_tokens": 0})
+        stage["calls"] += 1
+        stage["cached"] += record.cached
+        stage["latency"] += record.latency
+        stage["prompt_tokens"] += record.prompt_tokens
+        stage["completion_tokens"] += record.completion_tokens
+    return summary
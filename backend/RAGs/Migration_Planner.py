@@ -20,8 +20,8 @@ The output will be
 Steps to change code + risks faced
 
 """
-from api_import import HUGGING_FACE
-from huggingface_hub import InferenceClient
+from .LLMClient import chat
+from .RuleIndex import select_rules
 
 
 MIGRATION_GUIDE = """You are a migration planning assistant.
@@ -72,18 +72,22 @@ DO NOT suggest alternatives outside the rules.
 If a rule requires configuration changes to enable behavior, apply configuration rules before behavior rules.
 """
 model_name = "Qwen/Qwen2.5-14B-Instruct"
-def migration_prompt(rules,code,error=None):
-  client = InferenceClient(model=model_name,token=HUGGING_FACE)
-  response = client.chat.completions.create(
-      messages=[
+def migration_prompt(rules,code,error=None,top_k=8,on_token=None,select=True):
+  # only the rules that share identifiers with the code (or the error) go into the prompt,
+  # select=False when the caller already picked them with select_rules
+  if select:
+    rules = select_rules(rules, f"{code}\n{error or ''}", k=top_k)
+  queries = chat(
+      model_name,
+      [
           {"role": "system", "content": MIGRATION_GUIDE},
           {"role": "user", "content": f"Follow the guide with the inputs being: \n rules:{rules} \n code :{code} \n errors :{error} \n "}
       ],
       max_tokens=2048,
-      temperature=0.1
+      temperature=0.1,
+      stage="migration_prompt",
+      on_token=on_token
   )
-  queries = response.choices[0].message.content
-  queries = queries.strip()
   return queries
 rules = [
     {
@@ -154,6 +158,8 @@ print(user.json())
 """
 
 
-ans = migration_prompt(rules=rules,code=code,error=error)
-print(ans)
-print(type(ans))
+# demo, run from backend/ as `python -m RAGs.Migration_Planner`
+if __name__ == "__main__":
+    ans = migration_prompt(rules=rules,code=code,error=error)
+    print(ans)
+    print(type(ans))
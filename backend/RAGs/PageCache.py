@@ -0,0 +1,128 @@
+"""
+Docstring for backend.PageCache
+Fetch cache for retrieved pages, keyed by url.
+Raw bodies are stored once per content hash (mirrors of the same page share a row),
+next to the normalized chunk list produced for them.
+
+- entries younger than ttl are served without touching the network
+- older entries are revalidated with If-None-Match / If-Modified-Since, a 304 refreshes them
+- the total body size is capped, least recently used pages are evicted first
+
+hits / misses / revalidated counters live on the instance, use one instance per run.
+Rows are keyed by "<version> <url>": the chunk list depends on how the caller normalizes pages,
+a caller that changes its chunking passes a new version and never reads chunks made the old way.
+"""
+import hashlib
+import json
+import threading
+import time
+
+from langchain_core.documents import Document
+
+from .Storage import connect
+
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class PageCache:
+    def __init__(self, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES, name: str = "pages.sqlite",
+                 version: str = "1"):
+        self.ttl = ttl
+        self.version = version
+        self.max_bytes = max_bytes
+        self.conn = connect(name)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        with self.lock:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS pages (
+                    url TEXT PRIMARY KEY,
+                    body_hash TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    fetched_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    chunks TEXT NOT NULL
+                )"""
+            )
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS bodies (hash TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS pages_lru ON pages (accessed_at)")
+
+    def _key(self, url: str) -> str:
+        return f"{self.version} {url}"
+
+    def get(self, url: str) -> dict | None:
+        url = self._key(url)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, fetched_at, chunks FROM pages WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE pages SET accessed_at = ? WHERE url = ?", (time.time(), url))
+        etag, last_modified, fetched_at, chunks = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": fetched_at,
+            "chunks": [Document(**c) for c in json.loads(chunks)],
+        }
+
+    def body(self, url: str) -> bytes | None:
+        url = self._key(url)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT b.body FROM pages p JOIN bodies b ON b.hash = p.body_hash WHERE p.url = ?", (url,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_fresh(self, entry: dict) -> bool:
+        return time.time() - entry["fetched_at"] < self.ttl
+
+    def validators(self, entry: dict | None) -> dict:
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def put(self, url: str, body: bytes, chunks: list, etag: str | None = None, last_modified: str | None = None):
+        url = self._key(url)
+        body_hash = hashlib.sha256(body).hexdigest()
+        payload = json.dumps([{"page_content": c.page_content, "metadata": c.metadata} for c in chunks])
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO bodies (hash, body, size) VALUES (?, ?, ?)", (body_hash, body, len(body))
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, body_hash, etag, last_modified, now, now, payload),
+            )
+            self._evict()
+
+    def touch(self, url: str):
+        # server answered 304, the stored copy is good for another ttl
+        url = self._key(url)
+        now = time.time()
+        with self.lock:
+            self.conn.execute("UPDATE pages SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url))
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+        while total > self.max_bytes:
+            row = self.conn.execute("SELECT url FROM pages ORDER BY accessed_at LIMIT 1").fetchone()
+            if row is None:
+                break
+            self.conn.execute("DELETE FROM pages WHERE url = ?", row)
+            self.conn.execute("DELETE FROM bodies WHERE hash NOT IN (SELECT body_hash FROM pages)")
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM bodies").fetchone()[0]
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "revalidated": self.revalidated}
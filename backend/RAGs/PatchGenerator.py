@@ -27,10 +27,17 @@ Risks and Caveats:
 - Risk 1: The replacement of `User.from_orm(db_row)` with `User.model_validate(db_row, from_attributes=True)` assumes that `db_row` is an ORM instance. If this assumption is incorrect, the migration may fail.
 - Risk 2: Changing the configuration style from an inner `Config` class to `model_config` might introduce subtle differences in behavior if there were any custom configurations or hooks in the original `Config` class.
 """
-from api_import import HUGGING_FACE
-from huggingface_hub import InferenceClient
+import logging
+
+from .Codemod import codemod
+from .Hunks import PatchError, affected_regions, apply_diff, split_regions
+from .LLMClient import chat, chat_many, count_tokens
+from .Migration_Planner import migration_prompt
+from .RuleIndex import select_rules
 from pathlib import Path
+logger = logging.getLogger(__name__)
 model_name = "Qwen/Qwen2.5-32B-Instruct"
+HUNK_MIN_LINES = 200
 CODING_GUIDE = """You are a code modification engine.
 
 INPUTS YOU WILL RECEIVE:
@@ -105,8 +112,7 @@ FORBIDDEN BEHAVIOR
 - Do NOT add or remove imports unless required by a rule.
 - Do NOT change formatting except where a change is applied.
 """
-def code_generation(migration_steps:str,code:str):
-  client = InferenceClient(model=model_name,token=HUGGING_FACE)
+def code_generation(migration_steps:str,code:str,on_token=None):
   USER_PROMPT = f"""Apply the following migration steps to the provided code.
 
 Migration Steps:
@@ -126,17 +132,97 @@ OUTPUT REQUIREMENTS:
 - Do NOT add explanations outside code comments.
 - Do NOT change formatting except where required by the change.
 """
-  response = client.chat.completions.create(
-      messages=[
+  queries = chat(
+      model_name,
+      [
           {"role": "system", "content": CODING_GUIDE},
           {"role": "user", "content": USER_PROMPT}
       ],
       max_tokens=2048,
-      temperature=0.0
+      temperature=0.0,
+      stage="code_generation",
+      on_token=on_token
   )
-  queries = response.choices[0].message.content
-  queries = queries.strip()
   return queries
+DIFF_GUIDE = CODING_GUIDE.replace(
+    "- The ONLY valid output is source code.",
+    "- The ONLY valid output is a unified diff (@@ -start,count +start,count @@ hunks, no file headers).",
+) + """
+DIFF RULES:
+- Line numbers in hunk headers are line numbers of the FULL file, the region starts at the given line.
+- Every context (" ") and removed ("-") line must be copied exactly from the region.
+- Keep 2 lines of context around each change.
+- If no step applies to the region, output nothing.
+"""
+def diff_generation(migration_steps:str, region:str, start_line:int):
+  USER_PROMPT = f"""Apply the following migration steps to the code region below.
+
+Migration Steps:
+{migration_steps}
+
+Code region (starts at line {start_line} of the file):
+{region}
+
+OUTPUT REQUIREMENTS:
+- Return ONLY a unified diff of the changes to this region.
+- Every added line MUST include the inline traceability comment (description + source URL(s)).
+- Do NOT add explanations outside code comments.
+"""
+  return dict(
+      model=model_name,
+      messages=[
+          {"role": "system", "content": DIFF_GUIDE},
+          {"role": "user", "content": USER_PROMPT}
+      ],
+      # a diff never needs much more than the region itself
+      max_tokens=min(2048, 2 * count_tokens(region, model_name) + 128),
+      temperature=0.0,
+      stage="hunk_generation"
+  )
+def patch_hunks(migration_steps:str, code:str, rules, max_workers=8):
+  """Only the regions a rule touches go to the model, in parallel, and come back as diffs."""
+  regions = split_regions(code)
+  targets = affected_regions(regions, rules)
+  diffs = chat_many([diff_generation(migration_steps, r.text, r.start) for r in targets], max_workers=max_workers)
+  patched = {}
+  for region, diff in zip(targets, diffs):
+    try:
+      patched[region.start] = apply_diff(region.text, diff, first_line=region.start)
+    except PatchError as e:
+      logger.warning("diff for lines %d-%d rejected (%s), regenerating the region", region.start, region.end, e)
+      text = code_generation(migration_steps=migration_steps, code=region.text)
+      patched[region.start] = text if text.endswith("\n") or not region.text.endswith("\n") else text + "\n"
+  return "".join(patched.get(r.start, r.text) for r in regions)
+def patch_code(rules, code:str, error=None, top_k=8, hunks=None, on_token=None, subclasses=None, within=None):
+  """
+  rules -> applicable rules (RuleIndex) -> mechanical rules (Codemod) -> migration steps -> patched code
+  rules is the full rule set of the migration, within the rules matched for this file (RuleMatcher)
+  on_token(stage, text) receives the planner and generator output while it streams (full-file mode only)
+  subclasses(base) -> class names of the project deriving from base, lets Codemod resolve more receivers
+  """
+  def tokens(stage):
+    return (lambda text: on_token(stage, text)) if on_token else None
+  applicable = select_rules(rules, f"{code}\n{error or ''}", k=top_k, within=within)
+  if not applicable:
+    # nothing to migrate in this file, skip both llm calls
+    return code
+  code, applicable = codemod(applicable, code, subclasses)
+  if not applicable:
+    # every rule was a rename / keyword rewrite, applied locally
+    return code
+  if hunks is None:
+    # full-file output is capped by max_tokens, large files go through diffs
+    hunks = code.count("\n") >= HUNK_MIN_LINES
+  if not hunks:
+    migration_steps = migration_prompt(applicable, code, error, on_token=tokens("migration_prompt"), select=False)
+    return code_generation(migration_steps=migration_steps, code=code, on_token=tokens("code_generation"))
+  # the planner sees the regions the diffs are written for, not the whole file
+  targets = affected_regions(split_regions(code), applicable)
+  if not targets:
+    return code
+  excerpt = "\n...\n".join(r.text for r in targets)
+  migration_steps = migration_prompt(applicable, excerpt, error, on_token=tokens("migration_prompt"), select=False)
+  return patch_hunks(migration_steps, code, applicable)
 code = """from pydantic import BaseModel
 from typing import Optional
 
@@ -189,9 +275,11 @@ Risks and Caveats:
 - Risk 1: The replacement of `User.from_orm(db_row)` with `User.model_validate(db_row, from_attributes=True)` assumes that `db_row` is an ORM instance. If this assumption is incorrect, the migration may fail.
 - Risk 2: Changing the configuration style from an inner `Config` class to `model_config` might introduce subtle differences in behavior if there were any custom configurations or hooks in the original `Config` class.
 """
-ans = code_generation(migration_steps=migration_steps,code=code)
-BASE_DIR = Path(__file__).parent
-file_path = BASE_DIR / "virtual_testing" / "code.py"
-with open(file_path, "w") as f:
-    f.writelines(ans)
+# demo, run from backend/ as `python -m RAGs.PatchGenerator`
+if __name__ == "__main__":
+    ans = code_generation(migration_steps=migration_steps,code=code)
+    BASE_DIR = Path(__file__).parent
+    file_path = BASE_DIR / "virtual_testing" / "code.py"
+    with open(file_path, "w") as f:
+        f.writelines(ans)
 
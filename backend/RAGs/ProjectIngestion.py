@@ -1,10 +1,47 @@
-import os 
-from pathlib import Path
+"""
+Docstring for backend.ProjectIngestion
+Walks an upload or a cloned repo and collects the files the later stages work on.
+
+- iterative os.scandir walk, files are yielded lazily (iter_files)
+- .git / node_modules / virtualenvs / build output and .gitignore'd paths are pruned before descending
+- binary and oversized files are skipped
+- walk errors are logged and counted in skipped["error"], next to their reason (unreadable / rejected_archive)
+- archives (.zip, .tar, .tar.gz, .tar.zst) are read member by member through ArchiveReader, the wanted members
+  and their .gitignore files are extracted to the manifest's scratch dir and walked like a directory;
+  their files are recorded as "<archive>!/<member>" and read from the extracted copy when needed,
+  IngestionManifest.close() removes the scratch dir
+- every run gets its own IngestionManifest instead of module level lists
+- ingest_incremental() hashes files on a thread pool and diffs them against the previous run of the same project,
+  so later stages only see added / changed files
+
+manifest = ingest_directory("repos/<run_id>_<name>")
+manifest.code_files  ->  [{"file": path, "lang": "python"}, ...]
+manifest.text_docs   ->  [path to requirements.txt, package.json, ...]
+"""
+import hashlib
+import logging
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
 import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .ArchiveReader import ArchiveLimitError, is_archive, iter_members
+from .Storage import connect
+
+logger = logging.getLogger(__name__)
+
 BASE_DIR = Path(__file__).resolve()
 while BASE_DIR.name != "backend":
     BASE_DIR = BASE_DIR.parent
 uploads_dir = BASE_DIR / "uploads"
+repos_dir = BASE_DIR / "repos"
 ALLOWED_EXTENSIONS = {
     "python": {".py"},
     "node": {".js", ".mjs", ".cjs"},
@@ -21,47 +58,392 @@ AUX_FILES = {
     "go.sum",
     "pyproject.toml",
 }
-code_files = []
-text_docs = []
-
-def process_file(file_path):
-    filename = os.path.basename(file_path)
-    for key, val in ALLOWED_EXTENSIONS.items():
-        if "." + filename.split('.')[-1] in val:
-            code_files.append({"file": file_path, "lang": key})
-            return
-    
-    if filename in AUX_FILES:
-        text_docs.append(file_path)
-
-def ingest_directory_recursive(directory):
-    try:
-        for item in os.listdir(directory):
-            item_path = os.path.join(directory, item)
-            
-            if os.path.isdir(item_path):
-                ingest_directory_recursive(item_path)
+IGNORE_DIRS = {
+    ".git", ".hg", ".svn",
+    "node_modules", "bower_components",
+    "venv", ".venv", "env", ".env", "site-packages",
+    "__pycache__", ".mypy_cache", ".pytest_cache", ".ruff_cache", ".tox", ".nox",
+    "dist", "build", "target", ".gradle", ".idea", ".vscode",
+}
+MAX_FILE_SIZE = 1024 * 1024
+LANG_BY_EXTENSION = {ext: lang for lang, exts in ALLOWED_EXTENSIONS.items() for ext in exts}
+
+
+@dataclass
+class FileRecord:
+    path: str
+    rel_path: str
+    lang: str | None  # None for AUX_FILES
+    size: int
+    mtime: float
+    archive: str | None = None
+    extracted: str | None = None  # archive members only, their copy in the manifest's scratch dir
+    sha256: str | None = None
+
+
+@dataclass
+class IngestionManifest:
+    root: str
+    files: list[FileRecord] = field(default_factory=list)
+    skipped: Counter = field(default_factory=Counter)
+    scratch: str | None = None  # extracted archive members
+
+    def close(self):
+        if self.scratch:
+            shutil.rmtree(self.scratch, ignore_errors=True)
+            self.scratch = None
+
+    @property
+    def code_files(self) -> list[dict]:
+        return [{"file": f.path, "lang": f.lang} for f in self.files if f.lang]
+
+    @property
+    def text_docs(self) -> list[str]:
+        return [f.path for f in self.files if f.lang is None]
+
+
+def gitignore_regex(pattern: str) -> str:
+    """
+    One .gitignore pattern (already without !, leading / and trailing /) as a regex over a slash separated path.
+    * and ? never match a /, [...] is a character class ([!...] negated), a leading **/ matches in any directory,
+    /**/ matches zero or more directories and a trailing /** everything inside, \\ escapes the next character.
+    """
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("/**", i) and i + 3 == n:
+            out.append("/.*")
+            i += 3
+        elif c == "*":
+            # a ** that is not a whole path component is a plain *
+            while i < n and pattern[i] == "*":
+                i += 1
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+            i += 1
+        elif c == "[":
+            j = i + 1
+            if j < n and pattern[j] in "!^":
+                j += 1
+            if j < n and pattern[j] == "]":
+                j += 1
+            while j < n and pattern[j] != "]":
+                j += 1
+            if j >= n:
+                out.append(re.escape(c))
+                i += 1
                 continue
+            body = pattern[i + 1:j]
+            if body[0] in "!^":
+                body = "^" + body[1:]
+            out.append("[" + body.replace("[", "\\[") + "]")
+            i = j + 1
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            out.append(re.escape(c))
+            i += 1
+    return "(?s:" + "".join(out) + ")\\Z"
+
+
+class GitIgnore:
+    """The usual subset of .gitignore syntax: globs, **, leading / anchors, trailing / for dirs, ! negation."""
+
+    def __init__(self, rules=()):
+        self.rules = list(rules)
+
+    def extended(self, directory: str, rel_dir: str) -> "GitIgnore":
+        path = os.path.join(directory, ".gitignore")
+        if not os.path.isfile(path):
+            return self
+        rules = list(self.rules)
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.rstrip("\n").rstrip()
+                if not line or line.startswith("#"):
+                    continue
+                negate = line.startswith("!")
+                line = line[1:] if negate else line
+                dir_only = line.endswith("/")
+                line = line.rstrip("/")
+                anchored = "/" in line
+                rules.append((rel_dir, re.compile(gitignore_regex(line.lstrip("/"))), negate, dir_only, anchored))
+        return GitIgnore(rules)
 
-            if item.endswith(".zip"):
-                try:
-                    extract_path = os.path.splitext(item_path)[0]
-                    os.makedirs(extract_path, exist_ok=True)
-                    with zipfile.ZipFile(item_path, 'r') as zip_ref:
-                        zip_ref.extractall(extract_path)
-                    ingest_directory_recursive(extract_path)
-                except Exception as e:
-                    print(f"Error processing zip {item}: {e}")
+    def ignored(self, rel_path: str, is_dir: bool) -> bool:
+        result = False
+        for base, pattern, negate, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
                 continue
+            if base:
+                if not rel_path.startswith(base + "/"):
+                    continue
+                candidate = rel_path[len(base) + 1:]
+            else:
+                candidate = rel_path
+            target = candidate if anchored else candidate.rsplit("/", 1)[-1]
+            if pattern.match(target):
+                result = not negate
+        return result
 
-            process_file(item_path)
-            
-    except Exception as e:
-        print(f"Error accessing directory {directory}: {e}")
 
+def is_binary(path: str) -> bool:
+    with open(path, "rb") as f:
+        return b"\0" in f.read(8192)
 
-ingest_directory_recursive(str(uploads_dir))
 
-repos_dir = BASE_DIR / "repos"
-if repos_dir.exists():
-    ingest_directory_recursive(str(repos_dir))
\ No newline at end of file
+def classify(name: str) -> tuple[bool, str | None]:
+    if name in AUX_FILES:
+        return True, None
+    lang = LANG_BY_EXTENSION.get(os.path.splitext(name)[1])
+    return lang is not None, lang
+
+
+def iter_files(root, skipped: Counter | None = None, max_file_size: int = MAX_FILE_SIZE, scratch: str | None = None):
+    """Archives are extracted below scratch, without one they are skipped."""
+    root = os.path.abspath(root)
+    skipped = skipped if skipped is not None else Counter()
+    stack = [(root, "", GitIgnore().extended(root, ""))]
+    visited = set()
+    while stack:
+        directory, rel_dir, ignore = stack.pop()
+        if directory in visited:
+            continue
+        visited.add(directory)
+        try:
+            entries = list(os.scandir(directory))
+        except OSError as e:
+            logger.warning("cannot read directory %s: %s", directory, e)
+            skipped["unreadable"] += 1
+            skipped["error"] += 1
+            continue
+        for entry in entries:
+            rel_path = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name in IGNORE_DIRS or ignore.ignored(rel_path, True):
+                        skipped["ignored_dir"] += 1
+                        continue
+                    stack.append((entry.path, rel_path, ignore.extended(entry.path, rel_path)))
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                if is_archive(entry.name):
+                    if scratch is None:
+                        skipped["archive"] += 1
+                        continue
+                    yield from iter_archive(entry.path, rel_path, skipped, scratch, max_file_size)
+                    continue
+                wanted, lang = classify(entry.name)
+                if not wanted:
+                    continue
+                if ignore.ignored(rel_path, False):
+                    skipped["ignored_file"] += 1
+                    continue
+                stat = entry.stat(follow_symlinks=False)
+                if stat.st_size > max_file_size:
+                    skipped["oversized"] += 1
+                    continue
+                if is_binary(entry.path):
+                    skipped["binary"] += 1
+                    continue
+                yield FileRecord(entry.path, rel_path, lang, stat.st_size, stat.st_mtime)
+            except OSError as e:
+                logger.warning("cannot read %s: %s", entry.path, e)
+                skipped["unreadable"] += 1
+                skipped["error"] += 1
+
+
+def _wanted_member(name: str) -> bool:
+    parts = name.split("/")
+    if any(part in IGNORE_DIRS for part in parts[:-1]):
+        return False
+    return parts[-1] == ".gitignore" or classify(parts[-1])[0]
+
+
+def iter_archive(path, rel_path, skipped: Counter, scratch: str, max_file_size: int = MAX_FILE_SIZE):
+    """
+    Extracts the wanted members to scratch/<rel_path> first, a .gitignore may come after the files it covers,
+    then walks the copy with iter_files so the same pruning and .gitignore rules apply as for a directory.
+    """
+    target = os.path.join(scratch, rel_path)
+    try:
+        for _ in iter_members(path, wanted=_wanted_member, max_member_size=max_file_size, skipped=skipped,
+                              extract_to=target):
+            pass
+    except (ArchiveLimitError, tarfile.TarError, zipfile.BadZipFile, OSError) as e:
+        # members extracted before the cap was hit are still ingested
+        logger.warning("rejected archive %s: %s", path, e)
+        skipped["rejected_archive"] += 1
+        skipped["error"] += 1
+    if not os.path.isdir(target):
+        return
+    for record in iter_files(target, skipped, max_file_size):
+        yield FileRecord(
+            f"{path}!/{record.rel_path}",
+            f"{rel_path}!/{record.rel_path}",
+            record.lang,
+            record.size,
+            record.mtime,
+            archive=path,
+            extracted=record.path,
+        )
+
+
+def read_bytes(record: FileRecord) -> bytes:
+    with open(record.extracted or record.path, "rb") as f:
+        return f.read()
+
+
+def read_text(record: FileRecord) -> str:
+    return read_bytes(record).decode("utf-8", errors="replace")
+
+
+def ingest_directory(directory) -> IngestionManifest:
+    """The caller closes the manifest once its archive members are no longer read."""
+    manifest = IngestionManifest(root=str(directory), scratch=tempfile.mkdtemp(prefix="patchpilot-ingest-"))
+    try:
+        manifest.files.extend(iter_files(directory, manifest.skipped, scratch=manifest.scratch))
+    except BaseException:
+        manifest.close()
+        raise
+    if not os.listdir(manifest.scratch):
+        manifest.close()
+    return manifest
+
+
+@dataclass
+class IngestionDelta:
+    added: list[FileRecord] = field(default_factory=list)
+    changed: list[FileRecord] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)  # rel_paths
+    unchanged: int = 0
+
+    @property
+    def files(self) -> list[FileRecord]:
+        return self.added + self.changed
+
+
+class ManifestStore:
+    """(path, size, mtime, sha256) of every file of the last run, per project."""
+
+    def __init__(self, name: str = "manifests.sqlite"):
+        self.conn = connect(name)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS files (
+                    project TEXT NOT NULL,
+                    rel_path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    PRIMARY KEY (project, rel_path)
+                )"""
+            )
+
+    def previous(self, project: str) -> dict[str, tuple[int, float, str]]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT rel_path, size, mtime, sha256 FROM files WHERE project = ?", (project,)
+            ).fetchall()
+        return {rel_path: (size, mtime, sha) for rel_path, size, mtime, sha in rows}
+
+    def replace(self, project: str, entries: list[tuple[str, int, float, str]]):
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM files WHERE project = ?", (project,))
+            self.conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?)", [(project, *e) for e in entries])
+
+
+class ResultStore:
+    """Outcome of matching / patching a file, per project, file hash and rule set (patched is None when no rule applied)."""
+
+    def __init__(self, name: str = "results.sqlite"):
+        self.conn = connect(name)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS results (
+                    project TEXT NOT NULL,
+                    rel_path TEXT NOT NULL,
+                    rules TEXT NOT NULL,
+                    sha256 TEXT NOT NULL,
+                    patched TEXT,
+                    PRIMARY KEY (project, rel_path, rules)
+                )"""
+            )
+
+    def lookup(self, project: str, rules: str, hashes: dict[str, str]) -> dict[str, str | None]:
+        """rel_path -> patched code, only for files whose stored hash is still hashes[rel_path]."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT rel_path, sha256, patched FROM results WHERE project = ? AND rules = ?", (project, rules)
+            ).fetchall()
+        return {rel_path: patched for rel_path, sha, patched in rows if hashes.get(rel_path) == sha}
+
+    def record(self, project: str, rules: str, entries: list[tuple[str, str, str | None]]):
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)", [(project, e[0], rules, *e[1:]) for e in entries]
+            )
+
+    def forget(self, project: str, rel_paths: list[str]):
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("DELETE FROM results WHERE project = ? AND rel_path = ?", [(project, p) for p in rel_paths])
+
+
+def _run_relative(record: FileRecord) -> str:
+    # uploads and clones land in a fresh <run_id>_ directory, compare paths below it
+    first, _, rest = record.rel_path.partition("!/")
+    return rest or first
+
+
+def hash_records(records: list[FileRecord], previous: dict, max_workers: int = 8):
+    """Fills record.sha256, files with the same size and mtime as last time keep their old hash."""
+    def digest(record):
+        return hashlib.sha256(read_bytes(record)).hexdigest()
+    todo = []
+    for record in records:
+        known = previous.get(_run_relative(record))
+        # an archive is a new upload each run, its members are hashed instead of trusting their headers
+        if record.archive is None and known and known[0] == record.size and known[1] == record.mtime:
+            record.sha256 = known[2]
+        else:
+            todo.append(record)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for record, sha in zip(todo, pool.map(digest, todo)):
+            record.sha256 = sha
+
+
+def ingest_incremental(directory, project: str, store: ManifestStore | None = None) -> tuple[IngestionManifest, IngestionDelta]:
+    store = store or ManifestStore()
+    manifest = ingest_directory(directory)
+    previous = store.previous(project)
+    try:
+        hash_records(manifest.files, previous)
+    except BaseException:
+        manifest.close()
+        raise
+    delta = IngestionDelta()
+    seen = set()
+    for record in manifest.files:
+        key = _run_relative(record)
+        seen.add(key)
+        if key not in previous:
+            delta.added.append(record)
+        elif previous[key][2] != record.sha256:
+            delta.changed.append(record)
+        else:
+            delta.unchanged += 1
+    delta.removed = sorted(set(previous) - seen)
+    store.replace(project, [(_run_relative(r), r.size, r.mtime, r.sha256) for r in manifest.files])
+    return manifest, delta
@@ -0,0 +1,246 @@
+"""
+Docstring for backend.Reflection
+Closed loop over patched files: verify -> read the failure -> fix -> verify again.
+
+- error_signature() reduces a failure to exception type + symbol, e.g.
+  "AttributeError: type object 'User' has no attribute 'parse_obj'" -> "AttributeError:parse_obj",
+  so the same breakage in another file or another run has the same key
+- FixCache (fixes.sqlite) keeps signature -> fix with success / failure counts, a fix is either
+  - rewrite: the renames the accepted fix made (`.parse_obj(` -> `.model_validate(`), replayed by Codemod, no llm call
+  - steps: the migration steps that fixed it, only code_generation runs again (one llm call instead of two)
+- a failing file gets a known fix first, the llm (migration_prompt with the error, then code_generation) otherwise,
+  whatever passed verification is learned for the signature
+- a file whose llm fix fails with the signature it was meant to fix is given up on, asking again would not converge
+- the loop stops once every file passes, after max_iterations, or when the token budget of this run is spent
+
+report = reflect(patched, rules_by_path, LocalBackend(project_dir), "python-syntax")
+report["files"]    # the final code per file
+report["failing"]  # rel_path -> signature (or None) of what still fails
+"""
+import difflib
+import io
+import json
+import re
+import threading
+import time
+import tokenize
+
+from .Codemod import Rewrite, apply_rewrites
+from .LLMClient import metered
+from .Migration_Planner import migration_prompt
+from .PatchGenerator import code_generation
+from .RuleIndex import select_rules
+from .Storage import connect
+from .Verifier import file_jobs, verify
+
+MAX_ITERATIONS = 3
+TOKEN_BUDGET = 32000
+MAX_ERROR_CHARS = 2000
+
+EXCEPTION = re.compile(
+    r"^(?:[\w.]+\.)?(?P<type>[A-Z]\w*(?:Error|Exception|Warning))\b(?::\s*(?P<message>.*))?$", re.M
+)
+SYMBOLS = [
+    re.compile(r"has no attribute '(?P<symbol>\w+)'"),
+    re.compile(r"cannot import name '(?P<symbol>\w+)'"),
+    re.compile(r"No module named '(?P<symbol>[\w.]+)'"),
+    re.compile(r"name '(?P<symbol>\w+)' is not defined"),
+    re.compile(r"unexpected keyword argument '(?P<symbol>\w+)'"),
+    re.compile(r"required (?:positional |keyword-only )?arguments?: '(?P<symbol>\w+)'"),
+    re.compile(r"(?:[\w$]+\.)*(?P<symbol>[\w$]+)(?:\(\.\.\.\))? is not a function"),  # node
+    re.compile(r"'(?P<symbol>[A-Za-z_][\w.]*)'"),
+]
+SKIP_TOKENS = {tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT, tokenize.ENDMARKER}
+
+
+def error_signature(output: str) -> str | None:
+    """type:symbol of the last exception in the output, None when there is no symbol to key a fix on."""
+    found = list(EXCEPTION.finditer(output or ""))
+    if not found:
+        return None
+    error = found[-1]
+    message = error.group("message") or ""
+    for pattern in SYMBOLS:
+        match = pattern.search(message)
+        if match:
+            return f"{error.group('type')}:{match.group('symbol')}"
+    return None
+
+
+def _tokens(code: str) -> list[tokenize.TokenInfo] | None:
+    try:
+        return [t for t in tokenize.generate_tokens(io.StringIO(code).readline) if t.type not in SKIP_TOKENS]
+    except (tokenize.TokenError, SyntaxError, IndentationError):
+        return None
+
+
+def learn_rewrites(before: str, after: str) -> list[dict] | None:
+    """The attribute / method renames that turn before into after (comments ignored), None if it is more than that."""
+    old, new = _tokens(before), _tokens(after)
+    if old is None or new is None:
+        return None
+    matcher = difflib.SequenceMatcher(None, [t.string for t in old], [t.string for t in new], autojunk=False)
+    renames = {}
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        if tag != "replace" or i2 - i1 != 1 or j2 - j1 != 1:
+            return None
+        a, b = old[i1], new[j1]
+        if a.type != tokenize.NAME or b.type != tokenize.NAME or i1 == 0 or old[i1 - 1].string != ".":
+            return None
+        call = i2 < len(old) and old[i2].string == "("
+        if renames.setdefault(a.string, (b.string, call)) != (b.string, call):
+            return None
+    if not renames:
+        return None
+    return [{"old": o, "new": n, "call": c} for o, (n, c) in sorted(renames.items())]
+
+
+class FixCache:
+    def __init__(self, name: str = "fixes.sqlite"):
+        self.conn = connect(name)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS fixes (
+                    signature TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    fix TEXT NOT NULL,
+                    successes INTEGER NOT NULL DEFAULT 0,
+                    failures INTEGER NOT NULL DEFAULT 0,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (signature, kind, fix)
+                )"""
+            )
+
+    def lookup(self, signature: str) -> list[tuple[str, str]]:
+        """(kind, fix) that worked more often than not, rewrites first, then by track record."""
+        with self.lock:
+            rows = self.conn.execute(
+                """SELECT kind, fix FROM fixes WHERE signature = ? AND successes > failures
+                   ORDER BY kind = 'rewrite' DESC, successes - failures DESC, updated_at DESC""",
+                (signature,),
+            ).fetchall()
+        return [(kind, fix) for kind, fix in rows]
+
+    def record(self, signature: str, kind: str, fix: str, passed: bool):
+        with self.lock:
+            self.conn.execute(
+                """INSERT INTO fixes VALUES (?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (signature, kind, fix) DO UPDATE SET
+                   successes = successes + excluded.successes, failures = failures + excluded.failures,
+                   updated_at = excluded.updated_at""",
+                (signature, kind, fix, int(passed), int(not passed), time.time()),
+            )
+
+
+def _rewrites(signature: str, fix: str) -> list[Rewrite]:
+    rewrites = []
+    for rename in json.loads(fix):
+        text = f"Known fix for {signature}: `.{rename['old']}` -> `.{rename['new']}`"
+        rule = {"rule_id": f"fix:{signature}", "rule_text": text, "sources": []}
+        rewrites.append(Rewrite(rule, rename["old"], rename["new"], rename["call"]))
+    return rewrites
+
+
+def _error_text(result) -> str:
+    # tracebacks end with the exception, keep the tail
+    return "\n".join(part for part in (result.stderr, result.stdout) if part.strip())[-MAX_ERROR_CHARS:]
+
+
+def reflect(files: dict[str, str], rules: dict, backend, profile: str, max_iterations: int = MAX_ITERATIONS,
+            token_budget: int = TOKEN_BUDGET, cache: FixCache | None = None, on_event=None, check=None,
+            rule_set=None) -> dict:
+    """
+    files: rel_path -> patched code, rules: rel_path -> the rules that file was patched with
+    rule_set: the full rules of the migration, the per-file rules are then ranked over its RuleIndex
+    on_event(type, **data) reports "verified" / "fixed" per file, check() is called between iterations (cancellation)
+    """
+    cache = cache or FixCache()
+    emit = on_event or (lambda *args, **kwargs: None)
+    current = dict(files)
+    results = {}
+    applied = {}  # rel_path -> (signature, kind, fix, before, source) of the fix under verification
+    tried = {path: set() for path in files}
+    stuck = {path: set() for path in files}  # signatures an llm fix of the file did not get rid of
+    pending = list(files)
+    iterations = 0
+    with metered() as usage:
+        def spent():
+            return usage["prompt_tokens"] + usage["completion_tokens"]
+
+        def fix(path, result):
+            code = current[path]
+            signature = error_signature(_error_text(result))
+            known = cache.lookup(signature) if signature else []
+            for kind, stored in known:
+                if (kind, stored) in tried[path]:
+                    continue
+                tried[path].add((kind, stored))
+                if kind == "rewrite":
+                    new_code, _ = apply_rewrites(code, _rewrites(signature, stored))
+                elif spent() < token_budget:
+                    new_code = code_generation(migration_steps=stored, code=code)
+                else:
+                    continue
+                if new_code and new_code != code:
+                    applied[path] = (signature, kind, stored, code, "cache")
+                    emit("fixed", file=path, signature=signature, source="cache")
+                    return new_code
+            if spent() >= token_budget or (signature and signature in stuck[path]):
+                return None
+            error = _error_text(result)
+            if rule_set is None:
+                steps = migration_prompt(rules.get(path, []), code, error=error)
+            else:
+                applicable = select_rules(rule_set, f"{code}\n{error}", within=rules.get(path, []))
+                steps = migration_prompt(applicable, code, error=error, select=False)
+            if ("steps", steps) in tried[path]:
+                return None
+            tried[path].add(("steps", steps))
+            new_code = code_generation(migration_steps=steps, code=code)
+            if new_code == code:
+                return None
+            applied[path] = (signature, "steps", steps, code, "llm")
+            emit("fixed", file=path, signature=signature, source="llm")
+            return new_code
+
+        while pending:
+            iterations += 1
+            if check:
+                check()
+            for result in verify(file_jobs({path: current[path] for path in pending}, profile), backend):
+                path = result.label
+                results[path] = result
+                emit("verified", file=path, passed=result.passed, exit_code=result.exit_code, iteration=iterations)
+                if path in applied:
+                    signature, kind, stored, before, source = applied.pop(path)
+                    if not signature:
+                        continue
+                    cache.record(signature, kind, stored, result.passed)
+                    if source == "llm" and error_signature(_error_text(result)) == signature:
+                        stuck[path].add(signature)
+                    if kind == "steps" and result.passed:
+                        # a fix that is only renames is replayed without the llm next time
+                        renames = learn_rewrites(before, current[path])
+                        if renames:
+                            cache.record(signature, "rewrite", json.dumps(renames, sort_keys=True), True)
+            failing = [path for path in pending if not results[path].passed]
+            if not failing or iterations >= max_iterations:
+                break
+            pending = []
+            for path in failing:
+                new_code = fix(path, results[path])
+                if new_code is not None:
+                    current[path] = new_code
+                    pending.append(path)
+    failing = {path: error_signature(_error_text(r)) for path, r in results.items() if not r.passed}
+    return {
+        "files": current,
+        "passed": sorted(path for path, r in results.items() if r.passed),
+        "failing": failing,
+        "iterations": iterations,
+        "tokens": usage["prompt_tokens"] + usage["completion_tokens"],
+        "llm_calls": usage["calls"] - usage["cached"],
+    }
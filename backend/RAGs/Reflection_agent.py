@@ -1,21 +1,22 @@
 import json
+import uuid
 from pathlib import Path
 
 
 ALLOWED_RUN_ARGS = {"entry", "module", "jar", "binary"}
+BASE_DIR = Path(__file__).resolve()
+while BASE_DIR.name != "backend":
+    BASE_DIR = BASE_DIR.parent
+VIRTUAL_TESTING = BASE_DIR / "virtual_testing"
 
 
-def reflection_agent(
-    code_language: str,
-    code_version: str,
-    install_preset: str,
-    run_profile: str,
-    run_args: dict | None = None,
-):
-    base_dir = Path(__file__).resolve().parent
-    template_path = base_dir / "virtual_testing" / "Docker.template.md"
-    config_path = base_dir / "virtual_testing" / "presets.json"
-    config = json.loads(config_path.read_text())
+def load_presets() -> dict:
+    return json.loads((VIRTUAL_TESTING / "presets.json").read_text())
+
+
+def resolve_install(code_language: str, code_version: str, install_preset: str) -> tuple[str, list[str]]:
+    """(base image, install steps) from presets.json"""
+    config = load_presets()
     try:
         base_image = config["base_images"][code_language][code_version]
     except KeyError:
@@ -24,7 +25,11 @@ def reflection_agent(
         install_steps = config["install_presets"][install_preset]["steps"]
     except KeyError:
         raise ValueError(f"Unknown install preset: {install_preset}")
-    install_block = "\n".join(install_steps)
+    return base_image, install_steps
+
+
+def resolve_command(run_profile: str, run_args: dict | None = None) -> list[str]:
+    config = load_presets()
     try:
         run_cmd_template = config["run_profiles"][run_profile]["cmd"]
     except KeyError:
@@ -37,7 +42,21 @@ def reflection_agent(
         run_cmd = [part.format(**run_args) for part in run_cmd_template]
     except KeyError as e:
         raise ValueError(f"Missing required run arg: {e.args[0]}")
-    template = template_path.read_text()
+    return run_cmd
+
+
+def reflection_agent(
+    code_language: str,
+    code_version: str,
+    install_preset: str,
+    run_profile: str,
+    run_args: dict | None = None,
+    run_id: str | None = None,
+):
+    base_image, install_steps = resolve_install(code_language, code_version, install_preset)
+    run_cmd = resolve_command(run_profile, run_args)
+    install_block = "\n".join(install_steps)
+    template = (VIRTUAL_TESTING / "Docker.template.md").read_text()
     dockerfile = (
         template
         .replace("{{ BASE_IMAGE }}", base_image)
@@ -45,7 +64,9 @@ def reflection_agent(
         .replace("{{ RUN_COMMAND }}", json.dumps(run_cmd))
     )
 
-    output_path = base_dir / "virtual_testing" / "Dockerfile"
+    # one Dockerfile per run, concurrent runs never overwrite each other
+    output_path = VIRTUAL_TESTING / "runs" / (run_id or str(uuid.uuid4())) / "Dockerfile"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
     output_path.write_text(dockerfile)
 
     return dockerfile
@@ -0,0 +1,89 @@
+"""
+Docstring for backend.ResponseCache
+sqlite cache of llm completions keyed by hash(model, messages, sampling params).
+Only low temperature requests are cached, those are the deterministic stages
+(code_generation 0.0, migration_prompt / get_supervision 0.1 ...).
+Answers are written as soon as they arrive, so a re-run after a crash skips every prompt already answered.
+
+Stages listed in LLM_CACHE_BYPASS (comma separated) always go to the model.
+The total size is tracked per instance, the table is only summed again when that total goes over max_bytes.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .Storage import connect
+
+MAX_TEMPERATURE = 0.2
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def cache_key(model: str, messages: list[dict], **params) -> str:
+    payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES, name: str = "responses.sqlite"):
+        self.max_bytes = max_bytes
+        self.bypass = {s.strip() for s in os.getenv("LLM_CACHE_BYPASS", "").split(",") if s.strip()}
+        self.conn = connect(name)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    stage TEXT,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (accessed_at)")
+            self.total = self._size()
+
+    def enabled(self, stage: str | None, temperature: float) -> bool:
+        return temperature <= MAX_TEMPERATURE and stage not in self.bypass
+
+    def get(self, key: str) -> str | None:
+        with self.lock:
+            row = self.conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, stage: str | None, response: str):
+        size = len(response.encode())
+        with self.lock:
+            old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, stage, response, size, time.time())
+            )
+            self.total += size - (old[0] if old else 0)
+            if self.total > self.max_bytes:
+                self._evict()
+
+    def _size(self) -> int:
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _evict(self):
+        # other processes may have written to the same file, start from the real total
+        self.total = self._size()
+        while self.total > self.max_bytes:
+            # drop the least recently used quarter at once instead of row by row
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed_at LIMIT "
+                "(SELECT COUNT(*) / 4 + 1 FROM responses))"
+            )
+            self.total = self._size()
+
+    def invalidate(self, stage: str | None = None):
+        with self.lock:
+            if stage is None:
+                self.conn.execute("DELETE FROM responses")
+            else:
+                self.conn.execute("DELETE FROM responses WHERE stage = ?", (stage,))
+            self.total = self._size()
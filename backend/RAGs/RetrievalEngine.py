@@ -0,0 +1,109 @@
+"""
+Docstring for backend.RetrievalEngine
+Async network layer used by KnowledgeRetrieval.
+One aiohttp session (keep-alive pool) is shared by every search and page fetch of a run,
+fetches are bounded per hostname and every request has its own timeout.
+
+Search and page urls are constructor arguments so the engine can be pointed at a local stub server.
+SearchConfigError means the search endpoint rejects every request (api key, url), callers let it propagate.
+
+async with RetrievalEngine() as engine:
+    results = await engine.search("pydantic 2.x breaking changes")
+    page = await engine.fetch(results[0]["url"])
+    text = await asyncio.to_thread(extract_text, page.body)
+"""
+import asyncio
+from typing import NamedTuple
+from urllib.parse import urlparse
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from .api_import import TAVILY, TAVILY_URL
+
+USER_AGENT = "PatchPilot/0.1 (+https://github.com/azycr4yy/PATCHPILOT)"
+AUTH_STATUSES = {401, 403}
+
+
+class SearchConfigError(RuntimeError):
+    pass
+
+
+class Page(NamedTuple):
+    status: int
+    body: bytes
+    etag: str | None
+    last_modified: str | None
+
+
+class RetrievalEngine:
+    def __init__(
+        self,
+        max_connections: int = 32,
+        per_host: int = 4,
+        timeout: float = 20.0,
+        search_url: str = TAVILY_URL,
+        api_key: str | None = TAVILY,
+    ):
+        self.max_connections = max_connections
+        self.per_host = per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.search_url = search_url
+        self.api_key = api_key
+        self.session: aiohttp.ClientSession | None = None
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.per_host,
+            keepalive_timeout=30,
+            ttl_dns_cache=300,
+        )
+        self.session = aiohttp.ClientSession(connector=connector, headers={"User-Agent": USER_AGENT})
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        self.session = None
+
+    def _slot(self, url: str) -> asyncio.Semaphore:
+        # waiting for a slot does not count against the request timeout
+        host = urlparse(url).hostname or ""
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.per_host)
+        return self._host_slots[host]
+
+    async def search(self, query: str, max_results: int = 5) -> list[dict]:
+        payload = {"api_key": self.api_key, "query": query, "max_results": max_results}
+        headers = {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        async with self._slot(self.search_url):
+            try:
+                request = self.session.post(self.search_url, json=payload, headers=headers, timeout=self.timeout)
+                async with request as response:
+                    if response.status in AUTH_STATUSES:
+                        raise SearchConfigError(f"{self.search_url} rejected the api key ({response.status})")
+                    response.raise_for_status()
+                    data = await response.json()
+            except aiohttp.InvalidURL as e:
+                raise SearchConfigError(f"invalid search url {self.search_url}") from e
+        return data.get("results", [])
+
+    async def fetch(self, url: str, headers: dict | None = None) -> Page:
+        # headers carries the cache validators, a 304 comes back with an empty body
+        async with self._slot(url):
+            async with self.session.get(url, headers=headers, timeout=self.timeout) as response:
+                if response.status != 304:
+                    response.raise_for_status()
+                body = await response.read()
+                return Page(
+                    response.status,
+                    body,
+                    response.headers.get("ETag"),
+                    response.headers.get("Last-Modified"),
+                )
+
+
+def extract_text(body: bytes) -> str:
+    # same extraction WebBaseLoader does, run it off the event loop
+    return BeautifulSoup(body, "html.parser").get_text()
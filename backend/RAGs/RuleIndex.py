@@ -0,0 +1,136 @@
+"""
+Docstring for backend.RuleIndex
+BM25 index over compiled final_rules, used to send only the rules that apply to a piece of code
+to migration_prompt / code_generation.
+
+Tokens are identifier aware: `BaseModel.parse_obj()` indexes as basemodel, base, model, parse_obj, parse, obj.
+Indexes are persisted under cache/rule_index, keyed by a fingerprint of the rule set.
+Build them over the full final_rules of a migration only, a file's subset of rules is passed as `within`
+and filters the ranking instead of getting an index of its own.
+
+index = RuleIndex.load_or_build(final_rules)
+rules = index.top_k(code, k=8)
+rules = select_rules(final_rules, code, k=8, within=rules_of_this_file)
+"""
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from .Storage import CACHE_DIR
+
+INDEX_DIR = CACHE_DIR / "rule_index"
+MAX_INDEXES = 16  # rule sets kept in memory by select_rules
+K1 = 1.5
+B = 0.75
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "be", "by", "for", "from", "if", "in", "instead", "is", "it", "must",
+    "of", "on", "or", "should", "the", "to", "use", "used", "v1", "v2", "with", "x",
+}
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = []
+    for word in re.findall(r"[A-Za-z_][A-Za-z0-9_]*", text):
+        parts = [p for p in re.split(r"_|(?<=[a-z0-9])(?=[A-Z])", word) if p]
+        for token in {word, *parts} if len(parts) > 1 else {word}:
+            token = token.lower()
+            if len(token) > 1 and token not in STOPWORDS:
+                tokens.append(token)
+    return tokens
+
+
+def parse_rules(rules) -> list[dict]:
+    """Accepts rule_compiler() json, a {"final_rules": [...]} dict or the list itself."""
+    if isinstance(rules, str):
+        rules = json.loads(rules)
+    if isinstance(rules, dict):
+        rules = rules.get("final_rules", [])
+    return list(rules)
+
+
+def _key(rule: dict) -> str:
+    return json.dumps(rule, sort_keys=True)
+
+
+def fingerprint(rules: list[dict]) -> str:
+    return hashlib.sha256(json.dumps(rules, sort_keys=True).encode()).hexdigest()[:32]
+
+
+class RuleIndex:
+    def __init__(self, rules: list[dict], doc_freqs: list[dict], idf: dict, avg_len: float):
+        self.rules = rules
+        self.doc_freqs = doc_freqs
+        self.idf = idf
+        self.avg_len = avg_len
+
+    @classmethod
+    def build(cls, rules) -> "RuleIndex":
+        rules = parse_rules(rules)
+        doc_freqs = [Counter(tokenize(f"{r.get('rule_id', '')} {r.get('rule_text', '')}")) for r in rules]
+        df = Counter(token for freqs in doc_freqs for token in freqs)
+        n = len(rules)
+        idf = {t: math.log(1 + (n - f + 0.5) / (f + 0.5)) for t, f in df.items()}
+        avg_len = sum(sum(f.values()) for f in doc_freqs) / n if n else 0.0
+        return cls(rules, [dict(f) for f in doc_freqs], idf, avg_len)
+
+    @classmethod
+    def load_or_build(cls, rules) -> "RuleIndex":
+        rules = parse_rules(rules)
+        path = INDEX_DIR / f"{fingerprint(rules)}.json"
+        if path.exists():
+            data = json.loads(path.read_text())
+            return cls(rules, data["doc_freqs"], data["idf"], data["avg_len"])
+        index = cls.build(rules)
+        INDEX_DIR.mkdir(parents=True, exist_ok=True)
+        # workers may build the same rule set at once, readers never see a half written file
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps({"doc_freqs": index.doc_freqs, "idf": index.idf, "avg_len": index.avg_len}))
+        os.replace(tmp, path)
+        return index
+
+    def scores(self, text: str) -> list[float]:
+        # a code file repeats the same names a lot, only presence of a query term counts
+        terms = set(tokenize(text)) & self.idf.keys()
+        result = []
+        for freqs in self.doc_freqs:
+            length = sum(freqs.values())
+            score = 0.0
+            for term in terms:
+                tf = freqs.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / self.avg_len))
+            result.append(score)
+        return result
+
+    def top_k(self, text: str, k: int = 8, within=None) -> list[dict]:
+        """Best k rules for text, rules sharing no term with it are never returned. within: only rank these rules."""
+        allowed = {_key(r) for r in within} if within is not None else None
+        ranked = sorted(enumerate(self.scores(text)), key=lambda item: -item[1])
+        if allowed is not None:
+            ranked = [(i, score) for i, score in ranked if _key(self.rules[i]) in allowed]
+        return [self.rules[i] for i, score in ranked[:k] if score > 0]
+
+
+_indexes: OrderedDict[str, RuleIndex] = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def select_rules(rules, text: str, k: int = 8, within=None) -> list[dict]:
+    """rules is the full rule set of the migration, within the rules to choose from (default all of them)."""
+    rules = parse_rules(rules)
+    key = fingerprint(rules)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+    if index is None:
+        index = RuleIndex.load_or_build(rules)
+        with _indexes_lock:
+            _indexes[key] = index
+            while len(_indexes) > MAX_INDEXES:
+                _indexes.popitem(last=False)
+    return index.top_k(text, k, within)
@@ -0,0 +1,196 @@
+"""
+Docstring for backend.RuleMatcher
+Decides which ingested files a compiled rule can touch, before any llm call.
+
+1. extract_symbols() pulls the API names out of each rule: backticked code, dotted names,
+   calls like `parse_obj(` / `.json(`, snake_case / CamelCase identifiers, `class Config`
+2. all symbols of all rules go into one Aho-Corasick automaton
+3. every file is scanned once, hits are checked for identifier boundaries
+   and grouped into line ranges per rule
+4. a rule without a usable symbol cannot be ruled out, it applies to every file as a whole
+
+matches = match_files(final_rules, manifest.files)
+# {"pydantic-v2-parse-obj": {"src/models.py": [(12, 12), (40, 41)]}, ...}
+Files that no rule matches never need to reach the llm.
+"""
+import re
+from collections import deque
+
+from .ProjectIngestion import read_text
+from .RuleIndex import parse_rules
+
+# words that look like identifiers in rule prose but would match half of any codebase
+GENERIC = {
+    "config", "class", "model", "models", "data", "value", "values", "field", "fields", "type", "types",
+    "self", "none", "true", "false", "return", "import", "from", "default", "object", "method", "function",
+    "attribute", "attributes", "instead", "must", "should", "replaced", "deprecated", "removed", "renamed",
+}
+IDENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+CODE_LIKE = re.compile(r"\b[A-Za-z_]\w*(?:\.[A-Za-z_]\w*)+(?:\(\))?|\.?\b[A-Za-z_]\w*\(\)")
+
+
+def old_side(text: str) -> str:
+    """The part of a rule naming the API that goes away, the replacement would only match migrated code."""
+    match = re.search(r"\breplace\s+(.*?)\s+(?:with|by)\b", text, re.I | re.S)
+    if match:
+        return match.group(1)
+    match = re.search(r"(.*?)\b(?:replaced|renamed|changed)\s+(?:with|by|to)\b", text, re.I | re.S)
+    if match:
+        return match.group(1)
+    match = re.search(r"\binstead of\b(.*)", text, re.I | re.S)
+    if match:
+        return match.group(1)
+    return text
+
+
+def extract_symbols(rule: dict) -> set[str]:
+    text = old_side(rule.get("rule_text", ""))
+    symbols = set()
+    for code in re.findall(r"`([^`]+)`", text):
+        symbols.update(_code_symbols(code))
+    text = re.sub(r"`[^`]*`", " ", text)
+    # dotted names and calls written without backticks
+    for match in CODE_LIKE.finditer(text):
+        symbols.update(_code_symbols(match.group(0)))
+    for word in IDENT.findall(CODE_LIKE.sub(" ", text)):
+        if _distinctive(word):
+            symbols.add(word)
+    if re.search(r"\binner\s+`?Config`?\s+class|\bclass\s+`?Config", text, re.I):
+        symbols.add("class Config")
+    return {s for s in symbols if s.strip(".(").lower() not in GENERIC and len(s) > 2}
+
+
+def _distinctive(name: str) -> bool:
+    return "_" in name.strip("_") or re.search(r"[a-z][A-Z]", name) is not None
+
+
+def _code_symbols(code: str) -> set[str]:
+    # arguments are call-site specific, only the called name says which api is used
+    code = re.sub(r"\(.*\)", "()", code.strip())
+    if code.startswith("class "):
+        return {" ".join(code.split()[:2]).rstrip(":(")}
+    names = re.findall(r"[A-Za-z_]\w*", code)
+    if not names:
+        return set()
+    # `User.parse_obj()` must also match `cls.parse_obj(`, keep the attribute, not the receiver
+    name = names[-1]
+    symbols = {name} if _distinctive(name) else set()
+    if code.endswith(")"):
+        symbols.add(f".{name}(" if "." in code else f"{name}(")
+    return symbols
+
+
+class AhoCorasick:
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for pattern in patterns:
+            node = 0
+            for ch in pattern:
+                if ch not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[node][ch] = len(self.goto) - 1
+                node = self.goto[node][ch]
+            self.out[node].append(pattern)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and ch not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(ch, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def iter(self, text: str):
+        """(end index exclusive, pattern) for every occurrence."""
+        node = 0
+        goto, fail, out = self.goto, self.fail, self.out
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for pattern in out[node]:
+                yield i + 1, pattern
+
+
+def _bounded(text: str, start: int, end: int, pattern: str) -> bool:
+    def word(c):
+        return c.isalnum() or c == "_"
+    if word(pattern[0]) and start > 0 and word(text[start - 1]):
+        return False
+    if word(pattern[-1]) and end < len(text) and word(text[end]):
+        return False
+    return True
+
+
+def _ranges(lines: list[int], gap: int = 1) -> list[tuple[int, int]]:
+    ranges = []
+    for line in sorted(set(lines)):
+        if ranges and line - ranges[-1][1] <= gap:
+            ranges[-1] = (ranges[-1][0], line)
+        else:
+            ranges.append((line, line))
+    return ranges
+
+
+def match_files(rules, records) -> dict[str, dict[str, list[tuple[int, int]]]]:
+    """rule_id -> rel_path -> 1-based (first_line, last_line) ranges, for ProjectIngestion FileRecords."""
+    rules = parse_rules(rules)
+    by_symbol = {}
+    always = []
+    for rule in rules:
+        symbols = extract_symbols(rule)
+        if not symbols:
+            always.append(rule.get("rule_id"))
+        for symbol in symbols:
+            by_symbol.setdefault(symbol, set()).add(rule.get("rule_id"))
+    result = {rule.get("rule_id"): {} for rule in rules}
+    if not by_symbol and not always:
+        return result
+    automaton = AhoCorasick(by_symbol)
+    for record in records:
+        text = read_text(record)
+        line_starts = [0] + [m.end() for m in re.finditer("\n", text)]
+        hits = {}
+        for end, pattern in automaton.iter(text):
+            start = end - len(pattern)
+            if not _bounded(text, start, end, pattern):
+                continue
+            line = _line_of(line_starts, start)
+            for rule_id in by_symbol[pattern]:
+                hits.setdefault(rule_id, []).append(line)
+        for rule_id, lines in hits.items():
+            result[rule_id][record.rel_path] = _ranges(lines)
+        for rule_id in always:
+            result[rule_id][record.rel_path] = [(1, max(len(line_starts) - text.endswith("\n"), 1))]
+    return result
+
+
+def _line_of(line_starts: list[int], offset: int) -> int:
+    lo, hi = 0, len(line_starts)
+    while lo + 1 < hi:
+        mid = (lo + hi) // 2
+        if line_starts[mid] <= offset:
+            lo = mid
+        else:
+            hi = mid
+    return lo + 1
+
+
+def files_to_patch(matches) -> set[str]:
+    return {path for files in matches.values() for path in files}
+
+
+def rules_by_file(rules, matches) -> dict[str, list[dict]]:
+    """rel_path -> the rules that matched it, the only files worth sending to migration_prompt / code_generation."""
+    by_id = {rule.get("rule_id"): rule for rule in parse_rules(rules)}
+    files = {}
+    for rule_id, paths in matches.items():
+        for path in paths:
+            files.setdefault(path, []).append(by_id[rule_id])
+    return files
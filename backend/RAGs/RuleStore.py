@@ -0,0 +1,140 @@
+"""
+Docstring for backend.RuleStore
+Compiled rule sets keyed by (library, from_version, to_version), so a known migration
+skips retrieval, synthesis and compilation and goes straight to planning.
+
+Each entry keeps
+- final_rules / discarded_rules exactly as rule_compiler() returns them
+- provenance: which pages (and merged duplicate copies) the rules were built from
+- fingerprints: sha256 of the normalized chunks per url
+- synthesized: the get_guidance() outputs per url, reused on refresh for pages that did not change
+- built_at
+
+rules = get_rules("pydantic", "1.x", "2.x")                 # store hit: no network, no llm
+rules = get_rules("pydantic", "1.x", "2.x", refresh=True)   # re-synthesizes only pages whose content changed
+RuleStore().invalidate("pydantic", "1.x", "2.x")             # one migration
+RuleStore().invalidate_from("pydantic", "1.x")               # every migration away from 1.x
+"""
+import hashlib
+import json
+import threading
+import time
+
+from .KnowledgeRetrieval import generate_queries, make_topic, search
+from .RuleSynthesis import deduplicate_documents, rule_compiler, rules_synthesis
+from .Storage import connect
+
+
+def _key(library: str, from_version: str, to_version: str) -> tuple[str, str, str]:
+    def version(v):
+        return str(v).strip().lower().lstrip("v")
+    return library.strip().lower(), version(from_version), version(to_version)
+
+
+class RuleStore:
+    def __init__(self, name: str = "rules.sqlite"):
+        self.conn = connect(name)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS rule_sets (
+                    library TEXT NOT NULL,
+                    from_version TEXT NOT NULL,
+                    to_version TEXT NOT NULL,
+                    compiled TEXT NOT NULL,
+                    provenance TEXT NOT NULL,
+                    fingerprints TEXT NOT NULL,
+                    synthesized TEXT NOT NULL,
+                    built_at REAL NOT NULL,
+                    PRIMARY KEY (library, from_version, to_version)
+                )"""
+            )
+
+    def lookup(self, library: str, from_version: str, to_version: str) -> dict | None:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT compiled, provenance, fingerprints, synthesized, built_at FROM rule_sets "
+                "WHERE library = ? AND from_version = ? AND to_version = ?",
+                _key(library, from_version, to_version),
+            ).fetchone()
+        if row is None:
+            return None
+        compiled, provenance, fingerprints, synthesized, built_at = row
+        return {
+            **json.loads(compiled),
+            "provenance": json.loads(provenance),
+            "fingerprints": json.loads(fingerprints),
+            "synthesized": json.loads(synthesized),
+            "built_at": built_at,
+        }
+
+    def save(self, library, from_version, to_version, compiled: dict, provenance, fingerprints, synthesized):
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO rule_sets VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    *_key(library, from_version, to_version),
+                    json.dumps(compiled),
+                    json.dumps(provenance),
+                    json.dumps(fingerprints),
+                    json.dumps(synthesized),
+                    time.time(),
+                ),
+            )
+
+    def invalidate(self, library: str, from_version: str, to_version: str):
+        """Drops the rule set of one migration."""
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM rule_sets WHERE library = ? AND from_version = ? AND to_version = ?",
+                _key(library, from_version, to_version),
+            )
+
+    def invalidate_from(self, library: str, from_version: str):
+        """Drops every rule set migrating away from from_version, whatever the target."""
+        library, from_version, _ = _key(library, from_version, "")
+        with self.lock:
+            self.conn.execute("DELETE FROM rule_sets WHERE library = ? AND from_version = ?", (library, from_version))
+
+
+def fingerprint_documents(docs) -> dict[str, str]:
+    digests = {}
+    for doc in sorted(docs, key=lambda d: (d.get("url") or "", d.get("chunk_index", 0))):
+        digest = digests.setdefault(doc.get("url"), hashlib.sha256())
+        digest.update((doc.get("chunk") or "").encode())
+    return {url: digest.hexdigest() for url, digest in digests.items()}
+
+
+def get_rules(library, from_version, to_version, refresh=False, store=None, on_document=None, check=None, on_stats=None) -> dict:
+    """
+    {"final_rules": [...], "discarded_rules": [...]} for the migration, built only when the store has no answer.
+    on_document and on_stats are passed to search() for retrieval progress and page cache stats.
+    check (e.g. Run.check) is called between documents, synthesis requests and clusters so a cancelled run stops early.
+    """
+    store = store or RuleStore()
+    entry = store.lookup(library, from_version, to_version)
+    if entry and not refresh:
+        return {"final_rules": entry["final_rules"], "discarded_rules": entry["discarded_rules"]}
+
+    queries = generate_queries(make_topic(library, from_version, to_version))
+    docs = deduplicate_documents(search(queries, on_document=on_document, check=check, on_stats=on_stats))
+    fingerprints = fingerprint_documents(docs)
+    previous = entry or {"fingerprints": {}, "synthesized": {}}
+    unchanged = {u for u, f in fingerprints.items() if previous["fingerprints"].get(u) == f and u in previous["synthesized"]}
+
+    changed_docs = [d for d in docs if d.get("url") not in unchanged]
+    synthesized = {u: previous["synthesized"][u] for u in unchanged}
+    for doc, output in zip(changed_docs, rules_synthesis(changed_docs, check=check)):
+        synthesized.setdefault(doc.get("url"), []).append(output)
+
+    compiled = json.loads(rule_compiler([o for outputs in synthesized.values() for o in outputs], check=check))
+    provenance = {}
+    for d in docs:
+        source = provenance.setdefault(d.get("url"), {
+            "url": d.get("url"), "title": d.get("title"), "query": d.get("query"), "priority": d.get("priority"),
+            "merged_sources": [],
+        })
+        source["merged_sources"].extend(d.get("merged_sources", []))
+    provenance = list(provenance.values())
+    store.save(library, from_version, to_version, compiled, provenance, fingerprints, synthesized)
+    return compiled
@@ -13,9 +13,16 @@ this is the output we will get from KnowledgeRetrieval.py and we have to use thi
 we will basically feed the llm chunks -> it will make rules out of the chunks -> after all chunks are done we feed the rules made back into the llm so no rules overlap each other
 
 chunks -> llm -> rules -> llm
+
+with the local stages:
+chunks -> deduplicate_documents -> rules_synthesis (llm) -> rule_compiler (local clusters -> llm per cluster)
 """
-from api_import import HUGGING_FACE
-from huggingface_hub import InferenceClient
+import hashlib
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from .LLMClient import chat, count_tokens, metering
+from .Similarity import near_duplicate_groups, normalize
 model_guide = 'Qwen/Qwen2.5-7B-Instruct'
 model_supervise = "Qwen/Qwen2.5-32B-Instruct" 
 def get_guidance(doc):
@@ -29,7 +36,7 @@ def get_guidance(doc):
   - query: {doc.get("query", "")}
   - title: {doc.get("title", "")}
   - url: {doc.get("url", "")}
-  - content_chunk: {doc.get("chunk", "")}
+  - content_chunk: {chunk_text(doc)}
   - retrieval_score: {doc.get("score", "")}
   - retrieval_priority_hint: {doc.get("priority", "")}
 
@@ -62,17 +69,70 @@ def get_guidance(doc):
         ]
     }}
   """
-  client = InferenceClient(model=model_guide,token=HUGGING_FACE)
-  response = client.chat.completions.create(
-      messages=[
+  queries = chat(
+      model_guide,
+      [
           {"role": "system", "content": GUIDE_SYNTHESIS},
           {"role": "user", "content": f"Genrate answer according to the guide "}
       ],
       max_tokens=1024,
-      temperature=0.4
+      temperature=0.4,
+      stage="get_guidance"
+  )
+  return queries
+PACKED_GUIDE = """
+  You are a rule synthesis engine.
+
+  Your task is to read SEVERAL independent content chunks extracted from technical documentation
+  and convert each of them into one or more precise, implementation-ready rules.
+  Every chunk is preceded by a header line: ### chunk <index> | url: <url> | title: <title> | priority_hint: <priority>
+
+  INSTRUCTIONS:
+  1. Extract ONLY rules directly supported by the chunk they come from.
+  2. Never combine information from different chunks into one rule.
+  3. If a chunk has no actionable rule, emit nothing for it.
+  4. Each rule must be atomic and unambiguous.
+  5. Do NOT invent or generalize rules.
+  6. Write rules suitable for later overlap comparison.
+
+  PRIORITY LEVELS:
+  - CRITICAL
+  - HIGH
+  - MEDIUM
+  - LOW
+
+  OUTPUT FORMAT (STRICT JSON ONLY):
+
+  {
+        "rules": [
+            {
+                "chunk": <index of the chunk the rule comes from>,
+                "rule_id": "short-id",
+                "rule_text": "Clear enforceable rule",
+                "priority": "CRITICAL | HIGH | MEDIUM | LOW",
+                "source": {
+                    "title": "...",
+                    "url": "..."
+                }
+            }
+        ]
+    }
+  """
+def get_guidance_packed(docs):
+  chunks = "\n\n".join(
+      f"### chunk {i} | url: {doc.get('url', '')} | title: {doc.get('title', '')} | priority_hint: {doc.get('priority', '')}\n{chunk_text(doc)}"
+      for i, doc in enumerate(docs)
+  )
+  queries = chat(
+      model_guide,
+      [
+          {"role": "system", "content": PACKED_GUIDE},
+          {"role": "user", "content": chunks}
+      ],
+      max_tokens=512 * len(docs) + 512,
+      temperature=0.4,
+      stage="get_guidance"
   )
-  queries = response.choices[0].message.content
-  queries = queries.strip().splitlines()[0]
   return queries
 def get_supervision(rules_json):
   SUPERVISE_GUIDE = rule_compiler_prompt = f"""
@@ -115,27 +175,199 @@ def get_supervision(rules_json):
     ]
   }}
   """
-  client = InferenceClient(model=model_guide,token=HUGGING_FACE)
-  response = client.chat.completions.create(
-      messages=[
+  queries = chat(
+      model_guide,
+      [
           {"role": "system", "content": SUPERVISE_GUIDE},
           {"role": "user", "content": f"Genrate answer according to the guide "}
       ],
       max_tokens=2048,
-      temperature=0.1
+      temperature=0.1,
+      stage="get_supervision"
   )
-  queries = response.choices[0].message.content
-  queries = queries.strip().splitlines()[0]
   return queries
-def rules_synthesis(docs):
-    rules=[]
-    for doc in docs:
-        rule = get_guidance(doc)
-        rules.append(rule)
+def chunk_text(doc):
+    chunk = doc.get("chunk", "")
+    if isinstance(chunk, list):
+        return "\n".join(getattr(c, "page_content", str(c)) for c in chunk)
+    return chunk
+def parse_json(text):
+    # models like to wrap the json in ``` fences or add a sentence around it
+    match = re.search(r"\{.*\}", text or "", re.S)
+    if not match:
+        return None
+    try:
+        return json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+def split_packed(docs, answer):
+    per_doc = [[] for _ in docs]
+    by_url = {doc.get("url"): i for i, doc in enumerate(docs)}
+    for rule in (parse_json(answer) or {}).get("rules", []):
+        index = rule.pop("chunk", None)
+        if not isinstance(index, int) or not 0 <= index < len(docs):
+            index = by_url.get((rule.get("source") or {}).get("url"))
+        if index is None:
+            continue
+        rule["source"] = {"title": docs[index].get("title"), "url": docs[index].get("url")}
+        per_doc[index].append(rule)
+    return [json.dumps({"rules": rules}) for rules in per_doc]
+def make_packs(docs, token_budget):
+    """Greedy packing in document order, a chunk over half the budget always goes alone."""
+    packs, current, used = [], [], 0
+    for i, doc in enumerate(docs):
+        tokens = count_tokens(chunk_text(doc), model_guide)
+        if tokens > token_budget // 2:
+            packs.append([i])
+            continue
+        if current and used + tokens > token_budget:
+            packs.append(current)
+            current, used = [], 0
+        current.append(i)
+        used += tokens
+    if current:
+        packs.append(current)
+    return packs
+def deduplicate_documents(docs, threshold=0.8):
+    """
+    Drops exact and near duplicate chunks before they reach get_guidance().
+    Of every group of copies the one with the best priority (then score) is kept,
+    the others are listed in its "merged_sources".
+    """
+    docs = [doc for doc in docs if chunk_text(doc).strip()]
+    exact = {}
+    for i, doc in enumerate(docs):
+        digest = hashlib.sha256(normalize(chunk_text(doc)).encode()).hexdigest()
+        exact.setdefault(digest, []).append(i)
+    exact_groups = list(exact.values())
+    near = near_duplicate_groups([chunk_text(docs[g[0]]) for g in exact_groups], threshold=threshold, n=5)
+    kept = []
+    for group in near:
+        members = [i for g in group for i in exact_groups[g]]
+        best = min(members, key=lambda i: (priority_rank(docs[i].get("priority")), -(docs[i].get("score") or 0), i))
+        doc = dict(docs[best])
+        doc["merged_sources"] = [
+            {"url": docs[i].get("url"), "title": docs[i].get("title"), "query": docs[i].get("query"), "score": docs[i].get("score")}
+            for i in members if i != best
+        ]
+        kept.append((best, doc))
+    return [doc for _, doc in sorted(kept, key=lambda item: item[0])]
+def rules_synthesis(docs, max_workers=8, pack=False, token_budget=3000, check=None):
+    """
+    One synthesis output (raw json string) per doc, in the order of docs.
+    pack=True sends several short chunks per request (up to token_budget chunk tokens)
+    and splits the returned rules back out by chunk index / source url.
+    check() is called before every request, an exception from it stops the synthesis.
+    """
+    docs = list(docs)
+    rules = [None] * len(docs)
+    packs = make_packs(docs, token_budget) if pack else [[i] for i in range(len(docs))]
+    def run(pack_ids):
+        if check:
+            check()
+        if len(pack_ids) == 1:
+            return [get_guidance(docs[pack_ids[0]])]
+        packed = [docs[i] for i in pack_ids]
+        return split_packed(packed, get_guidance_packed(packed))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for pack_ids, outputs in zip(packs, pool.map(metering(run), packs)):
+            for i, output in zip(pack_ids, outputs):
+                rules[i] = output
+    return rules
+PRIORITY_RANK = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+MAX_CLUSTER = 24
+def priority_rank(priority):
+    return PRIORITY_RANK.get(str(priority).strip().lower(), len(PRIORITY_RANK))
+def collect_rules(rules_json):
+    """Flat list of rule dicts from rules_synthesis() output (or one json string of it)."""
+    if isinstance(rules_json, str):
+        rules_json = [rules_json]
+    rules = []
+    for output in rules_json:
+        parsed = parse_json(output) if isinstance(output, str) else output
+        if isinstance(parsed, dict):
+            rules.extend(r for r in parsed.get("rules", []) if isinstance(r, dict) and r.get("rule_text"))
     return rules
-def rule_compiler(rules_json):
-    final_rules = get_supervision(rules_json)
-    return final_rules
+def as_final(rule):
+    source = rule.get("source") or {}
+    sources = rule.get("sources") or ([{"url": source.get("url"), "evidence_snippet": source.get("title")}] if source else [])
+    return {
+        "rule_id": rule.get("rule_id"),
+        "rule_text": rule.get("rule_text"),
+        "priority": rule.get("priority"),
+        "sources": sources,
+    }
+def compile_cluster(rules):
+    """Merge one cluster of candidate duplicates, large clusters are compiled in halves first."""
+    if len(rules) > MAX_CLUSTER:
+        half = len(rules) // 2
+        left, right = compile_cluster(rules[:half]), compile_cluster(rules[half:])
+        combined = left["final_rules"] + right["final_rules"]
+        discarded = left["discarded_rules"] + right["discarded_rules"]
+        if len(combined) >= len(rules):
+            # the halves did not shrink (unusable answers or distinct rules), another round would not either
+            return {"final_rules": combined, "discarded_rules": discarded}
+        merged = compile_cluster(combined)
+        merged["discarded_rules"] = discarded + merged["discarded_rules"]
+        return merged
+    compiled = parse_json(get_supervision(json.dumps([as_final(r) for r in rules], indent=1)))
+    if not isinstance(compiled, dict) or not isinstance(compiled.get("final_rules"), list):
+        # unusable answer, keep the cluster as it is rather than lose rules
+        return {"final_rules": [as_final(r) for r in rules], "discarded_rules": []}
+    compiled.setdefault("discarded_rules", [])
+    return compiled
+def rule_compiler(rules_json, max_workers=8, threshold=0.5, check=None):
+    """
+    Map-reduce compile:
+    1. exact duplicates (same normalized rule_text) are merged locally, highest priority wins
+    2. the rest is clustered with MinHash over rule_text, singletons are final as they are
+       (union-find chains pairs, so clusters over MAX_CLUSTER are cut into MAX_CLUSTER sized pieces of neighbours)
+    3. only clusters go to get_supervision(), in parallel
+    Returns the same {"final_rules": [...], "discarded_rules": [...]} json as the single-shot compiler.
+    check() is called before every cluster, an exception from it stops the compile.
+    """
+    final_rules, discarded_rules = [], []
+    unique = {}
+    for rule in collect_rules(rules_json):
+        key = normalize(rule["rule_text"])
+        kept = unique.get(key)
+        if kept is None:
+            unique[key] = rule
+            continue
+        if priority_rank(rule.get("priority")) < priority_rank(kept.get("priority")):
+            unique[key], rule = rule, kept
+        unique[key].setdefault("sources", as_final(unique[key])["sources"])
+        unique[key]["sources"].extend(as_final(rule)["sources"])
+        discarded_rules.append({"rule_id": rule.get("rule_id"), "reason": "duplicate"})
+    rules = list(unique.values())
+    groups = near_duplicate_groups([r["rule_text"] for r in rules], threshold=threshold, n=2)
+    clusters = []
+    for group in groups:
+        if len(group) == 1:
+            final_rules.append(as_final(rules[group[0]]))
+            continue
+        members = sorted((rules[i] for i in group), key=lambda r: normalize(r["rule_text"]))
+        for piece in (members[i:i + MAX_CLUSTER] for i in range(0, len(members), MAX_CLUSTER)):
+            if len(piece) == 1:
+                final_rules.append(as_final(piece[0]))
+            else:
+                clusters.append(piece)
+    def compile_checked(cluster):
+        if check:
+            check()
+        return compile_cluster(cluster)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for compiled in pool.map(metering(compile_checked), clusters):
+            final_rules.extend(compiled["final_rules"])
+            discarded_rules.extend(compiled["discarded_rules"])
+    seen = {}
+    for rule in final_rules:
+        # ids are only unique inside one synthesis answer
+        rule_id = rule.get("rule_id") or "rule"
+        seen[rule_id] = seen.get(rule_id, 0) + 1
+        if seen[rule_id] > 1:
+            rule["rule_id"] = f"{rule_id}-{seen[rule_id]}"
+    return json.dumps({"final_rules": final_rules, "discarded_rules": discarded_rules})
 
 """
 doc ={
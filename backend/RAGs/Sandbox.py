@@ -0,0 +1,332 @@
+"""
+Docstring for backend.Sandbox
+Verification environments for the reflection loop, built once and reused.
+
+- dependency images: FROM base image + the preset's install steps, built from a context that holds only
+  the dependency files (requirements.txt, package*.json, pom.xml, go.mod / go.sum). Tagged
+  patchpilot-deps:<hash of base image, preset, steps and dependency file contents>, so an image is
+  rebuilt only when the dependencies change
+- warm pool: per image a few idle containers (`tail -f /dev/null`) (no network, capped memory / pids)
+- a run leases a container, the project is streamed in as a tar (`docker cp -`) to /base and copied to /app,
+  patched files go to /app the same way and commands run through `docker exec`, nothing is rebuilt
+- a released container gets /app reset from /base inside the container and goes back to the pool, the next
+  lease for the same project (path, sizes and mtimes unchanged) skips the upload; containers whose command
+  timed out or whose reset failed are removed, the pool is refilled in the background
+
+pool = get_pool()  # process wide, SandboxError when docker is not usable on this machine
+image = pool.image_for("python", "3.11", "python-verify", project_dir)
+with pool.lease(image, project_key(project_dir)) as box:
+    box.load_project(project_dir)
+    box.put_files({"app/models.py": patched})
+    code, out, err = box.run(["python", "-m", "py_compile", "app/models.py"])
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import shlex
+import subprocess
+import tarfile
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from .ProjectIngestion import IGNORE_DIRS
+from .Reflection_agent import resolve_install
+
+DOCKER = os.getenv("PATCHPILOT_DOCKER", "docker")
+POOL_SIZE = int(os.getenv("PATCHPILOT_POOL_SIZE", "2"))
+BUILD_TIMEOUT = 1800
+RUN_TIMEOUT = 300
+CONTAINER_LIMITS = ["--network", "none", "--memory", "1g", "--pids-limit", "256"]
+LABEL = "patchpilot.pool"
+
+logger = logging.getLogger(__name__)
+
+
+class SandboxError(RuntimeError):
+    pass
+
+
+def docker(*args, stdin=None, timeout: float = RUN_TIMEOUT) -> subprocess.CompletedProcess:
+    try:
+        return subprocess.run([DOCKER, *args], stdin=stdin, capture_output=True, timeout=timeout)
+    except FileNotFoundError:
+        raise SandboxError(f"{DOCKER} is not installed")
+
+
+def _check(result: subprocess.CompletedProcess, what: str) -> str:
+    if result.returncode != 0:
+        raise SandboxError(f"{what} failed: {result.stderr.decode(errors='replace').strip()}")
+    return result.stdout.decode(errors="replace").strip()
+
+
+def dependency_files(steps: list[str], project_dir) -> list[Path]:
+    """The project files the install steps COPY, e.g. requirements.txt for python-verify."""
+    project_dir = Path(project_dir)
+    files = []
+    for step in steps:
+        parts = shlex.split(step)
+        if not parts or parts[0].upper() != "COPY":
+            continue
+        for source in [p for p in parts[1:-1] if not p.startswith("--")]:
+            matches = sorted(project_dir.glob(source))
+            if not matches:
+                raise SandboxError(f"install step {step!r} needs {source} in the project")
+            files.extend(m for m in matches if m.is_file())
+    return files
+
+
+def dependency_key(base_image: str, preset: str, steps: list[str], files: list[Path], project_dir) -> str:
+    digest = hashlib.sha256(json.dumps([base_image, preset, steps]).encode())
+    for path in sorted(files):
+        digest.update(str(path.relative_to(project_dir)).encode())
+        digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return digest.hexdigest()[:20]
+
+
+def _project_files(directory: Path):
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d not in IGNORE_DIRS]
+        for name in files:
+            path = Path(root) / name
+            if path.is_file() and not path.is_symlink():
+                yield path
+
+
+def project_key(directory) -> str:
+    """Identity of a project tree as put_directory() would copy it, from paths, sizes and mtimes only."""
+    directory = Path(directory).resolve()
+    digest = hashlib.sha256(str(directory).encode())
+    for path in sorted(_project_files(directory)):
+        stat = path.stat()
+        digest.update(f"\0{path.relative_to(directory)}\0{stat.st_size}\0{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:20]
+
+
+class Sandbox:
+    def __init__(self, container: str, image: str):
+        self.container = container
+        self.image = image
+        self.project = None  # project_key() of what /base holds
+        self.tainted = False  # a command may still be running, the container is not reused
+
+    def _put_tar(self, write, target: str = "/app"):
+        # docker cp - reads a tar from stdin and unpacks it below the target directory
+        with tempfile.TemporaryFile() as archive:
+            with tarfile.open(fileobj=archive, mode="w") as tar:
+                write(tar)
+            archive.seek(0)
+            _check(docker("cp", "-", f"{self.container}:{target}", stdin=archive), "docker cp")
+
+    def _shell(self, script: str, what: str):
+        code, _, err = self.run(["sh", "-c", script], workdir="/")
+        if code != 0:
+            raise SandboxError(f"{what} failed: {err.strip()}")
+
+    def load_project(self, directory, key: str | None = None):
+        """/app holds the project, it is only streamed in when /base holds another one."""
+        key = key or project_key(directory)
+        if self.project == key:
+            # /app was reset when the container was released
+            return
+        self.project = None
+        self._shell("rm -rf /base && mkdir /base", "clearing /base")
+        self.put_directory(directory, target="/base")
+        self.project = key
+        self.reset()
+
+    def reset(self):
+        """/app back to the loaded project, patched files and whatever the last command wrote are gone."""
+        self._shell("rm -rf /app && cp -a /base /app", "resetting /app")
+
+    def put_directory(self, directory, target: str = "/app"):
+        directory = Path(directory)
+
+        def write(tar):
+            for path in _project_files(directory):
+                tar.add(path, arcname=str(path.relative_to(directory)))
+        self._put_tar(write, target)
+
+    def put_files(self, files: dict[str, bytes | str]):
+        def write(tar):
+            for rel_path, content in files.items():
+                data = content.encode() if isinstance(content, str) else content
+                info = tarfile.TarInfo(rel_path)
+                info.size = len(data)
+                info.mode = 0o644
+                tar.addfile(info, io.BytesIO(data))
+        self._put_tar(write)
+
+    def run(self, cmd: list[str], timeout: float = RUN_TIMEOUT, workdir: str = "/app") -> tuple[int, str, str]:
+        try:
+            result = docker("exec", "-w", workdir, self.container, *cmd, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            # the exec'd process keeps running in the container, the container is dropped on release
+            self.tainted = True
+            return 124, "", f"timed out after {timeout}s"
+        return result.returncode, result.stdout.decode(errors="replace"), result.stderr.decode(errors="replace")
+
+    def remove(self):
+        docker("rm", "-f", self.container)
+
+
+class SandboxPool:
+    def __init__(self, size: int = POOL_SIZE):
+        self.size = size
+        self.lock = threading.Lock()
+        self.building = {}  # tag -> Lock, one build per dependency set
+        self.warm = {}  # image -> [Sandbox]
+        self.filling = set()
+        self.closed = False
+
+    def image_for(self, code_language: str, code_version: str, install_preset: str, project_dir,
+                  extra_steps: tuple[str, ...] = ()) -> str:
+        """
+        Tag of the dependency image for the project, built only if no image has this key yet.
+        extra_steps run after the preset's, e.g. installing the version a migration targets over the pinned one.
+        """
+        base_image, steps = resolve_install(code_language, code_version, install_preset)
+        steps = [*steps, *extra_steps]
+        files = dependency_files(steps, project_dir)
+        tag = f"patchpilot-deps:{dependency_key(base_image, install_preset, steps, files, project_dir)}"
+        with self.lock:
+            build_lock = self.building.setdefault(tag, threading.Lock())
+        with build_lock:
+            if docker("image", "inspect", tag).returncode == 0:
+                return tag
+            self._build(tag, base_image, steps, files, project_dir)
+        return tag
+
+    def _build(self, tag, base_image, steps, files, project_dir):
+        dockerfile = "\n".join([
+            f"FROM {base_image}",
+            "ENV PYTHONDONTWRITEBYTECODE=1 PYTHONUNBUFFERED=1",
+            "WORKDIR /app",
+            *steps,
+        ])
+        with tempfile.TemporaryDirectory() as context:
+            for path in files:
+                target = Path(context) / path.relative_to(project_dir)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_bytes(path.read_bytes())
+            (Path(context) / "Dockerfile").write_text(dockerfile)
+            _check(docker("build", "-q", "-t", tag, context, timeout=BUILD_TIMEOUT), f"building {tag}")
+
+    def _start(self, image: str) -> Sandbox:
+        container = _check(
+            docker("run", "-d", "--label", f"{LABEL}={image}", *CONTAINER_LIMITS, image, "tail", "-f", "/dev/null"),
+            f"starting {image}",
+        )
+        return Sandbox(container, image)
+
+    def _fill(self, image: str):
+        try:
+            while True:
+                with self.lock:
+                    if self.closed or len(self.warm.get(image, [])) >= self.size:
+                        return
+                box = self._start(image)
+                with self.lock:
+                    if not self.closed:
+                        self.warm.setdefault(image, []).append(box)
+                        continue
+                box.remove()
+                return
+        except SandboxError as e:
+            logger.warning("could not warm %s: %s", image, e)
+        finally:
+            with self.lock:
+                self.filling.discard(image)
+
+    def refill(self, image: str):
+        with self.lock:
+            if image in self.filling:
+                return
+            self.filling.add(image)
+        threading.Thread(target=self._fill, args=(image,), daemon=True).start()
+
+    def acquire(self, image: str, project: str | None = None) -> Sandbox:
+        """An idle container of the image, preferably one that already holds the project (a project_key())."""
+        with self.lock:
+            warm = self.warm.get(image, [])
+            loaded = [i for i, b in enumerate(warm) if project and b.project == project]
+            box = warm.pop(loaded[-1] if loaded else -1) if warm else None
+        if box is not None:
+            # it comes back on release, the pool only needs refilling when containers are dropped
+            return box
+        self.refill(image)
+        return self._start(image)
+
+    def release(self, box: Sandbox):
+        # a used container goes back only once /app is the bare project again
+        reusable = not self.closed and not box.tainted and box.project is not None
+        if reusable:
+            try:
+                box.reset()
+            except SandboxError as e:
+                logger.warning("dropping %s: %s", box.container, e)
+                reusable = False
+        if not reusable:
+            box.remove()
+            if not self.closed:
+                self.refill(box.image)
+            return
+        with self.lock:
+            warm = self.warm.setdefault(box.image, [])
+            empty = [i for i, b in enumerate(warm) if b.project is None]
+            if self.closed:
+                dropped = box
+            elif len(warm) < self.size:
+                warm.append(box)
+                dropped = None
+            elif empty:
+                # idle containers stay capped at size, an empty one makes room for a loaded one
+                dropped = warm.pop(empty[0])
+                warm.append(box)
+            else:
+                dropped = box
+        if dropped is not None:
+            dropped.remove()
+
+    @contextmanager
+    def lease(self, image: str, project: str | None = None):
+        box = self.acquire(image, project)
+        try:
+            yield box
+        finally:
+            self.release(box)
+
+    def shutdown(self):
+        with self.lock:
+            self.closed = True
+            boxes = [box for warm in self.warm.values() for box in warm]
+            self.warm.clear()
+        for box in boxes:
+            box.remove()
+
+
+_pool: SandboxPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> SandboxPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            try:
+                _check(docker("version", "--format", "{{.Server.Version}}", timeout=30), "docker version")
+            except subprocess.TimeoutExpired:
+                raise SandboxError("docker daemon is not responding")
+            _pool = SandboxPool()
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown()
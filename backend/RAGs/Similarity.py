@@ -0,0 +1,88 @@
+"""
+Docstring for backend.Similarity
+Local near-duplicate detection used before paying for llm calls.
+normalize -> word shingles -> MinHash signature -> LSH banding for candidate pairs -> union-find clusters.
+
+groups = near_duplicate_groups(["Use model_validate() ...", "use model_validate ...", ...], threshold=0.5)
+"""
+import hashlib
+import random
+import re
+
+NUM_PERM = 64
+BANDS = 32
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1337)
+_PERMS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+def normalize(text: str) -> str:
+    text = text.lower()
+    # keep identifier characters, `parse_obj` and `parse_obj()` must normalize the same
+    text = re.sub(r"[^\w.]+", " ", text)
+    text = re.sub(r"\.(\s|$)", r"\1", text)
+    return " ".join(text.split())
+
+
+def shingles(text: str, n: int = 3) -> set[str]:
+    words = normalize(text).split()
+    if len(words) <= n:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def _hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "big")
+
+
+def minhash(shingle_set: set[str]) -> tuple[int, ...]:
+    hashes = [_hash(s) for s in shingle_set] or [0]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMS)
+
+
+def similarity(sig_a, sig_b) -> float:
+    return sum(a == b for a, b in zip(sig_a, sig_b)) / len(sig_a)
+
+
+def candidate_pairs(signatures: list[tuple[int, ...]]) -> set[tuple[int, int]]:
+    rows = NUM_PERM // BANDS
+    pairs = set()
+    for band in range(BANDS):
+        buckets = {}
+        for i, sig in enumerate(signatures):
+            buckets.setdefault(sig[band * rows:(band + 1) * rows], []).append(i)
+        for members in buckets.values():
+            for x in range(len(members)):
+                for y in range(x + 1, len(members)):
+                    pairs.add((members[x], members[y]))
+    return pairs
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int):
+        self.parent[self.find(a)] = self.find(b)
+
+    def groups(self) -> list[list[int]]:
+        groups = {}
+        for i in range(len(self.parent)):
+            groups.setdefault(self.find(i), []).append(i)
+        return list(groups.values())
+
+
+def near_duplicate_groups(texts: list[str], threshold: float = 0.5, n: int = 3) -> list[list[int]]:
+    """Index groups, every index appears in exactly one group, singletons included."""
+    signatures = [minhash(shingles(t, n)) for t in texts]
+    uf = UnionFind(len(texts))
+    for a, b in candidate_pairs(signatures):
+        if similarity(signatures[a], signatures[b]) >= threshold:
+            uf.union(a, b)
+    return uf.groups()
@@ -0,0 +1,175 @@
+"""
+Docstring for backend.SourceAuthority
+Authority level per hostname, used as the retrieval priority of a document.
+
+Lookup order:
+1. in-process memo
+2. static rules (official docs, github, stackoverflow ...)
+3. sqlite store of earlier llm verdicts, valid for ttl
+4. the llm itself, one request for all unseen hostnames of a search (classify_batch)
+
+cached() only looks at 1. and 2., it never blocks and is what code on the event loop uses,
+hostnames nobody classified yet get NEUTRAL there.
+Only hostnames the llm actually rated are stored, a missing or unreadable verdict is asked again next time.
+"""
+import fnmatch
+import logging
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from .LLMClient import chat
+from .Storage import connect
+
+logger = logging.getLogger(__name__)
+
+model_name = 'mistralai/Mistral-7B-Instruct-v0.2'
+LEVELS = ("Critical", "High", "Medium", "low")
+NEUTRAL = "Medium"
+DEFAULT_TTL = 30 * 24 * 3600
+
+# first match wins
+RULES = [
+    ("*docs.*", "Critical"),
+    ("*.readthedocs.io", "Critical"),
+    ("peps.python.org", "Critical"),
+    ("github.com", "High"),
+    ("*.github.io", "High"),
+    ("raw.githubusercontent.com", "High"),
+    ("pypi.org", "High"),
+    ("www.npmjs.com", "High"),
+    ("pkg.go.dev", "High"),
+    ("stackoverflow.com", "Medium"),
+    ("*.stackexchange.com", "Medium"),
+    ("medium.com", "low"),
+    ("*.medium.com", "low"),
+    ("dev.to", "low"),
+]
+
+GUIDE = """You are a source authority classifier.
+
+Your task is to assign an authority level to a web source
+based only on its origin and role, not on the claims it makes.
+
+Authority levels:
+- high: official documentation, specifications, or primary maintainers
+- medium: widely trusted community-maintained sources
+- low: personal blogs, opinion pieces, SEO content, forums
+
+Rules:
+- If the source is not official, it cannot be high.
+- If unsure, choose the lower authority.
+- Never infer authority from writing quality or popularity.
+- Never override known official domains.
+- Base your decision on source type and domain only.
+
+You will receive one hostname per line.
+Output one line per hostname in the form:
+hostname: Critical | High | Medium | low
+"""
+
+
+def parse_level(text: str) -> str | None:
+    for word in re.findall(r"[A-Za-z]+", text or ""):
+        for level in LEVELS:
+            if word.lower() == level.lower():
+                return level
+    return None
+
+
+def hostname_of(url: str) -> str:
+    return (urlparse(url).hostname or "").lower()
+
+
+def rule_level(hostname: str) -> str | None:
+    for pattern, level in RULES:
+        if fnmatch.fnmatchcase(hostname, pattern):
+            return level
+    return None
+
+
+class AuthorityStore:
+    def __init__(self, ttl: float = DEFAULT_TTL, name: str = "authority.sqlite"):
+        self.ttl = ttl
+        self.conn = connect(name)
+        self.lock = threading.Lock()
+        self.memo: dict[str, str] = {}
+        with self.lock:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS authority (hostname TEXT PRIMARY KEY, level TEXT NOT NULL, decided_at REAL NOT NULL)"
+            )
+
+    def cached(self, hostname: str) -> str | None:
+        """memo and static rules, no io"""
+        level = self.memo.get(hostname)
+        if level:
+            return level
+        level = rule_level(hostname)
+        if level:
+            self.memo[hostname] = level
+        return level
+
+    def known(self, hostname: str) -> str | None:
+        level = self.cached(hostname)
+        if level:
+            return level
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT level, decided_at FROM authority WHERE hostname = ?", (hostname,)
+            ).fetchone()
+        if row and time.time() - row[1] < self.ttl:
+            self.memo[hostname] = row[0]
+            return row[0]
+        return None
+
+    def remember(self, verdicts: dict[str, str]):
+        now = time.time()
+        self.memo.update(verdicts)
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO authority VALUES (?, ?, ?)",
+                [(host, level, now) for host, level in verdicts.items()],
+            )
+
+    def lookup(self, url: str) -> str:
+        hostname = hostname_of(url)
+        return self.known(hostname) or self.classify_batch([url])[hostname]
+
+    def classify_batch(self, urls) -> dict[str, str]:
+        hosts = {hostname_of(u) for u in urls if u}
+        levels = {h: self.known(h) for h in hosts}
+        unseen = sorted(h for h, level in levels.items() if level is None)
+        if unseen:
+            try:
+                verdicts = ask_llm(unseen)
+            except Exception:
+                logger.warning("classifying %d hostnames failed", len(unseen), exc_info=True)
+                verdicts = {}
+            # hosts without a verdict are not remembered, the next search asks again
+            self.remember(verdicts)
+            levels.update({h: verdicts.get(h, NEUTRAL) for h in unseen})
+        return levels
+
+
+def ask_llm(hostnames: list[str]) -> dict[str, str]:
+    """Verdicts for the hostnames the answer rates, the others are left out."""
+    answer = chat(
+        model_name,
+        [
+            {"role": "system", "content": GUIDE},
+            {"role": "user", "content": "\n".join(hostnames)}
+        ],
+        max_tokens=16 * len(hostnames) + 16,
+        temperature=0.1,
+        stage="priority_assignment"
+    )
+    verdicts = {}
+    for line in answer.strip().splitlines():
+        host, _, level = line.partition(":")
+        host = host.strip().strip("-* ").lower()
+        if host in hostnames and parse_level(level):
+            verdicts[host] = parse_level(level)
+    if len(hostnames) == 1 and ":" not in answer and parse_level(answer):
+        verdicts[hostnames[0]] = parse_level(answer)
+    return verdicts
@@ -0,0 +1,19 @@
+"""
+Docstring for backend.Storage
+Local sqlite files shared by the caches and stores under backend/cache (override with PATCHPILOT_CACHE_DIR).
+"""
+import os
+import sqlite3
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+CACHE_DIR = Path(os.getenv("PATCHPILOT_CACHE_DIR", BASE_DIR / "cache"))
+
+
+def connect(name: str) -> sqlite3.Connection:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # autocommit, callers guard the connection with their own lock
+    conn = sqlite3.connect(CACHE_DIR / name, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
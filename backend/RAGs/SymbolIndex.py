@@ -0,0 +1,231 @@
+"""
+Docstring for backend.SymbolIndex
+On-disk index of imports, class definitions, function definitions and call sites of ingested files,
+so planning / patching can ask "where is BaseModel.parse_obj called?" without shipping files to a model.
+
+- python is parsed with ast, the other ALLOWED_EXTENSIONS languages with light regex lexers
+- symbols are stored per file content hash, unchanged files are never parsed twice
+- a project maps its rel_paths to hashes, re-indexing a project only parses new content
+
+index = SymbolIndex()
+index.index_records("github.com/org/repo", manifest.files)
+index.where_called("BaseModel.parse_obj", "github.com/org/repo")
+# [("app/models.py", 12, 12, "User"), ...]
+"""
+import ast
+import hashlib
+import re
+import threading
+
+from .ProjectIngestion import read_bytes
+from .Storage import connect
+
+
+def _dotted(node) -> str:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        inner = _dotted(node.value)
+        return f"{inner}.{node.attr}" if inner else node.attr
+    if isinstance(node, ast.Call):
+        return _dotted(node.func) + "()"
+    return ""
+
+
+def python_symbols(source: str) -> list[tuple[str, str, str, int, int]]:
+    """(kind, name, qualifier, line, end_line) rows."""
+    tree = ast.parse(source)
+    rows = []
+
+    def visit(node, owner=""):
+        for child in ast.iter_child_nodes(node):
+            line, end = getattr(child, "lineno", 0), getattr(child, "end_lineno", 0) or getattr(child, "lineno", 0)
+            if isinstance(child, ast.Import):
+                rows.extend(("import", a.name, a.asname or "", line, end) for a in child.names)
+            elif isinstance(child, ast.ImportFrom):
+                module = "." * child.level + (child.module or "")
+                rows.extend(("import", f"{module}.{a.name}", a.asname or "", line, end) for a in child.names)
+            elif isinstance(child, ast.ClassDef):
+                rows.append(("class", child.name, ",".join(_dotted(b) for b in child.bases), line, end))
+                visit(child, child.name)
+                continue
+            elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                rows.append(("def", child.name, owner, line, end))
+                visit(child, owner)
+                continue
+            elif isinstance(child, ast.Call):
+                if isinstance(child.func, ast.Attribute):
+                    rows.append(("call", child.func.attr, _dotted(child.func.value), line, end))
+                elif isinstance(child.func, ast.Name):
+                    rows.append(("call", child.func.id, "", line, end))
+            visit(child, owner)
+
+    visit(tree)
+    return rows
+
+
+LEXERS = {
+    "node": {
+        "import": [r"""^\s*import\s+(?:.+?\s+from\s+)?['"]([^'"]+)['"]""", r"""require\(\s*['"]([^'"]+)['"]\s*\)"""],
+        "class": r"\bclass\s+(\w+)(?:\s+extends\s+([\w.]+))?",
+    },
+    "java": {
+        "import": [r"^\s*import\s+(?:static\s+)?([\w.*]+)\s*;"],
+        "class": r"\b(?:class|interface|enum|record)\s+(\w+)(?:\s+extends\s+([\w.]+))?",
+    },
+    "go": {
+        "import": [r"""^\s*import\s+(?:\w+\s+)?"([^"]+)\"""", r"""^\s+(?:\w+\s+)?"([^"]+)"\s*$"""],
+        "class": r"^\s*type\s+(\w+)\s+(struct|interface)\b",
+    },
+    "c": {
+        "import": [r"""^\s*#\s*include\s*[<"]([^>"]+)[>"]"""],
+        "class": r"^\s*(?:typedef\s+)?struct\s+(\w+)()",
+    },
+    "cpp": {
+        "import": [r"""^\s*#\s*include\s*[<"]([^>"]+)[>"]"""],
+        "class": r"\b(?:class|struct)\s+(\w+)(?:\s*:\s*(?:public|protected|private)?\s*([\w:]+))?",
+    },
+}
+CALL = re.compile(r"(?:([A-Za-z_][\w.]*?)(\.|->|::))?\b([A-Za-z_]\w*)\s*\(")
+KEYWORDS = {"if", "for", "while", "switch", "return", "catch", "function", "sizeof", "new", "func", "defined"}
+
+
+def lexer_symbols(source: str, lang: str) -> list[tuple[str, str, str, int, int]]:
+    spec = LEXERS[lang]
+    rows = []
+    for number, line in enumerate(source.splitlines(), 1):
+        code = line.split("//", 1)[0]
+        for pattern in spec["import"]:
+            for match in re.finditer(pattern, code):
+                rows.append(("import", match.group(1), "", number, number))
+        for match in re.finditer(spec["class"], code):
+            rows.append(("class", match.group(1), match.group(2) or "", number, number))
+        for match in CALL.finditer(code):
+            receiver, _, name = match.groups()
+            if name not in KEYWORDS:
+                rows.append(("call", name, receiver or "", number, number))
+    return rows
+
+
+def extract_symbols(source: str, lang: str):
+    if lang == "python":
+        try:
+            return python_symbols(source)
+        except SyntaxError:
+            # python 2 or broken files still get the lexer treatment
+            return lexer_symbols(source, "node")
+    if lang in LEXERS:
+        return lexer_symbols(source, lang)
+    return []
+
+
+class SymbolIndex:
+    def __init__(self, name: str = "symbols.sqlite"):
+        self.conn = connect(name)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS indexed (sha256 TEXT PRIMARY KEY, lang TEXT);
+                CREATE TABLE IF NOT EXISTS symbols (
+                    sha256 TEXT NOT NULL, kind TEXT NOT NULL, name TEXT NOT NULL,
+                    qualifier TEXT NOT NULL, line INTEGER NOT NULL, end_line INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS symbols_name ON symbols (kind, name);
+                CREATE INDEX IF NOT EXISTS symbols_file ON symbols (sha256);
+                CREATE TABLE IF NOT EXISTS project_files (
+                    project TEXT NOT NULL, rel_path TEXT NOT NULL, sha256 TEXT NOT NULL,
+                    PRIMARY KEY (project, rel_path)
+                );
+                """
+            )
+
+    def index_records(self, project: str, records) -> int:
+        """Indexes the code files of a manifest, returns how many had to be parsed."""
+        parsed = 0
+        mapping = []
+        for record in records:
+            if not record.lang:
+                continue
+            # ingest_incremental() already hashed the manifest, the bytes are only read for new content
+            data = None if record.sha256 else read_bytes(record)
+            sha = record.sha256 or hashlib.sha256(data).hexdigest()
+            mapping.append((project, record.rel_path, sha))
+            with self.lock:
+                known = self.conn.execute("SELECT 1 FROM indexed WHERE sha256 = ?", (sha,)).fetchone()
+            if known:
+                continue
+            if data is None:
+                data = read_bytes(record)
+            rows = extract_symbols(data.decode("utf-8", errors="replace"), record.lang)
+            parsed += 1
+            with self.lock, self.conn:
+                self.conn.execute("BEGIN")
+                # another run may have indexed the same content while this one was parsing
+                if self.conn.execute("INSERT OR IGNORE INTO indexed VALUES (?, ?)", (sha, record.lang)).rowcount:
+                    self.conn.executemany("INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?)", [(sha, *row) for row in rows])
+        with self.lock, self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.execute("DELETE FROM project_files WHERE project = ?", (project,))
+            self.conn.executemany("INSERT INTO project_files VALUES (?, ?, ?)", mapping)
+        return parsed
+
+    def _query(self, project, kind, name):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT p.rel_path, s.line, s.end_line, s.qualifier FROM symbols s "
+                "JOIN project_files p ON p.sha256 = s.sha256 "
+                "WHERE p.project = ? AND s.kind = ? AND s.name = ? ORDER BY p.rel_path, s.line",
+                (project, kind, name),
+            ).fetchall()
+
+    def subclasses(self, project: str, base: str) -> set[str]:
+        """base and every class of the project that inherits from it, directly or not."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT s.name, s.qualifier FROM symbols s JOIN project_files p ON p.sha256 = s.sha256 "
+                "WHERE p.project = ? AND s.kind = 'class'",
+                (project,),
+            ).fetchall()
+        found, changed = {base}, True
+        while changed:
+            changed = False
+            for name, bases in rows:
+                if name not in found and any(b.rsplit(".", 1)[-1] in found for b in bases.split(",") if b):
+                    found.add(name)
+                    changed = True
+        return found
+
+    def where_called(self, symbol: str, project: str) -> list[tuple[str, int, int, str]]:
+        """
+        Call sites of `name` or `Class.method`. For Class.method the receiver must be the class,
+        one of its subclasses or an instance-like receiver (self / cls / lowercase name).
+        """
+        owner, _, name = symbol.rpartition(".")
+        rows = self._query(project, "call", name)
+        if not owner:
+            return rows
+        classes = self.subclasses(project, owner)
+        return [
+            row for row in rows
+            if row[3].rsplit(".", 1)[-1] in classes or row[3] in ("self", "cls") or row[3][:1].islower()
+        ]
+
+    def imports_of(self, module: str, project: str) -> list[tuple[str, int, int, str]]:
+        with self.lock:
+            return self.conn.execute(
+                "SELECT p.rel_path, s.line, s.end_line, s.name FROM symbols s JOIN project_files p ON p.sha256 = s.sha256 "
+                "WHERE p.project = ? AND s.kind = 'import' AND (s.name = ? OR s.name LIKE ?) ORDER BY p.rel_path, s.line",
+                (project, module, module + ".%"),
+            ).fetchall()
+
+    def definitions(self, name: str, project: str) -> list[tuple[str, int, int, str]]:
+        return self._query(project, "class", name) + self._query(project, "def", name)
+
+
+def ingest_and_index(directory, project: str, index: SymbolIndex | None = None):
+    """ingest_incremental() plus the symbol index, only added / changed content gets parsed. Close the manifest when done."""
+    from .ProjectIngestion import ingest_incremental
+    manifest, delta = ingest_incremental(directory, project)
+    (index or SymbolIndex()).index_records(project, manifest.files)
+    return manifest, delta
@@ -0,0 +1,282 @@
+"""
+Docstring for backend.Verifier
+Runs the presets.json run_profiles against patched files, many at once.
+
+- a VerificationJob is one command (a run profile + run args) over the project with some files replaced
+- LocalBackend: copies of the project in a temp dir (copy-on-write clones where the filesystem has them,
+  never hardlinks, a job may write to any file), one per concurrently running job and reused by the next job:
+  patched files are written over it, afterwards only what differs from the pristine copy is removed or copied
+  again; the command runs in its own session with rlimits (cpu seconds, address space, file size, no core dumps);
+  close() removes the copies
+- DockerBackend: a leased container of Sandbox.SandboxPool, the project is streamed in once per container
+  (reused containers already hold it), the patched files per job, cpu time is capped with ulimit inside,
+  memory by the container
+- verify() spreads the jobs over a thread pool, the work happens in child processes so every core is used,
+  results come back in job order with exit code, stdout / stderr (truncated) and duration
+
+jobs = file_jobs({"app/models.py": patched}, "python-syntax")
+results = verify(jobs, LocalBackend(project_dir))
+"""
+import fcntl
+import os
+import shutil
+import signal
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .ProjectIngestion import IGNORE_DIRS
+from .Reflection_agent import load_presets, resolve_command
+from .Sandbox import project_key
+
+
+FICLONE = 0x40049409  # linux ioctl, copy-on-write clone on btrfs / xfs
+LAUNCHER = """
+import os, resource, sys
+cpu, memory, fsize = (int(v) for v in sys.argv[1:4])
+resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+resource.setrlimit(resource.RLIMIT_FSIZE, (fsize, fsize))
+resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+if memory:
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+os.execvp(sys.argv[4], sys.argv[4:])
+"""
+
+
+@dataclass
+class Limits:
+    cpu_seconds: int = 60
+    memory_bytes: int | None = 2 * 1024 * 1024 * 1024  # None for runtimes that reserve huge address space (jvm)
+    file_size: int = 64 * 1024 * 1024
+    wall_seconds: float = 120
+    max_output: int = 64 * 1024
+
+
+@dataclass
+class VerificationJob:
+    label: str
+    profile: str
+    run_args: dict = field(default_factory=dict)
+    files: dict[str, str | bytes] = field(default_factory=dict)  # rel_path -> patched content
+
+
+@dataclass
+class VerificationResult:
+    label: str
+    profile: str
+    cmd: list[str]
+    exit_code: int
+    stdout: str
+    stderr: str
+    duration: float
+    timed_out: bool = False
+
+    @property
+    def passed(self) -> bool:
+        return self.exit_code == 0 and not self.timed_out
+
+
+def _truncate(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit] + f"\n... [{len(text) - limit} more characters]"
+
+
+def file_jobs(files: dict[str, str | bytes], profile: str) -> list[VerificationJob]:
+    """One job per patched file, {entry} / {module} of the profile point at that file."""
+    template = " ".join(load_presets()["run_profiles"][profile]["cmd"])
+    jobs = []
+    for rel_path, content in files.items():
+        args = {}
+        if "{entry}" in template:
+            args["entry"] = rel_path
+        if "{module}" in template:
+            args["module"] = rel_path.removesuffix(".py").replace("/", ".").removesuffix(".__init__")
+        jobs.append(VerificationJob(rel_path, profile, args, {rel_path: content}))
+    return jobs
+
+
+def _clone(src, dst):
+    try:
+        with open(src, "rb") as source, open(dst, "wb") as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+        shutil.copystat(src, dst)
+        return dst
+    except OSError:
+        return shutil.copy2(src, dst)
+
+
+def _copy_project(source: Path, target: Path):
+    shutil.copytree(source, target, symlinks=True, ignore=shutil.ignore_patterns(*IGNORE_DIRS), copy_function=_clone,
+                    dirs_exist_ok=True)
+
+
+def _snapshot(root: Path) -> dict[str, tuple[int, int, int]]:
+    """rel_path -> (mode, size, mtime_ns) of every file, symlink and directory below root."""
+    entries = {}
+    for directory, dirs, files in os.walk(root):
+        for name in dirs + files:
+            path = os.path.join(directory, name)
+            info = os.lstat(path)
+            # a directory only has to stay a directory, its size and mtime move with its contents
+            entries[os.path.relpath(path, root)] = (
+                (info.st_mode, 0, 0) if stat.S_ISDIR(info.st_mode) else (info.st_mode, info.st_size, info.st_mtime_ns)
+            )
+    return entries
+
+
+def _remove(path: str):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.unlink(path)
+
+
+def _restore(source: Path, root: Path, base: dict):
+    """Puts root back to the copy of source recorded in base, only what differs is removed or copied again."""
+    current = _snapshot(root)
+    # deepest first, a directory is emptied before it is looked at
+    for rel_path in sorted(current, key=lambda p: p.count(os.sep), reverse=True):
+        if base.get(rel_path) != current[rel_path] and os.path.lexists(root / rel_path):
+            _remove(str(root / rel_path))
+    for rel_path in sorted(base):
+        target = root / rel_path
+        if os.path.lexists(target):
+            continue
+        src = source / rel_path
+        if os.path.islink(src):
+            os.symlink(os.readlink(src), target)
+        elif src.is_dir():
+            target.mkdir()
+            shutil.copystat(src, target)
+        else:
+            _clone(src, target)
+
+
+def _write_files(root: Path, files: dict):
+    for rel_path, content in files.items():
+        path = (root / rel_path).resolve()
+        if root.resolve() not in path.parents:
+            raise ValueError(f"{rel_path} is outside the project")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content.encode() if isinstance(content, str) else content)
+
+
+class LocalBackend:
+    """For machines without docker. rlimits bound resources, they do not isolate the filesystem or network."""
+
+    def __init__(self, project_dir, limits: Limits | None = None):
+        self.project_dir = Path(project_dir)
+        self.limits = limits or Limits()
+        self.lock = threading.Lock()
+        self.idle = []  # workspaces (dir, snapshot of its pristine copy) no job is using
+        self.tempdir = None
+
+    def _lease(self) -> tuple[Path, dict]:
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+            if self.tempdir is None:
+                self.tempdir = tempfile.mkdtemp(prefix="patchpilot-verify-")
+                self._cleanup = weakref.finalize(self, shutil.rmtree, self.tempdir, True)
+        workspace = Path(tempfile.mkdtemp(dir=self.tempdir))
+        _copy_project(self.project_dir, workspace / "app")
+        return workspace, _snapshot(workspace / "app")
+
+    def _return(self, workspace: Path, base: dict):
+        # only what the job changed is copied again, the next job gets a pristine tree
+        try:
+            _restore(self.project_dir, workspace / "app", base)
+            shutil.rmtree(workspace / "home", ignore_errors=True)
+        except OSError:
+            shutil.rmtree(workspace, ignore_errors=True)
+            return
+        with self.lock:
+            if self.tempdir is not None:
+                self.idle.append((workspace, base))
+                return
+        shutil.rmtree(workspace, ignore_errors=True)
+
+    def close(self):
+        with self.lock:
+            tempdir, self.tempdir, self.idle = self.tempdir, None, []
+        if tempdir is not None:
+            self._cleanup()
+
+    def _limited(self, cmd: list[str]) -> list[str]:
+        # rlimits are set by a small launcher that execs the command, preexec_fn is not safe next to threads
+        limits = self.limits
+        return [
+            sys.executable, "-c", LAUNCHER,
+            str(limits.cpu_seconds), str(limits.memory_bytes or 0), str(limits.file_size), *cmd,
+        ]
+
+    def run(self, job: VerificationJob) -> VerificationResult:
+        cmd = resolve_command(job.profile, job.run_args)
+        workspace, base = self._lease()
+        try:
+            root, home = workspace / "app", workspace / "home"
+            home.mkdir()
+            _write_files(root, job.files)
+            started = time.perf_counter()
+            process = subprocess.Popen(
+                self._limited(cmd), cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True,
+                env={"PATH": os.environ.get("PATH", ""), "HOME": str(home), "LANG": "C.UTF-8", "PYTHONDONTWRITEBYTECODE": "1"},
+            )
+            timed_out = False
+            try:
+                stdout, stderr = process.communicate(timeout=self.limits.wall_seconds)
+            except subprocess.TimeoutExpired:
+                # the whole session, children included
+                os.killpg(process.pid, signal.SIGKILL)
+                stdout, stderr = process.communicate()
+                timed_out = True
+            return VerificationResult(
+                job.label, job.profile, cmd, process.returncode,
+                _truncate(stdout.decode(errors="replace"), self.limits.max_output),
+                _truncate(stderr.decode(errors="replace"), self.limits.max_output),
+                time.perf_counter() - started, timed_out,
+            )
+        finally:
+            self._return(workspace, base)
+
+
+class DockerBackend:
+    def __init__(self, pool, image: str, project_dir, limits: Limits | None = None):
+        self.pool = pool  # Sandbox.SandboxPool
+        self.image = image
+        self.project_dir = Path(project_dir)
+        self.project = project_key(self.project_dir)  # containers that hold this tree skip the upload
+        self.limits = limits or Limits()
+
+    def close(self):
+        # containers go back to the pool after every job, nothing is held here
+        pass
+
+    def run(self, job: VerificationJob) -> VerificationResult:
+        cmd = resolve_command(job.profile, job.run_args)
+        with self.pool.lease(self.image, self.project) as box:
+            box.load_project(self.project_dir, self.project)
+            if job.files:
+                box.put_files(job.files)
+            started = time.perf_counter()
+            limited = ["sh", "-c", f'ulimit -t {self.limits.cpu_seconds}; exec "$@"', "sh", *cmd]
+            code, stdout, stderr = box.run(limited, timeout=self.limits.wall_seconds)
+            return VerificationResult(
+                job.label, job.profile, cmd, code,
+                _truncate(stdout, self.limits.max_output), _truncate(stderr, self.limits.max_output),
+                time.perf_counter() - started, timed_out=code == 124,
+            )
+
+
+def verify(jobs: list[VerificationJob], backend, max_workers: int | None = None) -> list[VerificationResult]:
+    if not jobs:
+        return []
+    max_workers = max_workers or os.cpu_count() or 4
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(jobs))) as pool:
+        return list(pool.map(backend.run, jobs))
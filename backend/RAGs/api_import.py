@@ -2,4 +2,6 @@ from dotenv import load_dotenv
 import os
 load_dotenv()
 HUGGING_FACE = os.getenv("HUGGING_FACE_API")
-TAVILY = os.getenv("TAVILY_API")
\ No newline at end of file
+TAVILY = os.getenv("TAVILY_API")
+TAVILY_URL = os.getenv("TAVILY_URL", "https://api.tavily.com/search")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL")
@@ -1,11 +1,18 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, HTTPException, Form, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+import asyncio
+import json
 import uuid
-import shutil
 import os
-import subprocess
-from models import InputConfig, InputType, ConfigResponse, AnalysisResponse
+import shutil
+from models import InputConfig, InputType, ConfigResponse, AnalysisResponse, RunStatus, UploadSession
+from events import EventBus
+from jobs import JobQueue, QueueFull
+from mirrors import prune
+from pipeline import github_run, upload_run
+from uploads import HashMismatch, InvalidUpload, OffsetMismatch, UploadStore, UploadTooLarge
 
 origin = [
     'http://localhost:5173',
@@ -27,6 +34,46 @@ UPLOAD_DIR = "uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 REPOS_DIR = "repos"
 os.makedirs(REPOS_DIR, exist_ok=True)
+ACCEPTED_FORMATS = ('.zip', '.tar.gz')
+# archives are stored once per sha256 under uploads/blobs
+uploads = UploadStore(UPLOAD_DIR)
+MAX_RUNS = int(os.getenv("PATCHPILOT_MAX_RUNS", "4"))
+MAX_PENDING_RUNS = int(os.getenv("PATCHPILOT_MAX_PENDING_RUNS", "64"))
+UPLOAD_GC_INTERVAL = 3600
+
+# clone -> ingest -> retrieve -> plan -> patch runs here, handlers only enqueue
+events = EventBus()
+jobs = JobQueue(max_workers=MAX_RUNS, max_pending=MAX_PENDING_RUNS, bus=events)
+
+@app.on_event("startup")
+def prune_worktrees():
+    # no run is active yet, every checkout under repos/ belongs to a run that did not finish
+    prune()
+    for entry in os.listdir(REPOS_DIR):
+        shutil.rmtree(os.path.join(REPOS_DIR, entry), ignore_errors=True)
+
+@app.on_event("startup")
+async def collect_uploads():
+    async def loop():
+        while True:
+            # abandoned resumable sessions and archives no run uses any more
+            await asyncio.to_thread(uploads.collect)
+            await asyncio.sleep(UPLOAD_GC_INTERVAL)
+    app.state.upload_gc = asyncio.create_task(loop())
+
+@app.on_event("shutdown")
+def stop_jobs():
+    jobs.shutdown()
+    from RAGs.Sandbox import shutdown_pool
+    # warm verification containers, only there if a run used the sandbox
+    shutdown_pool()
+
+def enqueue(run_id: str, fn, *args, message: str) -> AnalysisResponse:
+    try:
+        jobs.submit(run_id, fn, *args, message=message)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Too many analysis runs, try again later ({e}).")
+    return AnalysisResponse(run_id=run_id, status="queued", message=message)
 
 @app.get("/config/inputs", response_model=ConfigResponse)
 async def get_input_config():
@@ -53,59 +100,181 @@ async def get_input_config():
                 type=InputType.SELECT,
                 options=["Quick Scan", "Deep Analysis", "Security Audit"],
                 required=True
+            ),
+            InputConfig(
+                id="library",
+                label="Library to Migrate",
+                type=InputType.TEXT,
+                placeholder="pydantic",
+                required=False
+            ),
+            InputConfig(
+                id="from_version",
+                label="From Version",
+                type=InputType.TEXT,
+                placeholder="1.x",
+                required=False
+            ),
+            InputConfig(
+                id="to_version",
+                label="To Version",
+                type=InputType.TEXT,
+                placeholder="2.x",
+                required=False
             )
         ]
     )
 
-@app.post("/upload", response_model=AnalysisResponse)
-async def upload_file(file: UploadFile = File(...)):
+def upload_response(sha: str, filename: str, library, from_version, to_version, message: str) -> AnalysisResponse:
+    run_id = str(uuid.uuid4())
+    # one directory per run, holding a hardlink to the stored archive
+    upload_dir = os.path.join(UPLOAD_DIR, run_id)
+    uploads.link(sha, upload_dir, filename)
+    # manifests and the symbol index are keyed by content, two unrelated project.zip never share them
+    return enqueue(
+        run_id, upload_run, upload_dir, f"upload:{sha}", library, from_version, to_version,
+        message=f"{message} Analysis run {run_id} queued.",
+    )
 
+@app.post("/upload", response_model=AnalysisResponse)
+async def upload_file(request: Request):
+    """
+    multipart/form-data with `file` (.zip / .tar.gz) and optional library, from_version, to_version.
+    The body is parsed while it streams in, the archive goes straight to its blob without being spooled first.
+    """
     try:
-        if not file.filename.endswith(('.zip', '.tar.gz')):
-             raise HTTPException(status_code=400, detail="Invalid file format. Please upload a ZIP or TAR.GZ file.")
-
-        file_location = f"{UPLOAD_DIR}/{uuid.uuid4()}_{file.filename}"
-        with open(file_location, "wb+") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        run_id = str(uuid.uuid4())
-        
-        return AnalysisResponse(
-            run_id=run_id,
-            status="uploaded",
-            message=f"File {file.filename} uploaded successfully. Analysis run {run_id} created."
+        fields, filename, sha, _ = await uploads.write_multipart(
+            request.stream(), request.headers.get("content-type", ""), suffixes=ACCEPTED_FORMATS,
         )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=f"Invalid upload: {e}. Please upload a ZIP or TAR.GZ file.")
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    return upload_response(
+        sha, filename, fields.get("library") or None, fields.get("from_version") or None, fields.get("to_version") or None,
+        message=f"File {filename} uploaded successfully.",
+    )
+
+@app.post("/uploads", response_model=UploadSession)
+async def create_upload(filename: str = Form(...), size: Optional[int] = Form(None), sha256: Optional[str] = Form(None)):
+    """Starts a resumable upload, complete is already true when an archive with this sha256 is stored."""
+    if not filename.endswith(ACCEPTED_FORMATS):
+         raise HTTPException(status_code=400, detail="Invalid file format. Please upload a ZIP or TAR.GZ file.")
+    try:
+        return UploadSession(**uploads.create(filename, size, sha256))
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+@app.get("/uploads/{upload_id}", response_model=UploadSession)
+async def get_upload(upload_id: str):
+    session = uploads.session(upload_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail=f"Unknown upload {upload_id}")
+    return UploadSession(**session)
+
+@app.put("/uploads/{upload_id}", response_model=UploadSession)
+async def append_upload(upload_id: str, offset: int, request: Request):
+    """The raw request body is appended at offset, a mismatch answers 409 with the offset to resume from."""
+    try:
+        await uploads.append(upload_id, offset, request.stream())
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown or finished upload {upload_id}")
+    except OffsetMismatch as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.offset})
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return UploadSession(**uploads.session(upload_id))
+
+@app.post("/uploads/{upload_id}/complete", response_model=AnalysisResponse)
+async def complete_upload(
+    upload_id: str,
+    library: Optional[str] = Form(None),
+    from_version: Optional[str] = Form(None),
+    to_version: Optional[str] = Form(None),
+):
+    try:
+        sha = await uploads.complete(upload_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown upload {upload_id}")
+    except OffsetMismatch as e:
+        raise HTTPException(status_code=409, detail={"message": str(e), "offset": e.offset})
+    except HashMismatch as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    filename = uploads.session(upload_id)["filename"]
+    return upload_response(
+        sha, filename, library, from_version, to_version,
+        message=f"File {filename} uploaded successfully.",
+    )
 
 @app.post("/analyze/github", response_model=AnalysisResponse)
-async def analyze_github(url: str = Form(...), depth: str = Form("Quick Scan")):
+async def analyze_github(
+    url: str = Form(...),
+    depth: str = Form("Quick Scan"),
+    library: Optional[str] = Form(None),
+    from_version: Optional[str] = Form(None),
+    to_version: Optional[str] = Form(None),
+):
 
     run_id = str(uuid.uuid4())
-    
-    # Extract repo name for folder creation
-    try:
-        # Simple extraction from URL
-        repo_name = url.rstrip('/').split('/')[-1]
-        if not repo_name:
-             repo_name = "unknown_repo"
-    except:
-        repo_name = "unknown_repo"
+    if url.startswith("-"):
+        raise HTTPException(status_code=400, detail="Invalid repository URL.")
 
+    # Extract repo name for folder creation
+    repo_name = url.rstrip('/').split('/')[-1] or "unknown_repo"
     target_dir = os.path.join(REPOS_DIR, f"{run_id}_{repo_name}")
 
-    try:
-        # Clone the repository
-        # Security Note: interactively running git with user provided URLs can be risky in prod without sanitization.
-        # Assuming trusted user for this desktop app context.
-        subprocess.run(["git", "clone", url, target_dir], check=True, capture_output=True)
-        
-        return AnalysisResponse(
-            run_id=run_id,
-            status="queued",
-            message=f"GitHub repository {url} cloned to {target_dir} and queued for {depth}."
-        )
-    except subprocess.CalledProcessError as e:
-         raise HTTPException(status_code=400, detail=f"Failed to clone repository: {e.stderr.decode() if e.stderr else str(e)}")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+    # the clone itself runs on the worker pool, the event loop never waits for git
+    return enqueue(
+        run_id, github_run, url, target_dir, library, from_version, to_version,
+        message=f"GitHub repository {url} queued for {depth}.",
+    )
+
+@app.get("/runs/{run_id}", response_model=RunStatus)
+async def get_run(run_id: str):
+    status = jobs.status(run_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown run {run_id}")
+    return RunStatus(**status)
+
+@app.post("/runs/{run_id}/cancel", response_model=RunStatus)
+async def cancel_run(run_id: str):
+    status = jobs.cancel(run_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown run {run_id}")
+    return RunStatus(**status)
+
+@app.get("/runs/{run_id}/events")
+async def run_events(run_id: str, last_event_id: Optional[str] = Header(None)):
+    """Server-sent events: status, stage, document, token, patched and finally end. Reconnects resume after Last-Event-ID."""
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    queue = events.subscribe(run_id, after=after)
+    status = jobs.status(run_id)
+    if status is None:
+        events.unsubscribe(run_id, queue)
+        raise HTTPException(status_code=404, detail=f"Unknown run {run_id}")
+
+    def sse(event: dict) -> str:
+        event_id = f"id: {event['id']}\n" if "id" in event else ""
+        return f"{event_id}data: {json.dumps(event)}\n\n"
+
+    async def stream():
+        try:
+            yield sse({"type": "status", **status})
+            if status["status"] in ("succeeded", "failed", "cancelled"):
+                yield sse({"type": "end", **status})
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield sse(event)
+                if event["type"] == "end":
+                    return
+        finally:
+            events.unsubscribe(run_id, queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,8 @@
+"""
+Shared test setup: the sqlite stores and mirrors of a test session live in a temp dir, never in backend/cache.
+Run from the repository root with `python -m pytest -q backend`.
+"""
+import os
+import tempfile
+
+os.environ.setdefault("PATCHPILOT_CACHE_DIR", tempfile.mkdtemp(prefix="patchpilot-tests-"))
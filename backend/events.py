@@ -0,0 +1,81 @@
+"""
+Docstring for backend.events
+In-process fan-out of run events (status, stage, document, token) to SSE subscribers.
+
+- workers publish from their own threads and never wait on a subscriber
+- every subscriber has a bounded asyncio.Queue on the event loop; when it is full
+  token events are dropped first, otherwise the oldest queued event makes room
+- the last non-token events of a run are replayed to late subscribers
+- events carry a per-run id, a reconnecting client (Last-Event-ID) only gets what it has not seen yet
+
+bus = EventBus()
+queue = bus.subscribe(run_id)          # on the event loop
+queue = bus.subscribe(run_id, after=last_event_id)
+bus.publish(run_id, {"type": "stage", "stage": "ingest"})   # from any thread
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+
+QUEUE_SIZE = 256
+HISTORY = 50
+MAX_RUNS = 1000
+
+
+def _offer(queue: asyncio.Queue, event: dict):
+    if queue.full():
+        if event["type"] == "token":
+            # a slow client loses tokens, never stages or the end of the run
+            queue.dropped = getattr(queue, "dropped", 0) + 1
+            return
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class EventBus:
+    def __init__(self, queue_size: int = QUEUE_SIZE, history: int = HISTORY):
+        self.queue_size = queue_size
+        self.history_size = history
+        self.lock = threading.Lock()
+        self.subscribers = {}  # run_id -> [(loop, queue)]
+        self.history = OrderedDict()  # run_id -> deque of events
+        self.last_ids = {}  # run_id -> id of its last event
+
+    def subscribe(self, run_id: str, after: int | None = None) -> asyncio.Queue:
+        """Queue of the run's events, the replayed history starts after the event id `after` when given."""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.setdefault(run_id, []).append((asyncio.get_running_loop(), queue))
+            for event in self.history.get(run_id, ()):
+                if after is None or event["id"] > after:
+                    _offer(queue, event)
+        return queue
+
+    def unsubscribe(self, run_id: str, queue: asyncio.Queue):
+        with self.lock:
+            remaining = [(l, q) for l, q in self.subscribers.get(run_id, []) if q is not queue]
+            if remaining:
+                self.subscribers[run_id] = remaining
+            else:
+                self.subscribers.pop(run_id, None)
+
+    def publish(self, run_id: str, event: dict):
+        with self.lock:
+            event_id = self.last_ids.get(run_id, 0) + 1
+            self.last_ids[run_id] = event_id
+            event = {"time": time.time(), **event, "id": event_id}
+            history = self.history.setdefault(run_id, deque(maxlen=self.history_size))
+            if event["type"] != "token":
+                history.append(event)
+            self.history.move_to_end(run_id)
+            while len(self.history) > MAX_RUNS:
+                expired, _ = self.history.popitem(last=False)
+                self.last_ids.pop(expired, None)
+            subscribers = list(self.subscribers.get(run_id, []))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, event)
+            except RuntimeError:
+                # loop closed, the subscriber is gone
+                self.unsubscribe(run_id, queue)
@@ -0,0 +1,186 @@
+"""
+Docstring for backend.jobs
+Bounded worker pool for analysis runs, so request handlers only enqueue and return.
+
+- every run has a row in cache/runs.sqlite: status, current stage, message, result, error
+- status: queued -> running -> succeeded | failed | cancelled
+- at most max_workers runs execute at once, at most max_pending wait, submit() raises QueueFull beyond that
+- cancellation is cooperative: a queued run never starts, a running one stops at its next run.check()
+- with a bus (events.EventBus) status changes, stages and pipeline events are published for /runs/{run_id}/events
+- runs still queued or running when the queue starts belonged to an earlier process, they are marked failed
+
+queue = JobQueue(max_workers=4)
+queue.submit(run_id, pipeline_fn, *args)   # pipeline_fn(run, *args) -> result dict
+queue.status(run_id)
+queue.cancel(run_id)
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from RAGs.Storage import connect
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFull(RuntimeError):
+    pass
+
+
+class Cancelled(Exception):
+    pass
+
+
+class RunStore:
+    def __init__(self, name: str = "runs.sqlite"):
+        self.conn = connect(name)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    message TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )"""
+            )
+
+    def create(self, run_id: str, message: str):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO runs VALUES (?, 'queued', NULL, ?, NULL, NULL, ?, ?)", (run_id, message, now, now)
+            )
+
+    def update(self, run_id: str, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self.lock:
+            self.conn.execute(
+                f"UPDATE runs SET {columns}, updated_at = ? WHERE run_id = ?", (*fields.values(), time.time(), run_id)
+            )
+
+    def fail_unfinished(self, error: str) -> list[str]:
+        """Marks every queued or running run failed, returns their run_ids."""
+        with self.lock:
+            run_ids = [row[0] for row in self.conn.execute("SELECT run_id FROM runs WHERE status IN ('queued', 'running')")]
+            self.conn.execute(
+                "UPDATE runs SET status = 'failed', message = 'failed', error = ?, updated_at = ? "
+                "WHERE status IN ('queued', 'running')",
+                (error, time.time()),
+            )
+        return run_ids
+
+    def get(self, run_id: str) -> dict | None:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT run_id, status, stage, message, result, error, created_at, updated_at FROM runs WHERE run_id = ?",
+                (run_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("run_id", "status", "stage", "message", "result", "error", "created_at", "updated_at")
+        status = dict(zip(keys, row))
+        status["result"] = json.loads(status["result"]) if status["result"] else None
+        return status
+
+
+class Run:
+    """Handle passed to the pipeline: stage reporting and cancellation checks."""
+
+    def __init__(self, run_id: str, store: RunStore, bus=None):
+        self.run_id = run_id
+        self.store = store
+        self.bus = bus
+        self.cancelled = threading.Event()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise Cancelled(self.run_id)
+
+    def emit(self, type: str, **data):
+        if self.bus is not None:
+            self.bus.publish(self.run_id, {"type": type, **data})
+
+    def stage(self, name: str, message: str = ""):
+        self.check()
+        message = message or f"{name}..."
+        self.store.update(self.run_id, stage=name, message=message)
+        self.emit("stage", stage=name, message=message)
+
+
+class JobQueue:
+    def __init__(self, max_workers: int = 4, max_pending: int = 64, store: RunStore | None = None, bus=None):
+        self.store = store or RunStore()
+        self.bus = bus  # events.EventBus, status changes and stage events are published there
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="run")
+        self.max_pending = max_pending
+        self.lock = threading.Lock()
+        self.active = {}  # run_id -> (Run, Future), queued and running only
+        # no worker of this process owns them
+        for run_id in self.store.fail_unfinished("server restarted"):
+            if self.bus is not None:
+                self.bus.publish(run_id, {"type": "status", "status": "failed"})
+            self._finished(run_id)
+
+    def submit(self, run_id: str, fn, *args, message: str = "queued") -> dict:
+        run = Run(run_id, self.store, self.bus)
+        with self.lock:
+            if len(self.active) >= self.max_pending:
+                raise QueueFull(f"{len(self.active)} runs already waiting")
+            self.store.create(run_id, message)
+            self.active[run_id] = (run, self.pool.submit(self._execute, run, fn, args))
+        return self.store.get(run_id)
+
+    def _execute(self, run: Run, fn, args):
+        try:
+            run.check()
+            self.store.update(run.run_id, status="running")
+            run.emit("status", status="running")
+            result = fn(run, *args)
+            self.store.update(run.run_id, status="succeeded", stage=None, message="done", result=result)
+        except Cancelled:
+            self.store.update(run.run_id, status="cancelled", message="cancelled")
+        except Exception as e:
+            logger.exception("run %s failed", run.run_id)
+            self.store.update(run.run_id, status="failed", message="failed", error=str(e))
+        finally:
+            with self.lock:
+                self.active.pop(run.run_id, None)
+            self._finished(run.run_id)
+
+    def _finished(self, run_id: str):
+        if self.bus is not None:
+            status = self.store.get(run_id)
+            self.bus.publish(run_id, {"type": "end", **status})
+
+    def status(self, run_id: str) -> dict | None:
+        return self.store.get(run_id)
+
+    def cancel(self, run_id: str) -> dict | None:
+        with self.lock:
+            entry = self.active.get(run_id)
+        if entry:
+            run, future = entry
+            run.cancelled.set()
+            if future.cancel():
+                # never started, _execute will not run to record it
+                with self.lock:
+                    self.active.pop(run_id, None)
+                self.store.update(run_id, status="cancelled", message="cancelled")
+                self._finished(run_id)
+        return self.store.get(run_id)
+
+    def shutdown(self):
+        with self.lock:
+            run_ids = list(self.active)
+        for run_id in run_ids:
+            self.cancel(run_id)
+        self.pool.shutdown(wait=False)
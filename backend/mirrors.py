@@ -0,0 +1,149 @@
+"""
+Docstring for backend.mirrors
+Local mirror cache for /analyze/github, one bare partial clone per repository.
+
+- mirrors live in cache/mirrors/<key>.git, the key is the normalized url
+  (scheme, credentials, case of the host, trailing / and .git do not matter)
+- the first run clones with --filter=blob:none and --depth, blobs are fetched lazily on checkout
+- later runs only fetch what changed, and not at all within MIRROR_TTL seconds
+- every run gets its own `git worktree` of the mirror, nothing is cloned twice
+
+- release() removes a run's worktree once its results are collected, prune() at startup removes
+  the worktrees of runs that never got that far (crash, restart)
+
+checkout("https://github.com/org/repo", "repos/<run_id>_repo")
+release("https://github.com/org/repo", "repos/<run_id>_repo")
+"""
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from RAGs.Storage import CACHE_DIR
+
+MIRRORS_DIR = CACHE_DIR / "mirrors"
+MIRROR_TTL = float(os.getenv("PATCHPILOT_MIRROR_TTL", "60"))
+CLONE_DEPTH = int(os.getenv("PATCHPILOT_CLONE_DEPTH", "1"))  # 0 = full history
+GIT_TIMEOUT = 600
+REFSPEC = "+refs/heads/*:refs/heads/*"
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def normalize_url(url: str) -> str:
+    url = url.strip()
+    scp = re.match(r"^[\w.-]+@([\w.-]+):(.+)$", url)  # git@github.com:org/repo.git
+    if scp:
+        host, path = scp.groups()
+    elif "://" in url:
+        parts = urlsplit(url)
+        host, path = parts.hostname or "", parts.path
+        if parts.scheme == "file":
+            host = ""
+    else:
+        host, path = "", os.path.abspath(url)
+    path = path.rstrip("/")
+    if path.endswith(".git"):
+        path = path[:-4]
+    return f"{host.lower()}/{path.lstrip('/')}" if host else path
+
+
+def mirror_path(url: str) -> Path:
+    normalized = normalize_url(url)
+    name = re.sub(r"[^\w.-]", "_", normalized.rsplit("/", 1)[-1]) or "repo"
+    return MIRRORS_DIR / f"{hashlib.sha256(normalized.encode()).hexdigest()[:16]}_{name}.git"
+
+
+def _lock(path: Path) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(str(path), threading.Lock())
+
+
+def git(*args, run=None, timeout: float = GIT_TIMEOUT):
+    """Runs git, polling so a cancelled run (jobs.Run) kills it."""
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            ["git", *args], stdout=subprocess.DEVNULL, stderr=stderr, env={**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+        )
+        deadline = time.monotonic() + timeout
+        while process.poll() is None:
+            cancelled = run is not None and run.cancelled.is_set()
+            if cancelled or time.monotonic() > deadline:
+                process.kill()
+                process.wait()
+                if run is not None:
+                    run.check()
+                raise TimeoutError(f"git {args[0]} took longer than {timeout}s")
+            time.sleep(0.1)
+        if process.returncode != 0:
+            stderr.seek(0)
+            raise RuntimeError(f"git {args[0]} failed: {stderr.read().decode(errors='replace').strip()}")
+
+
+def _depth() -> list[str]:
+    return [f"--depth={CLONE_DEPTH}"] if CLONE_DEPTH > 0 else []
+
+
+def ensure_mirror(url: str, run=None) -> Path:
+    path = mirror_path(url)
+    stamp = path / "patchpilot-fetched"
+    with _lock(path):
+        if not path.exists():
+            MIRRORS_DIR.mkdir(parents=True, exist_ok=True)
+            partial = path.with_name(path.name + ".partial")
+            shutil.rmtree(partial, ignore_errors=True)
+            git("clone", "--bare", "--filter=blob:none", *_depth(), "--", url, str(partial), run=run)
+            git("-C", str(partial), "config", "remote.origin.fetch", REFSPEC, run=run)
+            # only a complete clone gets the real name
+            partial.rename(path)
+        elif not stamp.exists() or time.time() - stamp.stat().st_mtime > MIRROR_TTL:
+            git("-C", str(path), "fetch", "--prune", "--filter=blob:none", *_depth(), "origin", REFSPEC, run=run)
+        stamp.touch()
+    return path
+
+
+def checkout(url: str, target_dir: str, ref: str = "HEAD", run=None) -> str:
+    """A detached worktree of the mirror at target_dir."""
+    path = ensure_mirror(url, run=run)
+    with _lock(path):
+        git("-C", str(path), "worktree", "add", "--detach", os.path.abspath(target_dir), ref, run=run)
+    return target_dir
+
+
+def release(url: str, target_dir: str):
+    path = mirror_path(url)
+    with _lock(path):
+        try:
+            git("-C", str(path), "worktree", "remove", "--force", os.path.abspath(target_dir))
+        except RuntimeError:
+            # never checked out (clone failed) or already half gone
+            shutil.rmtree(target_dir, ignore_errors=True)
+            if path.exists():
+                git("-C", str(path), "worktree", "prune")
+
+
+def prune() -> int:
+    """Removes every worktree of every mirror and returns how many, only safe while no run is active."""
+    removed = 0
+    if not MIRRORS_DIR.exists():
+        return removed
+    for path in MIRRORS_DIR.iterdir():
+        with _lock(path):
+            if path.name.endswith(".partial"):
+                # a clone interrupted before it got its real name
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            for admin in (path / "worktrees").glob("*/gitdir"):
+                # gitdir holds the path of the worktree's .git file
+                shutil.rmtree(Path(admin.read_text().strip()).parent, ignore_errors=True)
+                removed += 1
+            if (path / "worktrees").exists():
+                git("-C", str(path), "worktree", "prune")
+    return removed
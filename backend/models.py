@@ -23,3 +23,20 @@ class AnalysisResponse(BaseModel):
     run_id: str
     status: str
     message: str
+
+class RunStatus(BaseModel):
+    run_id: str
+    status: str # queued | running | succeeded | failed | cancelled
+    stage: Optional[str] = None
+    message: str
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+class UploadSession(BaseModel):
+    upload_id: str
+    filename: str
+    offset: int # bytes received so far, the next PUT starts here
+    size: Optional[int] = None
+    complete: bool = False
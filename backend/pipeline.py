@@ -0,0 +1,229 @@
+"""
+Docstring for backend.pipeline
+The stages of one analysis run, executed by a JobQueue worker:
+
+clone (github runs only, from the mirror cache) -> ingest -> retrieve rules -> match files -> patch -> verify
+
+- the rag modules are imported inside the stages, app.py starts without the llm stack loaded
+- without a library / version pair the run stops after ingestion and reports the manifest
+- patched files are written to runs/<run_id>/patched/<path relative to the project>, the sources stay untouched
+- only added / changed files are matched and patched, unchanged files reuse their ResultStore entry for the same rule set
+- verify: patched files with a VERIFY_PROFILES entry go through the reflection loop (Reflection.reflect),
+  failures are fed back to the planner and known failures are fixed from the fix cache.
+  With docker the patched modules are imported in the project's dependency image (Sandbox), so the loop sees
+  real ImportError / AttributeError failures; without it only a syntax check runs, project code never runs on the host
+- besides stages, runs emit "document" and "page_cache" events while retrieving and "token" events while planning / generating
+"""
+import re
+import shutil
+from pathlib import Path
+
+from jobs import Run
+from mirrors import checkout, normalize_url, release
+
+BASE_DIR = Path(__file__).resolve().parent
+RUNS_DIR = BASE_DIR / "runs"
+# per language: the dependency image (language, version, install preset) and the run profile used in it,
+# and the profile for the local fallback, which must not execute project code
+# "upgrade" installs the migration's target version over the one the project pins
+VERIFY_PROFILES = {
+    "python": {
+        "image": ("python", "3.11", "python-verify"),
+        "upgrade": 'RUN pip install --no-cache-dir "{library}=={version}"',
+        "sandbox": "python-imports",
+        "local": "python-syntax",
+    },
+}
+PACKAGE_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+TARGET_VERSION = re.compile(r"\d+(?:\.\d+)*(?:\.(?:x|\*))?")
+
+
+def clone(run: Run, url: str, target_dir: str):
+    run.stage("clone", f"checking out {url}")
+    # a worktree of the local mirror, only the first run of a repository goes to the network
+    checkout(url, target_dir, run=run)
+
+
+def analyze(run: Run, source_dir: str, project: str, library: str | None = None,
+            from_version: str | None = None, to_version: str | None = None) -> dict:
+    from RAGs.ProjectIngestion import ingest_incremental
+    from RAGs.SymbolIndex import SymbolIndex
+
+    run.stage("ingest", f"ingesting {project}")
+    manifest, delta = ingest_incremental(source_dir, project)
+    try:
+        index = SymbolIndex()
+        index.index_records(project, manifest.files)
+        result = {
+            "files": len(manifest.files),
+            "code_files": len(manifest.code_files),
+            "skipped": dict(manifest.skipped),
+            "added": len(delta.added),
+            "changed": len(delta.changed),
+            "removed": len(delta.removed),
+        }
+        if not (library and from_version and to_version):
+            return result
+        return migrate(run, source_dir, project, manifest, delta, index, result, library, from_version, to_version)
+    finally:
+        # archive members are read from their extracted copies until here
+        manifest.close()
+
+
+def migrate(run: Run, source_dir: str, project: str, manifest, delta, index, result: dict,
+            library: str, from_version: str, to_version: str) -> dict:
+    from RAGs.PatchGenerator import patch_code
+    from RAGs.ProjectIngestion import ResultStore, _run_relative, read_text
+    from RAGs.RuleIndex import fingerprint, parse_rules
+    from RAGs.RuleMatcher import match_files, rules_by_file
+    from RAGs.RuleStore import get_rules
+
+    run.stage("retrieve", f"rules for {library} {from_version} -> {to_version}")
+    rules = get_rules(
+        library, from_version, to_version,
+        on_document=lambda doc: run.emit("document", url=doc.get("url"), title=doc.get("title"), chunk_index=doc.get("chunk_index")),
+        check=run.check,
+        on_stats=lambda stats: run.emit("page_cache", **stats),
+    )
+    records = [r for r in manifest.files if r.lang]
+    # unchanged files keep the outcome of an earlier run with the same rule set, only the rest is matched and patched
+    rules_key = fingerprint(parse_rules(rules))
+    results = ResultStore()
+    results.forget(project, delta.removed)
+    fresh = {_run_relative(r) for r in delta.files}
+    earlier = results.lookup(project, rules_key, {_run_relative(r): r.sha256 for r in records if _run_relative(r) not in fresh})
+    todo = [r for r in records if _run_relative(r) not in earlier]
+    run.stage("match", f"matching {len(rules.get('final_rules', []))} rules against {len(todo)} files")
+    matches = match_files(rules, todo)
+    by_file = rules_by_file(rules, matches)
+    result["rules"] = len(rules.get("final_rules", []))
+    result["reused_files"] = len(earlier)
+
+    patched_dir = RUNS_DIR / run.run_id / "patched"
+    patched = []
+    to_verify = {}  # (lang, project root) -> {project relative path: (rel_path, code)}
+    by_path = {r.rel_path: r for r in records}
+    for record in records:
+        code = earlier.get(_run_relative(record))
+        if code is None:
+            continue
+        target = patched_dir / _run_relative(record)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(code, encoding="utf-8")
+        patched.append(record.rel_path)
+        run.emit("patched", file=record.rel_path, reused=True)
+    for i, (rel_path, file_rules) in enumerate(sorted(by_file.items()), 1):
+        run.stage("patch", f"patching {rel_path} ({i}/{len(by_file)})")
+        record = by_path[rel_path]
+        code = read_text(record)
+        new_code = patch_code(
+            rules, code, within=file_rules,
+            on_token=lambda stage, text, path=rel_path: run.emit("token", file=path, stage=stage, text=text),
+            subclasses=lambda base: index.subclasses(project, base),
+        )
+        if new_code == code:
+            continue
+        target = patched_dir / _run_relative(record)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(new_code, encoding="utf-8")
+        patched.append(rel_path)
+        run.emit("patched", file=rel_path)
+        if record.lang in VERIFY_PROFILES:
+            to_verify.setdefault((record.lang, _project_root(record, source_dir)), {})[_run_relative(record)] = (rel_path, new_code)
+    result["matched_files"] = sorted(set(by_file) | set(patched))
+    result["patched_files"] = sorted(patched)
+    result["patched_dir"] = str(patched_dir)
+    failing = {}
+    if to_verify:
+        result["verification"] = verify_patched(run, patched_dir, to_verify, by_file, rules, (library, to_version))
+        failing = result["verification"]["failing"]
+    # files still failing verification are patched again next time
+    results.record(project, rules_key, [
+        (_run_relative(r), r.sha256, (patched_dir / _run_relative(r)).read_text(encoding="utf-8") if r.rel_path in patched else None)
+        for r in todo if r.rel_path not in failing
+    ])
+    return result
+
+
+def _project_root(record, source_dir: str) -> str:
+    # archive members are verified in their extracted copy, the upload dir only holds the archive
+    if record.extracted:
+        return record.extracted[: -len(record.rel_path.partition("!/")[2]) - 1]
+    return source_dir
+
+
+def _upgrade_steps(config: dict, target) -> tuple[str, ...]:
+    library, version = target or (None, None)
+    # both end up in a Dockerfile line, anything but a plain name and version is left out
+    if not (library and version and PACKAGE_NAME.fullmatch(library) and TARGET_VERSION.fullmatch(version)):
+        return ()
+    version = re.sub(r"\.x$", ".*", version)
+    if "*" not in version and version.count(".") < 2:
+        # "2" / "2.5" name a release series
+        version += ".*"
+    return (config["upgrade"].format(library=library, version=version),)
+
+
+def verification_backend(run: Run, lang: str, project_dir: str, target=None):
+    """
+    (backend, run profile): the dependency image when docker is usable, a local check of the file otherwise.
+    target: (library, to_version) of the migration, installed in the image over the project's pinned version.
+    """
+    from RAGs.Sandbox import SandboxError, get_pool
+    from RAGs.Verifier import DockerBackend, LocalBackend
+
+    config = VERIFY_PROFILES[lang]
+    try:
+        pool = get_pool()
+        image = pool.image_for(*config["image"], project_dir, extra_steps=_upgrade_steps(config, target))
+        return DockerBackend(pool, image, project_dir), config["sandbox"]
+    except SandboxError as e:
+        run.emit("verify_fallback", language=lang, profile=config["local"], reason=str(e))
+        return LocalBackend(project_dir), config["local"]
+
+
+def verify_patched(run: Run, patched_dir: Path, to_verify: dict, by_file: dict, rules=None, target=None) -> dict:
+    from RAGs.Reflection import reflect
+
+    summary = {"passed": [], "failing": {}, "iterations": 0, "tokens": 0, "profiles": {}}
+    for (lang, project_dir), files in to_verify.items():
+        run.stage("verify", f"verifying {len(files)} {lang} files")
+        backend, profile = verification_backend(run, lang, project_dir, target)
+        summary["profiles"][lang] = profile
+        try:
+            report = reflect(
+                {path: code for path, (_, code) in files.items()},
+                {path: by_file[rel_path] for path, (rel_path, _) in files.items()},
+                backend, profile,
+                on_event=lambda type, file, **data: run.emit(type, file=files[file][0], **data),
+                check=run.check,
+                rule_set=rules,
+            )
+        finally:
+            backend.close()
+        for path, code in report["files"].items():
+            if code != files[path][1]:
+                (patched_dir / path).write_text(code, encoding="utf-8")
+        summary["passed"] += [files[path][0] for path in report["passed"]]
+        summary["failing"].update({files[path][0]: signature for path, signature in report["failing"].items()})
+        summary["iterations"] = max(summary["iterations"], report["iterations"])
+        summary["tokens"] += report["tokens"]
+    return summary
+
+
+def github_run(run: Run, url: str, target_dir: str, library=None, from_version=None, to_version=None) -> dict:
+    try:
+        clone(run, url, target_dir)
+        return analyze(run, target_dir, normalize_url(url), library, from_version, to_version)
+    finally:
+        # patched files live under runs/<run_id>, the worktree is not needed after analyze()
+        release(url, target_dir)
+
+
+def upload_run(run: Run, upload_dir: str, project: str, library=None, from_version=None, to_version=None) -> dict:
+    try:
+        return analyze(run, upload_dir, project, library, from_version, to_version)
+    finally:
+        # the run's link to the archive, the blob itself stays until UploadStore.collect()
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
@@ -0,0 +1,26 @@
+import zipfile
+
+import pytest
+
+from RAGs import ArchiveReader as archive_reader
+from RAGs.ArchiveReader import read_member
+
+
+def test_read_member_closes_the_archive_when_it_returns_early(tmp_path, monkeypatch):
+    archive = tmp_path / "project.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("a.py", "a = 1\n")
+        zf.writestr("b.py", "b = 1\n")
+    generators = []
+    iter_members = archive_reader.iter_members
+
+    def keep(*args, **kwargs):
+        # hold on to the generator so only an explicit close can finish it
+        generators.append(iter_members(*args, **kwargs))
+        return generators[-1]
+
+    monkeypatch.setattr(archive_reader, "iter_members", keep)
+    assert read_member(archive, "a.py") == b"a = 1\n"
+    with pytest.raises(KeyError):
+        read_member(archive, "missing.py")
+    assert [g.gi_frame for g in generators] == [None, None]
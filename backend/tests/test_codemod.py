@@ -0,0 +1,90 @@
+from RAGs.Codemod import apply_rewrites, classify_rule, codemod
+
+PARSE_OBJ = {"rule_id": "parse-obj", "rule_text": "Replace `BaseModel.parse_obj(data)` with `BaseModel.model_validate(data)`.",
+             "sources": [{"url": "https://docs.pydantic.dev/latest/migration/"}]}
+JSON = {"rule_id": "json", "rule_text": "BaseModel.json() must be replaced with BaseModel.model_dump_json()", "sources": []}
+COPY = {"rule_id": "copy", "rule_text": "BaseModel.copy() must be replaced with BaseModel.model_copy()", "sources": []}
+FROM_ORM = {"rule_id": "from-orm", "rule_text": "Replace `User.from_orm(row)` with `User.model_validate(row, from_attributes=True)`",
+            "sources": []}
+
+
+def test_classify_rule_keeps_the_owner():
+    rewrite = classify_rule(PARSE_OBJ)
+    assert (rewrite.owner, rewrite.old, rewrite.new, rewrite.call) == ("BaseModel", "parse_obj", "model_validate", True)
+
+
+def test_classify_rule_rejects_rules_without_a_class():
+    assert classify_rule({"rule_text": "Replace `.json()` with `.model_dump_json()`"}) is None
+    assert classify_rule({"rule_text": "Replace `User.json()` with `User.model_dump_json()` only if the model is exported"}) is None
+
+
+def test_class_and_subclass_receivers_are_rewritten():
+    code = (
+        "from pydantic import BaseModel\n"
+        "class User(BaseModel):\n"
+        "    id: int\n"
+        "class Admin(User):\n"
+        "    pass\n"
+        "a = User.parse_obj(data)\n"
+        "b = Admin.parse_obj(data)\n"
+    )
+    result, remaining = codemod([PARSE_OBJ], code)
+    assert remaining == []
+    assert "a = User.model_validate(data)  # Replace" in result
+    assert "b = Admin.model_validate(data)  # Replace" in result
+    assert "Source: https://docs.pydantic.dev/latest/migration/" in result
+
+
+def test_non_model_json_and_copy_are_left_unchanged():
+    code = (
+        "import requests\n"
+        "payload = requests.get(url).json()\n"
+        "options = {'a': 1}.copy()\n"
+        "def load(data):\n"
+        "    return data.copy()\n"
+    )
+    result, remaining = codemod([JSON, COPY], code)
+    assert result == code
+    assert {r["rule_id"] for r in remaining} == {"json", "copy"}
+
+
+def test_instances_resolve_through_annotations_constructors_and_self():
+    code = (
+        "from pydantic import BaseModel\n"
+        "class User(BaseModel):\n"
+        "    def dump(self):\n"
+        "        return self.json()\n"
+        "def serialize(user: User) -> str:\n"
+        "    return user.json()\n"
+        "fresh = User(id=1)\n"
+        "text = fresh.json()\n"
+        "other = response.json()\n"
+    )
+    result, remaining = codemod([JSON], code)
+    assert "return self.model_dump_json()" in result
+    assert "return user.model_dump_json()" in result
+    assert "text = fresh.model_dump_json()" in result
+    assert "other = response.json()\n" in result
+    # response.json() is still open, the llm gets the rule
+    assert [r["rule_id"] for r in remaining] == ["json"]
+
+
+def test_project_subclasses_come_from_the_caller():
+    code = "from app.models import User\nuser = User.from_orm(row)\n"
+    result, remaining = codemod([FROM_ORM], code, subclasses=lambda base: {base})
+    assert "User.model_validate(row, from_attributes=True)" in result
+    assert remaining == []
+    code = "from app.models import Account\naccount = Account.from_orm(row)\n"
+    result, remaining = codemod([FROM_ORM], code, subclasses=lambda base: {base, "Account"})
+    assert "Account.model_validate(row, from_attributes=True)" in result
+
+
+def test_keywords_go_after_the_last_argument():
+    code = "user = User.from_orm(\n    row,\n)\n"
+    result, _ = codemod([FROM_ORM], code)
+    assert "row, from_attributes=True" in result
+    assert result.rstrip().endswith(")")
+
+
+def test_apply_rewrites_rejects_code_that_is_not_python():
+    assert apply_rewrites("def (:\n", [classify_rule(PARSE_OBJ)]) == (None, [])
@@ -0,0 +1,70 @@
+import asyncio
+
+from events import EventBus
+
+
+def drain(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return events
+
+
+def test_late_subscribers_get_the_history_after_their_last_event_id():
+    bus = EventBus()
+
+    async def main():
+        for stage in ("clone", "ingest", "retrieve"):
+            bus.publish("run", {"type": "stage", "stage": stage})
+        bus.publish("run", {"type": "token", "text": "x"})
+        everything = drain(bus.subscribe("run"))
+        resumed = bus.subscribe("run", after=2)
+        bus.publish("run", {"type": "stage", "stage": "match"})
+        await asyncio.sleep(0)
+        return everything, drain(resumed)
+
+    everything, resumed = asyncio.run(main())
+    # tokens are never replayed
+    assert [(e["id"], e["stage"]) for e in everything] == [(1, "clone"), (2, "ingest"), (3, "retrieve")]
+    assert [(e["id"], e["stage"]) for e in resumed] == [(3, "retrieve"), (5, "match")]
+
+
+def test_a_slow_subscriber_loses_tokens_and_then_the_oldest_events():
+    bus = EventBus(queue_size=3)
+
+    async def main():
+        queue = bus.subscribe("run")
+        bus.publish("run", {"type": "stage", "stage": "plan"})
+        for i in range(5):
+            bus.publish("run", {"type": "token", "text": str(i)})
+        bus.publish("run", {"type": "stage", "stage": "patch"})
+        bus.publish("run", {"type": "end", "status": "succeeded"})
+        await asyncio.sleep(0)
+        assert queue.qsize() == 3
+        return queue, drain(queue)
+
+    queue, received = asyncio.run(main())
+    # two tokens fit, the other three were dropped; the stage and the end pushed out the oldest events
+    assert queue.dropped == 3
+    assert [e["type"] for e in received] == ["token", "stage", "end"]
+    assert received[-1]["status"] == "succeeded"
+
+
+def test_the_stream_ends_with_the_end_event():
+    from fastapi.testclient import TestClient
+
+    import app
+
+    app.jobs.store.create("sse-run", "queued")
+    app.events.publish("sse-run", {"type": "stage", "stage": "ingest"})
+    app.events.publish("sse-run", {"type": "end", "status": "succeeded"})
+    app.events.publish("sse-run", {"type": "stage", "stage": "never sent"})
+    client = TestClient(app.app)
+    with client.stream("GET", "/runs/sse-run/events") as response:
+        body = "".join(response.iter_text())
+    assert body.count("data: ") == 3
+    assert "id: 2\ndata: " in body and "never sent" not in body
+
+    with client.stream("GET", "/runs/sse-run/events", headers={"Last-Event-ID": "1"}) as response:
+        body = "".join(response.iter_text())
+    assert "ingest" not in body and "id: 2\n" in body
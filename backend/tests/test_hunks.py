@@ -0,0 +1,60 @@
+import pytest
+
+from RAGs.Hunks import PatchError, affected_regions, apply_diff, parse_diff, split_regions
+
+CODE = (
+    "import json\n"
+    "\n"
+    "def load(data):\n"
+    "    return User.parse_obj(data)\n"
+    "\n"
+    "# dumps a user\n"
+    "def dump(user):\n"
+    "    return user.json()\n"
+)
+
+
+def test_regions_cover_the_file_and_comments_go_with_the_next_region():
+    regions = split_regions(CODE)
+    assert [(r.start, r.end) for r in regions] == [(1, 1), (2, 4), (5, 8)]
+    assert "".join(r.text for r in regions) == CODE
+    assert regions[2].text.startswith("\n# dumps a user\n")
+
+
+def test_only_regions_with_a_rule_symbol_are_affected():
+    rules = [{"rule_id": "parse-obj", "rule_text": "Replace `BaseModel.parse_obj()` with `BaseModel.model_validate()`"}]
+    assert [r.start for r in affected_regions(split_regions(CODE), rules)] == [2]
+
+
+def test_removed_lines_starting_with_dashes_are_kept_inside_a_hunk():
+    text = "x = 1\n-- not a header\ny = 2\n"
+    diff = "--- a/f.sql\n+++ b/f.sql\n@@ -1,3 +1,3 @@\n x = 1\n--- not a header\n+-- replaced\n y = 2\n"
+    [hunk] = parse_diff(diff)
+    assert hunk.old == ["x = 1", "-- not a header", "y = 2"]
+    assert apply_diff(text, diff) == "x = 1\n-- replaced\ny = 2\n"
+
+
+def test_file_headers_between_hunks_are_skipped():
+    diff = "@@ -1,1 +1,1 @@\n-a\n+b\n--- a/other\n+++ b/other\n@@ -3 +3 @@\n-c\n+d\n"
+    assert [(h.old, h.new) for h in parse_diff(diff)] == [(["a"], ["b"]), (["c"], ["d"])]
+
+
+def test_hunks_are_applied_by_content_near_their_header():
+    region = split_regions(CODE)[2]
+    diff = "```diff\n@@ -7,2 +7,2 @@\n def dump(user):\n-    return user.json()\n+    return user.model_dump_json()\n```\n"
+    assert apply_diff(region.text, diff, first_line=region.start).endswith("    return user.model_dump_json()\n")
+
+
+def test_hunks_that_do_not_match_are_rejected():
+    with pytest.raises(PatchError):
+        apply_diff(CODE, "@@ -1 +1 @@\n-import yaml\n+import toml\n")
+    with pytest.raises(PatchError):
+        parse_diff("just prose, no diff")
+
+
+def test_pure_insertions_go_after_the_line_in_their_header():
+    assert apply_diff("a\nb\nc\n", "@@ -2,0 +3,1 @@\n+X\n") == "a\nb\nX\nc\n"
+    assert apply_diff("a\nb\nc\n", "@@ -0,0 +1,1 @@\n+X\n") == "X\na\nb\nc\n"
+    assert apply_diff("a\nb\nc\n", "@@ -3,0 +4,1 @@\n+X\n") == "a\nb\nc\nX\n"
+    # a region starting at line 5: -4,0 is its top
+    assert apply_diff("e\nf\n", "@@ -4,0 +5,1 @@\n+X\n", first_line=5) == "X\ne\nf\n"
@@ -0,0 +1,119 @@
+import os
+import re
+import zipfile
+
+from RAGs.ProjectIngestion import (
+    ManifestStore, ResultStore, _run_relative, gitignore_regex, ingest_directory, ingest_incremental, read_text,
+)
+
+
+def test_incremental_ingestion_reports_the_delta(tmp_path):
+    store = ManifestStore(f"{tmp_path.name}-manifests.sqlite")
+    (tmp_path / "a.py").write_text("a = 1\n")
+    (tmp_path / "b.py").write_text("b = 1\n")
+    _, delta = ingest_incremental(tmp_path, "project", store)
+    assert sorted(r.rel_path for r in delta.added) == ["a.py", "b.py"]
+    (tmp_path / "b.py").write_text("b = 2\n")
+    (tmp_path / "c.py").write_text("c = 1\n")
+    (tmp_path / "a.py").unlink()
+    _, delta = ingest_incremental(tmp_path, "project", store)
+    assert [r.rel_path for r in delta.added] == ["c.py"]
+    assert [r.rel_path for r in delta.changed] == ["b.py"]
+    assert delta.removed == ["a.py"]
+
+
+def test_results_are_reused_only_for_the_same_hash_and_rules(tmp_path):
+    results = ResultStore(f"{tmp_path.name}-results.sqlite")
+    results.record("project", "rules-1", [("a.py", "sha-a", "patched a\n"), ("b.py", "sha-b", None)])
+    assert results.lookup("project", "rules-1", {"a.py": "sha-a", "b.py": "sha-b"}) == {"a.py": "patched a\n", "b.py": None}
+    # changed content, another rule set or another project all miss
+    assert results.lookup("project", "rules-1", {"a.py": "sha-a2"}) == {}
+    assert results.lookup("project", "rules-2", {"a.py": "sha-a"}) == {}
+    assert results.lookup("other", "rules-1", {"a.py": "sha-a"}) == {}
+    results.forget("project", ["a.py"])
+    assert results.lookup("project", "rules-1", {"a.py": "sha-a", "b.py": "sha-b"}) == {"b.py": None}
+
+
+def test_archive_members_are_compared_below_the_archive(tmp_path):
+    with zipfile.ZipFile(tmp_path / "project.zip", "w") as archive:
+        archive.writestr("src/app.py", "x = 1\n")
+    store = ManifestStore(f"{tmp_path.name}-manifests.sqlite")
+    manifest, _ = ingest_incremental(tmp_path, "upload:sha", store)
+    manifest.close()
+    [record] = manifest.files
+    assert record.rel_path == "project.zip!/src/app.py"
+    assert _run_relative(record) == "src/app.py"
+
+
+def test_archive_members_are_read_from_disk_and_follow_gitignore(tmp_path):
+    with zipfile.ZipFile(tmp_path / "project.zip", "w") as archive:
+        # the .gitignore comes after the files it covers
+        archive.writestr("project/src/app.py", "x = 1\n")
+        archive.writestr("project/generated/models.py", "y = 1\n")
+        archive.writestr("project/src/local_settings.py", "z = 1\n")
+        archive.writestr("project/node_modules/lib.js", "module.exports = 1\n")
+        archive.writestr("project/.gitignore", "generated/\nlocal_*.py\n")
+    manifest = ingest_directory(tmp_path)
+    try:
+        assert [r.rel_path for r in manifest.files] == ["project.zip!/project/src/app.py"]
+        [record] = manifest.files
+        assert record.extracted.startswith(manifest.scratch)
+        assert read_text(record) == "x = 1\n"
+        assert manifest.skipped["ignored_dir"] == 1 and manifest.skipped["ignored_file"] == 1
+    finally:
+        scratch = manifest.scratch
+        manifest.close()
+    assert not os.path.exists(scratch)
+
+
+def test_directories_without_archives_keep_no_scratch_dir(tmp_path):
+    (tmp_path / "app.py").write_text("x = 1\n")
+    manifest = ingest_directory(tmp_path)
+    assert manifest.scratch is None
+    assert read_text(manifest.files[0]) == "x = 1\n"
+
+
+def test_gitignore_patterns():
+    cases = [
+        ("*.log", "debug.log", True),
+        ("doc/*.txt", "doc/notes.txt", True),
+        ("doc/*.txt", "doc/sub/notes.txt", False),
+        ("**/logs", "logs", True),
+        ("**/logs", "a/b/logs", True),
+        ("a/**/b", "a/b", True),
+        ("a/**/b", "a/x/y/b", True),
+        ("a/**/b", "ab", False),
+        ("build/**", "build/x/y.py", True),
+        ("build/**", "build", False),
+        ("file?.py", "file1.py", True),
+        ("file?.py", "file/.py", False),
+        ("[!a]*.py", "b.py", True),
+        ("[!a]*.py", "a.py", False),
+        ("foo**bar", "fooxbar", True),
+        ("foo**bar", "foo/bar", False),
+        ("\\#secret", "#secret", True),
+        ("v1.0", "v1x0", False),
+    ]
+    for pattern, path, expected in cases:
+        assert bool(re.match(gitignore_regex(pattern), path)) is expected, (pattern, path)
+
+
+def test_gitignore_rules_in_nested_directories(tmp_path):
+    (tmp_path / ".gitignore").write_text("/top.py\n*.gen.py\n!keep.gen.py\n")
+    (tmp_path / "pkg" / "data").mkdir(parents=True)
+    (tmp_path / "pkg" / ".gitignore").write_text("data/\nsub/*.py\n")
+    for path in ["top.py", "a.gen.py", "keep.gen.py", "pkg/top.py", "pkg/data/x.py", "pkg/sub/y.py", "pkg/sub/deep/z.py"]:
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text("x = 1\n")
+    manifest = ingest_directory(tmp_path)
+    assert sorted(r.rel_path for r in manifest.files) == ["keep.gen.py", "pkg/sub/deep/z.py", "pkg/top.py"]
+
+
+def test_walk_errors_are_logged_and_counted(tmp_path, caplog):
+    (tmp_path / "broken.zip").write_bytes(b"not a zip archive")
+    (tmp_path / "app.py").write_text("x = 1\n")
+    manifest = ingest_directory(tmp_path)
+    manifest.close()
+    assert [r.rel_path for r in manifest.files] == ["app.py"]
+    assert manifest.skipped["rejected_archive"] == 1 and manifest.skipped["error"] == 1
+    assert "broken.zip" in caplog.text
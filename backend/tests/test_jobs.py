@@ -0,0 +1,87 @@
+import threading
+import time
+
+from jobs import JobQueue, RunStore
+
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+
+    def publish(self, run_id, event):
+        self.events.append((run_id, event))
+
+    def of(self, run_id):
+        return [e for r, e in self.events if r == run_id]
+
+
+def wait_for(queue, run_id, status, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if queue.status(run_id)["status"] == status:
+            return queue.status(run_id)
+        time.sleep(0.01)
+    raise AssertionError(f"{run_id} is {queue.status(run_id)['status']}, not {status}")
+
+
+def test_a_run_reports_its_status_changes(tmp_path):
+    bus = Recorder()
+    queue = JobQueue(max_workers=2, store=RunStore(f"{tmp_path.name}-runs.sqlite"), bus=bus)
+    assert queue.submit("ok", lambda run, x: {"x": x}, 1)["run_id"] == "ok"
+    queue.pool.shutdown(wait=True)
+    status = queue.status("ok")
+    assert (status["status"], status["result"]) == ("succeeded", {"x": 1})
+    assert [e["type"] for e in bus.of("ok")] == ["status", "end"]
+    assert bus.of("ok")[-1]["status"] == "succeeded"
+
+
+def test_a_failing_run_keeps_its_error(tmp_path):
+    def boom(run):
+        raise ValueError("broken")
+    queue = JobQueue(max_workers=1, store=RunStore(f"{tmp_path.name}-runs.sqlite"))
+    queue.submit("bad", boom)
+    queue.pool.shutdown(wait=True)
+    status = queue.status("bad")
+    assert (status["status"], status["error"]) == ("failed", "broken")
+
+
+def test_cancelling_queued_and_running_runs(tmp_path):
+    queue = JobQueue(max_workers=1, store=RunStore(f"{tmp_path.name}-runs.sqlite"))
+    started = threading.Event()
+
+    def loop(run):
+        started.set()
+        while True:
+            run.check()
+            time.sleep(0.01)
+    try:
+        queue.submit("running", loop)
+        queue.submit("waiting", lambda run: {})
+        started.wait(5)
+        # the only worker is busy, the second run never starts
+        assert queue.cancel("waiting")["status"] == "cancelled"
+        queue.cancel("running")
+        wait_for(queue, "running", "cancelled")
+        assert queue.active == {}
+    finally:
+        queue.shutdown()
+
+
+def test_unfinished_runs_of_an_earlier_process_are_failed(tmp_path):
+    store = RunStore(f"{tmp_path.name}-runs.sqlite")
+    store.create("queued", "queued")
+    store.create("running", "queued")
+    store.update("running", status="running")
+    store.create("done", "queued")
+    store.update("done", status="succeeded")
+    bus = Recorder()
+    queue = JobQueue(max_workers=1, store=store, bus=bus)
+    try:
+        for run_id in ("queued", "running"):
+            status = queue.status(run_id)
+            assert (status["status"], status["error"]) == ("failed", "server restarted")
+            assert [e["type"] for e in bus.of(run_id)] == ["status", "end"]
+        assert queue.status("done")["status"] == "succeeded"
+        assert bus.of("done") == []
+    finally:
+        queue.shutdown()
@@ -0,0 +1,70 @@
+import asyncio
+import gc
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+from RAGs import LLMClient
+from RAGs.LLMClient import chat, chat_many, close_async_clients, get_async_client, metered, metering, token_offsets
+
+
+def test_async_clients_are_per_loop_and_go_away_with_it():
+    async def clients():
+        return get_async_client("model-a"), get_async_client("model-a"), get_async_client("model-b")
+
+    first, same, other = asyncio.run(clients())
+    assert first is same and first is not other
+    again, _, _ = asyncio.run(clients())
+    assert again is not first
+    gc.collect()
+    assert len(LLMClient._async_clients) == 0
+
+
+def test_close_async_clients_drops_the_loops_clients():
+    async def main():
+        client = get_async_client("model-a")
+        await close_async_clients()
+        assert asyncio.get_running_loop() not in LLMClient._async_clients
+        fresh = get_async_client("model-a")
+        await close_async_clients()
+        return client is not fresh
+
+    assert asyncio.run(main())
+
+
+def test_token_offsets_without_a_tokenizer_follow_the_estimate():
+    assert token_offsets("a" * 10) == [0, 4, 8]
+    assert token_offsets("") == []
+
+
+class FakeClient:
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, **kwargs):
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=messages[-1]["content"].upper()))],
+            usage=SimpleNamespace(prompt_tokens=3, completion_tokens=2),
+        )
+
+
+def test_metered_counts_the_calls_of_pool_threads(monkeypatch):
+    monkeypatch.setattr(LLMClient, "get_client", lambda model: FakeClient())
+
+    def ask(text):
+        return chat("model-a", [{"role": "user", "content": text}], max_tokens=8, temperature=0.0, cache=False)
+
+    requests = [{"model": "model-a", "messages": [{"role": "user", "content": t}], "max_tokens": 8,
+                 "temperature": 0.0, "cache": False} for t in "abcd"]
+    with metered() as outer:
+        with metered() as usage:
+            assert chat_many(requests) == ["A", "B", "C", "D"]
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(metering(ask), "efgh"))
+            # a thread started without metering() is not this block's work
+            thread = threading.Thread(target=ask, args=("i",))
+            thread.start()
+            thread.join()
+        ask("j")
+    assert usage == {"calls": 8, "cached": 0, "prompt_tokens": 24, "completion_tokens": 16}
+    assert outer["calls"] == 9
@@ -0,0 +1,16 @@
+from langchain_core.documents import Document
+
+from RAGs.PageCache import PageCache
+
+
+def test_chunks_of_another_format_version_are_not_served(tmp_path):
+    name = f"{tmp_path.name}-pages.sqlite"
+    old = PageCache(name=name, version="1")
+    old.put("https://docs.example.com/migration", b"<html>v1</html>", [Document(page_content="old chunk")], etag='"a"')
+    assert old.get("https://docs.example.com/migration")["chunks"][0].page_content == "old chunk"
+    new = PageCache(name=name, version="2")
+    assert new.get("https://docs.example.com/migration") is None
+    assert new.body("https://docs.example.com/migration") is None
+    new.put("https://docs.example.com/migration", b"<html>v1</html>", [Document(page_content="new chunk")])
+    assert new.get("https://docs.example.com/migration")["chunks"][0].page_content == "new chunk"
+    assert old.get("https://docs.example.com/migration")["chunks"][0].page_content == "old chunk"
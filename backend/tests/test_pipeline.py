@@ -0,0 +1,48 @@
+import zipfile
+
+from pipeline import VERIFY_PROFILES, _project_root, _upgrade_steps, verification_backend
+from RAGs import Sandbox
+from RAGs.ProjectIngestion import ingest_directory
+from RAGs.Verifier import LocalBackend
+
+
+class Events:
+    def __init__(self):
+        self.events = []
+
+    def emit(self, type, **data):
+        self.events.append((type, data))
+
+
+def test_upgrade_steps_install_the_target_series():
+    config = VERIFY_PROFILES["python"]
+    assert _upgrade_steps(config, ("pydantic", "2.x")) == ('RUN pip install --no-cache-dir "pydantic==2.*"',)
+    assert _upgrade_steps(config, ("pydantic", "2")) == ('RUN pip install --no-cache-dir "pydantic==2.*"',)
+    assert _upgrade_steps(config, ("pydantic", "2.5.1")) == ('RUN pip install --no-cache-dir "pydantic==2.5.1"',)
+    # user input never reaches the Dockerfile unless it is a plain name and version
+    assert _upgrade_steps(config, ("pydantic; rm -rf /", "2")) == ()
+    assert _upgrade_steps(config, ("pydantic", "2 && curl x")) == ()
+    assert _upgrade_steps(config, None) == ()
+
+
+def test_without_docker_only_the_local_syntax_profile_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(Sandbox, "DOCKER", str(tmp_path / "no-docker"))
+    monkeypatch.setattr(Sandbox, "_pool", None)
+    run = Events()
+    backend, profile = verification_backend(run, "python", str(tmp_path), ("pydantic", "2.x"))
+    assert isinstance(backend, LocalBackend) and profile == "python-syntax"
+    assert run.events[0][0] == "verify_fallback"
+
+
+def test_archive_members_are_verified_in_their_extracted_copy(tmp_path):
+    with zipfile.ZipFile(tmp_path / "project.zip", "w") as archive:
+        archive.writestr("app/models.py", "x = 1\n")
+    (tmp_path / "main.py").write_text("y = 1\n")
+    manifest = ingest_directory(tmp_path)
+    try:
+        roots = {r.rel_path: _project_root(r, str(tmp_path)) for r in manifest.files}
+        assert roots["main.py"] == str(tmp_path)
+        member_root = roots["project.zip!/app/models.py"]
+        assert open(f"{member_root}/app/models.py").read() == "x = 1\n"
+    finally:
+        manifest.close()
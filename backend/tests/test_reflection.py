@@ -0,0 +1,84 @@
+import pytest
+
+from RAGs import Reflection
+from RAGs.Reflection import FixCache, error_signature, learn_rewrites, reflect
+from RAGs.Verifier import VerificationResult
+
+ERROR = "AttributeError: type object 'User' has no attribute 'parse_obj'"
+CODE = "def load(data):\n    return User.parse_obj(data)\n"
+FIXED = "def load(data):\n    return User.model_validate(data)\n"
+
+
+class FakeBackend:
+    """Fails every file that still calls parse_obj, mentions in comments are fine."""
+
+    def __init__(self):
+        self.runs = 0
+
+    def run(self, job):
+        self.runs += 1
+        failing = any(".parse_obj(" in content for content in job.files.values())
+        stderr = f"Traceback (most recent call last):\n  ...\n{ERROR}\n" if failing else ""
+        return VerificationResult(job.label, job.profile, [], int(failing), "", stderr, 0.0)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return FixCache(f"{tmp_path.name}-fixes.sqlite")
+
+
+def test_error_signatures():
+    assert error_signature(f"Traceback (most recent call last):\n  File 'x.py'\n{ERROR}\n") == "AttributeError:parse_obj"
+    assert error_signature("ImportError: cannot import name 'validator' from 'pydantic'") == "ImportError:validator"
+    assert error_signature("pydantic.errors.PydanticUserError: `Config` is removed") is None
+    assert error_signature("all good") is None
+
+
+def test_only_renames_are_learned_as_rewrites():
+    assert learn_rewrites(CODE, FIXED) == [{"old": "parse_obj", "new": "model_validate", "call": True}]
+    # comments do not count, anything beyond a rename does
+    assert learn_rewrites(CODE, FIXED.replace("\n", "  # v2\n", 1)) is not None
+    assert learn_rewrites(CODE, FIXED.replace("data)", "data, strict=True)")) is None
+    assert learn_rewrites("x = parse_obj(d)\n", "x = model_validate(d)\n") is None
+
+
+def test_fixes_that_fail_more_often_than_not_are_not_offered(cache):
+    cache.record("AttributeError:parse_obj", "steps", "step 1", True)
+    cache.record("AttributeError:parse_obj", "rewrite", "[]", True)
+    cache.record("AttributeError:parse_obj", "steps", "step 2", True)
+    cache.record("AttributeError:parse_obj", "steps", "step 2", False)
+    assert cache.lookup("AttributeError:parse_obj") == [("rewrite", "[]"), ("steps", "step 1")]
+    assert cache.lookup("AttributeError:other") == []
+
+
+def test_a_learned_fix_is_replayed_without_the_llm(cache, monkeypatch):
+    monkeypatch.setattr(Reflection, "migration_prompt", lambda rules, code, error=None, **kwargs: "rename parse_obj")
+    monkeypatch.setattr(Reflection, "code_generation", lambda migration_steps, code: code.replace("parse_obj", "model_validate"))
+    report = reflect({"a.py": CODE}, {}, FakeBackend(), "python-syntax", cache=cache)
+    assert report["passed"] == ["a.py"] and report["files"]["a.py"] == FIXED
+    assert cache.lookup("AttributeError:parse_obj")[0][0] == "rewrite"
+
+    def no_llm(*args, **kwargs):
+        raise AssertionError("the llm was asked for a known fix")
+    monkeypatch.setattr(Reflection, "migration_prompt", no_llm)
+    monkeypatch.setattr(Reflection, "code_generation", no_llm)
+    report = reflect({"b.py": CODE.replace("data", "row")}, {}, FakeBackend(), "python-syntax", cache=cache)
+    assert report["passed"] == ["b.py"]
+    assert report["files"]["b.py"].startswith(FIXED.replace("data", "row").rstrip("\n") + "  # Known fix for AttributeError:parse_obj")
+    assert report["llm_calls"] == 0
+
+
+def test_a_fix_failing_with_the_same_signature_stops_the_loop(cache, monkeypatch):
+    prompts = []
+
+    def plan(rules, code, error=None, **kwargs):
+        prompts.append(error)
+        return f"attempt {len(prompts)}"
+    monkeypatch.setattr(Reflection, "migration_prompt", plan)
+    # every answer changes the file but keeps the broken call
+    monkeypatch.setattr(Reflection, "code_generation", lambda migration_steps, code: code + "# tried\n")
+    backend = FakeBackend()
+    report = reflect({"a.py": CODE}, {}, backend, "python-syntax", max_iterations=5, cache=cache)
+    assert report["failing"] == {"a.py": "AttributeError:parse_obj"}
+    assert len(prompts) == 1 and report["iterations"] == 2 and backend.runs == 2
+    assert cache.lookup("AttributeError:parse_obj") == []
@@ -0,0 +1,41 @@
+from RAGs.ResponseCache import ResponseCache, cache_key
+
+MESSAGES = [{"role": "user", "content": "migrate this"}]
+
+
+def test_answers_are_keyed_on_model_messages_and_params(tmp_path):
+    cache = ResponseCache(name=f"{tmp_path.name}-responses.sqlite")
+    key = cache_key("model-a", MESSAGES, max_tokens=100, temperature=0.0)
+    cache.put(key, "code_generation", "answer")
+    assert cache.get(cache_key("model-a", MESSAGES, temperature=0.0, max_tokens=100)) == "answer"
+    assert cache.get(cache_key("model-b", MESSAGES, max_tokens=100, temperature=0.0)) is None
+    assert cache.get(cache_key("model-a", MESSAGES, max_tokens=200, temperature=0.0)) is None
+    assert cache.get(cache_key("model-a", MESSAGES, max_tokens=100, temperature=0.1)) is None
+    assert cache.get(cache_key("model-a", [{"role": "user", "content": "other"}], max_tokens=100, temperature=0.0)) is None
+    cache.invalidate("code_generation")
+    assert cache.get(key) is None
+
+
+def test_only_low_temperature_and_unbypassed_stages_are_cached(tmp_path, monkeypatch):
+    monkeypatch.setenv("LLM_CACHE_BYPASS", "planning, chat")
+    cache = ResponseCache(name=f"{tmp_path.name}-responses.sqlite")
+    assert cache.enabled("code_generation", 0.0)
+    assert not cache.enabled("code_generation", 0.7)
+    assert not cache.enabled("planning", 0.0)
+
+
+def test_least_recently_used_answers_are_evicted_over_the_cap(tmp_path):
+    cache = ResponseCache(max_bytes=100, name=f"{tmp_path.name}-responses.sqlite")
+    sums = []
+    cache.conn.set_trace_callback(lambda sql: sums.append(sql) if "SUM(size)" in sql else None)
+    for key in "abcde":
+        cache.put(key, None, key * 20)
+    # replacing an answer does not grow the total
+    cache.put("e", None, "e" * 20)
+    assert cache.total == 100 and sums == []
+    cache.get("a")
+    cache.put("f", None, "f" * 20)
+    assert sums
+    # a quarter of the rows (plus one) goes, oldest access first
+    assert [k for k in "abcdef" if cache.get(k)] == ["a", "d", "e", "f"]
+    assert cache.total == 80
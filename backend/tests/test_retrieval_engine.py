@@ -0,0 +1,69 @@
+import asyncio
+
+import aiohttp
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from RAGs.RetrievalEngine import RetrievalEngine, SearchConfigError, extract_text
+
+RESULTS = [{"url": "https://docs.example.com/migration", "title": "Migration", "content": "...", "score": 0.9}]
+
+
+def stub_app(key="secret"):
+    async def search(request):
+        if request.headers.get("Authorization") != f"Bearer {key}":
+            return web.json_response({"detail": "invalid api key"}, status=401)
+        payload = await request.json()
+        if payload["query"] == "broken":
+            return web.Response(status=500)
+        return web.json_response({"results": RESULTS[: payload["max_results"]]})
+
+    async def page(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.Response(body=b"<html><body><h1>Migration</h1></body></html>", headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_post("/search", search)
+    app.router.add_get("/page", page)
+    return app
+
+
+def run(test, key="secret"):
+    async def main():
+        async with TestServer(stub_app()) as server:
+            async with RetrievalEngine(search_url=str(server.make_url("/search")), api_key=key) as engine:
+                return await test(engine, server)
+    return asyncio.run(main())
+
+
+def test_search_returns_the_results():
+    async def test(engine, server):
+        return await engine.search("pydantic 2 migration", max_results=5)
+    assert run(test) == RESULTS
+
+
+def test_rejected_api_keys_raise_a_config_error():
+    async def test(engine, server):
+        await engine.search("pydantic 2 migration")
+    with pytest.raises(SearchConfigError):
+        run(test, key="wrong")
+
+
+def test_server_errors_stay_per_query():
+    async def test(engine, server):
+        await engine.search("broken")
+    with pytest.raises(aiohttp.ClientResponseError):
+        run(test)
+
+
+def test_fetch_revalidates_with_the_etag():
+    async def test(engine, server):
+        url = str(server.make_url("/page"))
+        first = await engine.fetch(url)
+        again = await engine.fetch(url, headers={"If-None-Match": first.etag})
+        return first, again
+    first, again = run(test)
+    assert first.status == 200 and extract_text(first.body) == "Migration"
+    assert again.status == 304 and again.body == b""
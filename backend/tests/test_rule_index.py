@@ -0,0 +1,48 @@
+import pytest
+
+from RAGs import RuleIndex
+from RAGs.RuleIndex import select_rules, tokenize
+
+RULES = [
+    {"rule_id": "parse-obj", "rule_text": "BaseModel.parse_obj() must be replaced with BaseModel.model_validate()"},
+    {"rule_id": "json", "rule_text": "BaseModel.json() must be replaced with BaseModel.model_dump_json()"},
+    {"rule_id": "config", "rule_text": "The inner class Config is replaced by model_config = ConfigDict(...)"},
+    {"rule_id": "validator", "rule_text": "@validator must be replaced with @field_validator"},
+]
+
+
+@pytest.fixture(autouse=True)
+def index_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(RuleIndex, "INDEX_DIR", tmp_path / "rule_index")
+    monkeypatch.setattr(RuleIndex, "_indexes", RuleIndex.OrderedDict())
+    return tmp_path / "rule_index"
+
+
+def test_tokens_split_identifiers():
+    assert set(tokenize("BaseModel.parse_obj()")) == {"basemodel", "base", "model", "parse_obj", "parse", "obj"}
+
+
+def test_only_rules_sharing_terms_with_the_code_are_selected():
+    selected = select_rules(RULES, "user = User.parse_obj(data)\n", k=8)
+    assert [r["rule_id"] for r in selected] == ["parse-obj"]
+
+
+def test_subsets_filter_the_index_of_the_full_rule_set(index_dir):
+    code = "user = User.parse_obj(data)\nprint(user.json())\n"
+    assert [r["rule_id"] for r in select_rules(RULES, code, within=RULES[1:])] == ["json"]
+    assert select_rules(RULES, code, within=[]) == []
+    select_rules(RULES, code, within=RULES[:2])
+    # one persisted index for the rule set, however many subsets were asked for
+    assert len(list(index_dir.iterdir())) == 1
+    assert len(RuleIndex._indexes) == 1
+
+
+def test_in_memory_indexes_are_bounded(monkeypatch):
+    monkeypatch.setattr(RuleIndex, "MAX_INDEXES", 2)
+    for i in range(4):
+        select_rules(RULES[: i + 1], "parse_obj")
+    assert list(RuleIndex._indexes) == [RuleIndex.fingerprint(RULES[:3]), RuleIndex.fingerprint(RULES[:4])]
+    # a hit moves the rule set to the back
+    select_rules(RULES[:3], "parse_obj")
+    select_rules(RULES[:1], "parse_obj")
+    assert list(RuleIndex._indexes) == [RuleIndex.fingerprint(RULES[:3]), RuleIndex.fingerprint(RULES[:1])]
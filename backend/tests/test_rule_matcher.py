@@ -0,0 +1,44 @@
+from RAGs.ProjectIngestion import FileRecord
+from RAGs.RuleMatcher import AhoCorasick, _bounded, extract_symbols, match_files, rules_by_file
+
+RULES = {"final_rules": [
+    {"rule_id": "parse-obj", "rule_text": "`User.parse_obj()` must be replaced with `User.model_validate()`"},
+    {"rule_id": "json", "rule_text": "BaseModel.json() is renamed to model_dump_json()"},
+    {"rule_id": "review", "rule_text": "Review how settings are loaded after upgrading."},
+]}
+
+
+def record(tmp_path, rel_path, text):
+    path = tmp_path / rel_path
+    path.write_text(text)
+    return FileRecord(str(path), rel_path, "python", len(text), 0.0)
+
+
+def test_overlapping_patterns_are_all_reported():
+    automaton = AhoCorasick(["he", "she", "his", "hers"])
+    assert sorted(automaton.iter("ushers")) == [(4, "he"), (4, "she"), (6, "hers")]
+    assert sorted(automaton.iter("ahishe")) == [(4, "his"), (6, "he"), (6, "she")]
+
+
+def test_hits_inside_longer_identifiers_do_not_count():
+    assert _bounded("x.parse_obj(d)", 2, 11, "parse_obj")
+    assert not _bounded("my_parse_obj(d)", 3, 12, "parse_obj")
+    assert not _bounded("parse_objects", 0, 9, "parse_obj")
+    # a pattern that starts with punctuation only needs the boundary at its word end
+    assert _bounded("cls.parse_obj(d)", 3, 14, ".parse_obj(")
+
+
+def test_symbols_come_from_the_old_side_of_a_rule():
+    assert extract_symbols(RULES["final_rules"][0]) == {"parse_obj", ".parse_obj("}
+    assert extract_symbols(RULES["final_rules"][2]) == set()
+
+
+def test_files_are_matched_per_rule_and_line(tmp_path):
+    models = record(tmp_path, "models.py", "user = User.parse_obj(data)\nhelper = my_parse_obj(data)\n\n\nprint(user.json())\n")
+    other = record(tmp_path, "other.py", "value = parse_objects(data)\n")
+    matches = match_files(RULES, [models, other])
+    assert matches["parse-obj"] == {"models.py": [(1, 1)]}
+    assert matches["json"] == {"models.py": [(5, 5)]}
+    # nothing in the rule narrows it down, every file gets it as a whole
+    assert matches["review"] == {"models.py": [(1, 5)], "other.py": [(1, 1)]}
+    assert [r["rule_id"] for r in rules_by_file(RULES, matches)["other.py"]] == ["review"]
@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from RAGs.RuleStore import RuleStore  # noqa: E402
+
+COMPILED = {"final_rules": [{"rule_id": "r", "rule_text": "x"}], "discarded_rules": []}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RuleStore(f"{tmp_path.name}-rules.sqlite")
+    for from_version, to_version in [("1.x", "2.x"), ("1.x", "3.x"), ("2.x", "3.x")]:
+        store.save("pydantic", from_version, to_version, COMPILED, {}, {}, {})
+    store.save("fastapi", "0.x", "1.x", COMPILED, {}, {}, {})
+    return store
+
+
+def test_invalidate_drops_exactly_one_migration(store):
+    store.invalidate("Pydantic", "v1.x", "2.x")
+    assert store.lookup("pydantic", "1.x", "2.x") is None
+    assert store.lookup("pydantic", "1.x", "3.x") is not None
+    assert store.lookup("pydantic", "2.x", "3.x") is not None
+
+
+def test_invalidate_requires_both_versions(store):
+    with pytest.raises(TypeError):
+        store.invalidate("pydantic", "1.x")
+
+
+def test_invalidate_from_drops_every_target_of_one_source(store):
+    store.invalidate_from("pydantic", "1.x")
+    assert store.lookup("pydantic", "1.x", "2.x") is None and store.lookup("pydantic", "1.x", "3.x") is None
+    assert store.lookup("pydantic", "2.x", "3.x") is not None
+    assert store.lookup("fastapi", "0.x", "1.x") is not None
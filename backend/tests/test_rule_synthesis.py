@@ -0,0 +1,107 @@
+import json
+
+from RAGs import RuleSynthesis
+from RAGs.RuleSynthesis import MAX_CLUSTER, compile_cluster, rule_compiler
+
+
+def rules(n, text="Replace the deprecated call number {i} with the new api"):
+    return [{"rule_id": f"r{i}", "rule_text": text.format(i=i), "priority": "HIGH"} for i in range(n)]
+
+
+def test_unusable_answers_do_not_recurse_forever(monkeypatch):
+    calls = []
+    monkeypatch.setattr(RuleSynthesis, "get_supervision", lambda payload: calls.append(payload) or "no json here")
+    compiled = compile_cluster(rules(10 * MAX_CLUSTER))
+    assert len(compiled["final_rules"]) == 10 * MAX_CLUSTER
+    # one call per leaf of the halving, nothing after the halves failed to shrink
+    assert len(calls) < 20
+
+
+def test_distinct_rules_do_not_recurse_forever(monkeypatch):
+    def keep_all(payload):
+        return json.dumps({"final_rules": json.loads(payload), "discarded_rules": []})
+    monkeypatch.setattr(RuleSynthesis, "get_supervision", keep_all)
+    compiled = json.loads(rule_compiler([json.dumps({"rules": rules(5 * MAX_CLUSTER)})]))
+    assert len(compiled["final_rules"]) == 5 * MAX_CLUSTER
+
+
+def test_clusters_are_capped_before_merging(monkeypatch):
+    sizes = []
+
+    def record(payload):
+        sizes.append(len(json.loads(payload)))
+        return json.dumps({"final_rules": json.loads(payload)[:1], "discarded_rules": []})
+    monkeypatch.setattr(RuleSynthesis, "get_supervision", record)
+    rule_compiler([json.dumps({"rules": rules(3 * MAX_CLUSTER)})])
+    assert sizes and max(sizes) <= MAX_CLUSTER
+
+
+DOCS = [
+    {"url": "https://docs.pydantic.dev/migration/", "title": "Migration guide", "chunk": "parse_obj is now model_validate"},
+    {"url": "https://stackoverflow.com/q/1", "title": "json() deprecated", "chunk": "use model_dump_json instead of json"},
+    {"url": "https://example.com/blog", "title": "Blog", "chunk": "nothing actionable here"},
+]
+
+
+def test_packed_answers_are_split_back_per_chunk():
+    answer = "Here are the rules:\n```json\n" + json.dumps({"rules": [
+        {"rule_id": "a", "rule_text": "parse_obj -> model_validate", "chunk": 0},
+        {"rule_id": "b", "rule_text": "json -> model_dump_json", "chunk": 7, "source": {"url": "https://stackoverflow.com/q/1"}},
+        {"rule_id": "c", "rule_text": "belongs nowhere", "chunk": "first"},
+    ]}) + "\n```"
+    outputs = [json.loads(o)["rules"] for o in RuleSynthesis.split_packed(DOCS, answer)]
+    assert [[r["rule_id"] for r in rules] for rules in outputs] == [["a"], ["b"], []]
+    # the index is replaced by the source of the chunk it came from
+    assert outputs[1][0]["source"] == {"title": "json() deprecated", "url": "https://stackoverflow.com/q/1"}
+    assert "chunk" not in outputs[0][0]
+
+
+def test_malformed_packed_answers_give_every_chunk_no_rules():
+    for answer in ("no json at all", '{"rules": [unterminated', "", None):
+        assert RuleSynthesis.split_packed(DOCS, answer) == [json.dumps({"rules": []})] * len(DOCS)
+
+
+def test_packed_synthesis_keeps_the_document_order(monkeypatch):
+    monkeypatch.setattr(RuleSynthesis, "count_tokens", lambda text, model: 10)
+    requests = []
+
+    def answer(packed):
+        requests.append([d["url"] for d in packed])
+        return json.dumps({"rules": [{"rule_id": d["title"], "rule_text": d["chunk"], "chunk": i} for i, d in enumerate(packed)]})
+    monkeypatch.setattr(RuleSynthesis, "get_guidance_packed", answer)
+    monkeypatch.setattr(RuleSynthesis, "get_guidance", lambda doc: json.dumps({"rules": []}))
+    outputs = RuleSynthesis.rules_synthesis(DOCS, pack=True, token_budget=25)
+    # 10 tokens per chunk, two fit a pack of 25
+    assert requests == [[DOCS[0]["url"], DOCS[1]["url"]]]
+    assert [[r["rule_id"] for r in json.loads(o)["rules"]] for o in outputs] == [["Migration guide"], ["json() deprecated"], []]
+
+
+GUIDE = (
+    "In Pydantic v2 the parse_obj class method is deprecated and replaced by model_validate, "
+    "which validates a dict against the model and raises ValidationError on bad input."
+)
+
+
+def test_near_duplicate_chunks_are_merged_into_the_best_source():
+    docs = [
+        {"url": "https://blog.example.com/a", "priority": "Medium", "score": 0.9, "chunk": GUIDE},
+        {"url": "https://docs.pydantic.dev/migration/", "priority": "Critical", "score": 0.5, "chunk": GUIDE.replace("bad input.", "bad data.")},
+        {"url": "https://mirror.example.com/a", "priority": "Medium", "score": 0.1, "chunk": GUIDE.upper()},
+        {"url": "https://empty.example.com", "priority": "Critical", "chunk": "   "},
+    ]
+    [kept] = RuleSynthesis.deduplicate_documents(docs)
+    assert kept["url"] == "https://docs.pydantic.dev/migration/"
+    assert [s["url"] for s in kept["merged_sources"]] == ["https://blog.example.com/a", "https://mirror.example.com/a"]
+
+
+def test_distinct_chunks_are_all_kept_in_order():
+    docs = [
+        {"url": "https://docs.pydantic.dev/a", "chunk": GUIDE},
+        {"url": "https://docs.pydantic.dev/b", "chunk": "The inner class Config is replaced by model_config = ConfigDict(...), "
+                                                      "orm_mode became from_attributes and allow_mutation became frozen."},
+        {"url": "https://docs.pydantic.dev/c", "chunk": "Validators: @validator is replaced by @field_validator, which needs "
+                                                      "an explicit classmethod decorator and mode='before' for pre validators."},
+    ]
+    kept = RuleSynthesis.deduplicate_documents(docs)
+    assert [d["url"] for d in kept] == [d["url"] for d in docs]
+    assert all(d["merged_sources"] == [] for d in kept)
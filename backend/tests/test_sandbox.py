@@ -0,0 +1,99 @@
+import subprocess
+
+import pytest
+
+from RAGs import Sandbox as sandbox
+from RAGs.Sandbox import SandboxPool, project_key
+
+
+class FakeDocker:
+    """Records docker calls, every container starts fine and every command succeeds unless told otherwise."""
+
+    def __init__(self):
+        self.calls = []
+        self.started = 0
+        self.hang = set()  # commands that time out
+
+    def __call__(self, *args, stdin=None, timeout=None):
+        self.calls.append(args)
+        stdout = b""
+        if args[0] == "run":
+            self.started += 1
+            stdout = f"box{self.started}\n".encode()
+        elif args[0] == "exec" and args[-1] in self.hang:
+            raise subprocess.TimeoutExpired(args, timeout)
+        return subprocess.CompletedProcess(args, 0, stdout, b"")
+
+    def count(self, command, container=None):
+        return sum(1 for c in self.calls if c[0] == command and (container is None or any(container in a for a in c)))
+
+
+@pytest.fixture
+def docker(monkeypatch):
+    fake = FakeDocker()
+    monkeypatch.setattr(sandbox, "docker", fake)
+    return fake
+
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(size=1)
+    # no background warming, containers start only when a lease needs one
+    pool.refill = lambda image: None
+    return pool
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "app.py").write_text("x = 1\n")
+    return tmp_path
+
+
+def lease_and_run(pool, project, cmd="true"):
+    key = project_key(project)
+    with pool.lease("image", key) as box:
+        box.load_project(project, key)
+        box.put_files({"app.py": "x = 2\n"})
+        box.run([cmd])
+    return box
+
+
+def test_a_returned_container_is_reset_and_reused_without_another_upload(docker, pool, project):
+    first = lease_and_run(pool, project)
+    assert pool.warm["image"] == [first]
+    # the project went to /base and the patched file to /app
+    assert docker.count("cp") == 2
+    second = lease_and_run(pool, project)
+    assert second is first and docker.started == 1
+    assert docker.count("cp") == 3
+    assert docker.count("rm") == 0
+    resets = [c for c in docker.calls if c[0] == "exec" and "cp -a /base /app" in c[-1]]
+    # after the upload and on every release
+    assert len(resets) == 3
+
+
+def test_a_changed_project_is_uploaded_again(docker, pool, project):
+    lease_and_run(pool, project)
+    (project / "app.py").write_text("x = 10\n")
+    lease_and_run(pool, project)
+    assert docker.started == 1
+    assert sum(1 for c in docker.calls if c[0] == "cp" and c[-1].endswith(":/base")) == 2
+
+
+def test_a_container_with_a_timed_out_command_is_removed(docker, pool, project):
+    docker.hang.add("sleep")
+    box = lease_and_run(pool, project, cmd="sleep")
+    assert box.tainted and pool.warm.get("image", []) == []
+    assert docker.count("rm", box.container) == 1
+
+
+def test_shutdown_removes_idle_containers_and_later_returns(docker, pool, project):
+    idle = lease_and_run(pool, project)
+    key = project_key(project)
+    with pool.lease("image", key) as busy:
+        assert busy is idle
+        other = pool.acquire("image", key)
+        pool.shutdown()
+        pool.release(other)
+    assert docker.count("rm", idle.container) == 1 and docker.count("rm", other.container) == 1
+    assert pool.warm == {}
@@ -0,0 +1,27 @@
+from RAGs import SourceAuthority
+from RAGs.SourceAuthority import NEUTRAL, AuthorityStore
+
+
+def test_hosts_the_llm_leaves_out_are_not_remembered(monkeypatch, tmp_path):
+    monkeypatch.setattr(SourceAuthority, "chat", lambda *args, **kwargs: "blog.example.com: low\nnoise")
+    store = AuthorityStore(name=f"{tmp_path.name}-authority.sqlite")
+    levels = store.classify_batch(["https://blog.example.com/a", "https://vendor.example.org/b"])
+    assert levels == {"blog.example.com": "low", "vendor.example.org": NEUTRAL}
+    assert store.known("blog.example.com") == "low"
+    assert store.known("vendor.example.org") is None
+
+
+def test_failed_classification_falls_back_without_persisting(monkeypatch, tmp_path):
+    def fail(*args, **kwargs):
+        raise RuntimeError("llm down")
+    monkeypatch.setattr(SourceAuthority, "chat", fail)
+    store = AuthorityStore(name=f"{tmp_path.name}-authority.sqlite")
+    assert store.classify_batch(["https://unknown.example.net/"]) == {"unknown.example.net": NEUTRAL}
+    assert store.known("unknown.example.net") is None
+
+
+def test_cached_uses_only_memo_and_rules(monkeypatch, tmp_path):
+    monkeypatch.setattr(SourceAuthority, "chat", lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError("llm called")))
+    store = AuthorityStore(name=f"{tmp_path.name}-authority.sqlite")
+    assert store.cached("docs.pydantic.dev") == "Critical"
+    assert store.cached("unknown.example.net") is None
@@ -0,0 +1,69 @@
+from RAGs import SymbolIndex as symbol_index
+from RAGs.ProjectIngestion import ManifestStore, ingest_incremental
+from RAGs.SymbolIndex import SymbolIndex
+
+MODELS = """\
+from pydantic import BaseModel
+
+
+class User(BaseModel):
+    name: str
+
+    def describe(self):
+        return self.json()
+
+
+class Admin(User):
+    pass
+"""
+
+SERVICE = """\
+from models import Admin, User
+
+
+def load(data):
+    user = User.parse_obj(data)
+    return Admin.parse_obj(data), user
+
+
+def unrelated(parser):
+    return Parser.parse_obj(parser)
+"""
+
+
+def index_project(tmp_path, index, store):
+    manifest, _ = ingest_incremental(tmp_path / "src", "project", store)
+    manifest.close()
+    return index.index_records("project", manifest.files)
+
+
+def make_project(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "models.py").write_text(MODELS)
+    (tmp_path / "src" / "service.py").write_text(SERVICE)
+    return SymbolIndex(f"{tmp_path.name}-symbols.sqlite"), ManifestStore(f"{tmp_path.name}-manifests.sqlite")
+
+
+def test_definitions_and_call_sites(tmp_path):
+    index, store = make_project(tmp_path)
+    assert index_project(tmp_path, index, store) == 2
+    assert index.definitions("User", "project") == [("models.py", 4, 8, "BaseModel")]
+    assert [row[0:2] for row in index.definitions("describe", "project")] == [("models.py", 7)]
+    # subclasses of the class count as receivers, other classes do not
+    assert [row[:2] for row in index.where_called("User.parse_obj", "project")] == [("service.py", 5), ("service.py", 6)]
+    assert [row[:2] for row in index.where_called("BaseModel.json", "project")] == [("models.py", 8)]
+    assert [row[0] for row in index.imports_of("pydantic", "project")] == ["models.py"]
+
+
+def test_reindexing_reads_and_parses_only_changed_files(tmp_path, monkeypatch):
+    index, store = make_project(tmp_path)
+    index_project(tmp_path, index, store)
+    read = []
+    real_read_bytes = symbol_index.read_bytes
+    monkeypatch.setattr(symbol_index, "read_bytes", lambda record: read.append(record.rel_path) or real_read_bytes(record))
+    assert index_project(tmp_path, index, store) == 0
+    assert read == []
+    (tmp_path / "src" / "service.py").write_text(SERVICE + "\n\ndef dump(user):\n    return user.json()\n")
+    assert index_project(tmp_path, index, store) == 1
+    assert read == ["service.py"]
+    assert [row[:2] for row in index.where_called("BaseModel.json", "project")] == [("models.py", 8), ("service.py", 14)]
@@ -0,0 +1,116 @@
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+
+from uploads import HashMismatch, InvalidUpload, OffsetMismatch, UploadStore, UploadTooLarge
+
+
+async def stream(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def multipart(boundary: bytes, fields: dict, filename: str, content: bytes) -> bytes:
+    body = b""
+    for name, value in fields.items():
+        body += b"--" + boundary + b'\r\nContent-Disposition: form-data; name="' + name.encode() + b'"\r\n\r\n'
+        body += value.encode() + b"\r\n"
+    body += b"--" + boundary + b'\r\nContent-Disposition: form-data; name="file"; filename="' + filename.encode() + b'"\r\n'
+    body += b"Content-Type: application/zip\r\n\r\n" + content + b"\r\n--" + boundary + b"--\r\n"
+    return body
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(tmp_path / "uploads", name=f"{tmp_path.name}-uploads.sqlite", max_size=1024 * 1024)
+
+
+def test_write_stream_stores_each_archive_once(store):
+    sha, size = asyncio.run(store.write_stream(stream(b"abc", b"def")))
+    assert (sha, size) == (hashlib.sha256(b"abcdef").hexdigest(), 6)
+    again, _ = asyncio.run(store.write_stream(stream(b"abcdef")))
+    assert again == sha
+    assert [p.name for p in store.blobs.iterdir()] == [sha]
+    assert list(store.partial.iterdir()) == []
+
+
+def test_write_stream_rejects_oversized_bodies(store):
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(store.write_stream(stream(b"x" * 1024 * 1024, b"x")))
+    assert list(store.partial.iterdir()) == []
+
+
+def test_multipart_body_is_parsed_while_streaming(store):
+    content = os.urandom(300 * 1024)
+    body = multipart(b"XyZ", {"library": "pydantic", "to_version": "2.x"}, "project.zip", content)
+    # split at awkward places, boundaries and headers cross chunk borders
+    chunks = [body[i:i + 7000] for i in range(0, len(body), 7000)]
+    fields, filename, sha, size = asyncio.run(
+        store.write_multipart(stream(*chunks), "multipart/form-data; boundary=XyZ", suffixes=(".zip",))
+    )
+    assert fields == {"library": "pydantic", "to_version": "2.x"}
+    assert filename == "project.zip"
+    assert (sha, size) == (hashlib.sha256(content).hexdigest(), len(content))
+    assert store.blob_path(sha).read_bytes() == content
+
+
+def test_multipart_rejects_wrong_formats_and_missing_files(store):
+    body = multipart(b"b", {}, "project.exe", b"MZ")
+    with pytest.raises(InvalidUpload):
+        asyncio.run(store.write_multipart(stream(body), "multipart/form-data; boundary=b", suffixes=(".zip",)))
+    with pytest.raises(InvalidUpload):
+        asyncio.run(store.write_multipart(stream(b"--b--\r\n"), "multipart/form-data; boundary=b"))
+    with pytest.raises(InvalidUpload):
+        asyncio.run(store.write_multipart(stream(b"raw"), "application/octet-stream"))
+    assert list(store.partial.iterdir()) == []
+
+
+def test_resumable_upload(store):
+    data = b"0123456789" * 100
+    session = store.create("project.zip", size=len(data), sha256=hashlib.sha256(data).hexdigest())
+    upload_id = session["upload_id"]
+    assert session["offset"] == 0
+    asyncio.run(store.append(upload_id, 0, stream(data[:400])))
+    with pytest.raises(OffsetMismatch) as e:
+        asyncio.run(store.append(upload_id, 0, stream(data[:400])))
+    assert e.value.offset == 400
+    asyncio.run(store.append(upload_id, 400, stream(data[400:])))
+    sha = asyncio.run(store.complete(upload_id))
+    assert store.blob_path(sha).read_bytes() == data
+    assert store.session(upload_id)["complete"]
+
+
+def test_append_never_goes_past_the_declared_size(store):
+    upload_id = store.create("project.zip", size=10)["upload_id"]
+    asyncio.run(store.append(upload_id, 0, stream(b"0123456789")))
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(store.append(upload_id, 10, stream(b"x")))
+    assert store.session(upload_id)["offset"] == 10
+
+
+def test_complete_checks_the_hash(store):
+    upload_id = store.create("project.zip", size=3, sha256="0" * 64)["upload_id"]
+    asyncio.run(store.append(upload_id, 0, stream(b"abc")))
+    with pytest.raises(HashMismatch):
+        asyncio.run(store.complete(upload_id))
+
+
+def test_collect_drops_abandoned_sessions_and_unlinked_blobs(store, tmp_path):
+    abandoned = store.create("old.zip", size=100)["upload_id"]
+    asyncio.run(store.append(abandoned, 0, stream(b"partial")))
+    linked, _ = asyncio.run(store.write_stream(stream(b"linked")))
+    store.link(linked, tmp_path / "run", "linked.zip")
+    unlinked, _ = asyncio.run(store.write_stream(stream(b"unlinked")))
+    old = time.time() - 3600
+    for path in [store.partial / abandoned, store.blob_path(linked), store.blob_path(unlinked)]:
+        os.utime(path, (old, old))
+    store.conn.execute("UPDATE sessions SET created_at = ? WHERE upload_id = ?", (old, abandoned))
+
+    removed = store.collect(session_ttl=60, blob_ttl=60)
+    assert removed == {"sessions": 1, "partial": 1, "blobs": 1}
+    assert store.session(abandoned) is None
+    assert store.blob_path(linked).exists()
+    assert not store.blob_path(unlinked).exists()
@@ -0,0 +1,77 @@
+import os
+
+from RAGs.Verifier import Limits, LocalBackend, VerificationJob, file_jobs, verify
+
+
+def test_jobs_writing_into_the_tree_leave_the_source_untouched(tmp_path):
+    (tmp_path / "data.txt").write_text("original")
+    (tmp_path / "main.py").write_text("print('unpatched')\n")
+    script = "open('data.txt', 'w').write('overwritten')\nopen('main.py', 'a').write('# appended')\n"
+    [result] = verify([VerificationJob("writer", "python-run", {"entry": "job.py"}, {"job.py": script})],
+                      LocalBackend(tmp_path))
+    assert result.passed, result.stderr
+    assert (tmp_path / "data.txt").read_text() == "original"
+    assert (tmp_path / "main.py").read_text() == "print('unpatched')\n"
+    assert not (tmp_path / "job.py").exists()
+
+
+def test_patched_files_replace_the_project_copy(tmp_path):
+    (tmp_path / "app.py").write_text("raise SystemExit(1)\n")
+    [result] = verify(file_jobs({"app.py": "print('patched')\n"}, "python-run"), LocalBackend(tmp_path))
+    assert result.passed
+    assert result.stdout.strip() == "patched"
+    assert (tmp_path / "app.py").read_text() == "raise SystemExit(1)\n"
+
+
+def test_results_keep_job_order_and_report_failures(tmp_path):
+    files = {"ok.py": "x = 1\n", "broken.py": "def (:\n", "also_ok.py": "y = 2\n"}
+    results = verify(file_jobs(files, "python-syntax"), LocalBackend(tmp_path))
+    assert [r.label for r in results] == list(files)
+    assert [r.passed for r in results] == [True, False, True]
+    assert "SyntaxError" in results[1].stderr
+
+
+def test_wall_clock_limit_kills_the_job(tmp_path):
+    job = VerificationJob("sleeper", "python-run", {"entry": "sleep.py"}, {"sleep.py": "import time\ntime.sleep(30)\n"})
+    [result] = verify([job], LocalBackend(tmp_path, Limits(wall_seconds=0.5)))
+    assert result.timed_out
+    assert not result.passed
+    assert result.duration < 10
+
+
+def test_output_is_truncated(tmp_path):
+    job = VerificationJob("loud", "python-run", {"entry": "loud.py"}, {"loud.py": "print('x' * 10000)\n"})
+    [result] = verify([job], LocalBackend(tmp_path, Limits(max_output=100)))
+    assert result.stdout.startswith("x" * 100)
+    assert "more characters" in result.stdout
+
+
+def test_project_copies_are_reused_and_reset_between_jobs(tmp_path, monkeypatch):
+    from RAGs import Verifier
+
+    copies = []
+    real_copy = Verifier._copy_project
+    monkeypatch.setattr(Verifier, "_copy_project", lambda source, target: copies.append(target) or real_copy(source, target))
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / "pkg" / "data.txt").write_text("original")
+    (tmp_path / "app.py").write_text("raise SystemExit(1)\n")
+    script = (
+        "import os\n"
+        "assert open('pkg/data.txt').read() == 'original'\n"
+        "assert open('app.py').read() == 'raise SystemExit(1)\\n'\n"
+        "assert not os.path.exists('leak.txt') and not os.path.exists('new')\n"
+        "assert sorted(os.listdir('.')) == ['app.py', 'job.py', 'pkg']\n"
+        "open('pkg/data.txt', 'w').write('changed')\n"
+        "open('leak.txt', 'w').write('x')\n"
+        "os.makedirs('new/deep')\n"
+        "os.remove('app.py')\n"
+    )
+    backend = LocalBackend(tmp_path)
+    jobs = [VerificationJob(f"job{i}", "python-run", {"entry": "job.py"}, {"job.py": script}) for i in range(6)]
+    results = verify(jobs, backend, max_workers=2) + verify(jobs[:2], backend, max_workers=2)
+    assert all(r.passed for r in results), [r.stderr for r in results if not r.passed]
+    # one copy per concurrent job, not per job
+    assert 1 <= len(copies) <= 2
+    tempdir = backend.tempdir
+    backend.close()
+    assert not os.path.exists(tempdir)
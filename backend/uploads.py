@@ -0,0 +1,336 @@
+"""
+Docstring for backend.uploads
+Content-addressed storage for uploaded archives.
+
+- bodies are streamed to disk chunk by chunk, the sha256 is computed in the same pass,
+  memory per upload stays at one chunk
+- every archive is stored once as uploads/blobs/<sha256>, a repeat upload only costs the hash
+- runs get a hardlink uploads/<run_id>/<filename> to the blob, ingestion reads it there
+- multipart/form-data bodies (POST /upload) are parsed while they stream in, write_multipart()
+  sends the file part to a blob the same way and returns the small form fields
+- large archives can use the resumable protocol: create() a session, append() chunks at the
+  offset the server reports (never past the declared size), complete() verifies the hash and
+  turns the partial file into a blob
+- collect() removes sessions abandoned for SESSION_TTL and blobs no run links to that were not
+  used for BLOB_TTL
+
+store = UploadStore("uploads")
+sha, size = await store.write_stream(chunks)
+fields, filename, sha, size = await store.write_multipart(request.stream(), request.headers["content-type"])
+store.link(sha, "uploads/<run_id>", "project.zip")
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from RAGs.Storage import connect
+
+CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_SIZE = int(os.getenv("PATCHPILOT_MAX_UPLOAD_SIZE", str(2 * 1024 * 1024 * 1024)))
+MAX_FIELD_SIZE = 64 * 1024
+SESSION_TTL = float(os.getenv("PATCHPILOT_UPLOAD_SESSION_TTL", str(24 * 3600)))
+BLOB_TTL = float(os.getenv("PATCHPILOT_BLOB_TTL", str(7 * 24 * 3600)))
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class OffsetMismatch(ValueError):
+    def __init__(self, offset: int):
+        super().__init__(f"upload continues at offset {offset}")
+        self.offset = offset
+
+
+class HashMismatch(ValueError):
+    pass
+
+
+class InvalidUpload(ValueError):
+    pass
+
+
+def _write(f, hasher, chunk: bytes):
+    f.write(chunk)
+    hasher.update(chunk)
+
+
+def _hash_file(path: Path):
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher
+
+
+class UploadStore:
+    def __init__(self, root, name: str = "uploads.sqlite", max_size: int = MAX_UPLOAD_SIZE):
+        self.root = Path(root)
+        self.blobs = self.root / "blobs"
+        self.partial = self.root / "partial"
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        self.partial.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.conn = connect(name)
+        self.lock = threading.Lock()
+        self.hashers = {}  # upload_id -> running sha256 of the partial file
+        self.appending = {}  # upload_id -> asyncio.Lock
+        with self.lock:
+            self.conn.execute(
+                """CREATE TABLE IF NOT EXISTS sessions (
+                    upload_id TEXT PRIMARY KEY,
+                    filename TEXT NOT NULL,
+                    size INTEGER,
+                    sha256 TEXT,
+                    created_at REAL NOT NULL
+                )"""
+            )
+
+    def blob_path(self, sha: str) -> Path:
+        return self.blobs / sha
+
+    def has_blob(self, sha: str | None) -> bool:
+        return bool(sha) and self.blob_path(sha.lower()).is_file()
+
+    def _commit(self, temp: Path, sha: str) -> Path:
+        blob = self.blob_path(sha)
+        # under the lock, collect() never removes a blob between the check and its use
+        with self.lock:
+            if blob.exists():
+                temp.unlink()
+                # a repeat upload, the blob is in use again
+                os.utime(blob)
+            else:
+                os.replace(temp, blob)
+        return blob
+
+    async def write_stream(self, chunks) -> tuple[str, int]:
+        """Stores an async iterable of bytes, returns (sha256, size)."""
+        temp = self.partial / f"stream-{uuid.uuid4()}"
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp, "wb") as f:
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise UploadTooLarge(f"upload is larger than {self.max_size} bytes")
+                    await asyncio.to_thread(_write, f, hasher, chunk)
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+        sha = hasher.hexdigest()
+        self._commit(temp, sha)
+        return sha, size
+
+    async def write_multipart(self, body, content_type: str, file_field: str = "file",
+                              suffixes: tuple[str, ...] | None = None) -> tuple[dict[str, str], str, str, int]:
+        """
+        Streams a multipart/form-data body, the part `file_field` goes to a blob like write_stream().
+        Returns (other fields, filename, sha256, size), a filename without one of `suffixes` is rejected
+        as soon as its part headers arrive.
+        """
+        kind, options = parse_options_header(content_type or "")
+        if kind != b"multipart/form-data" or not options.get(b"boundary"):
+            raise InvalidUpload("expected a multipart/form-data body")
+        events = []
+        parser = MultipartParser(options[b"boundary"], {
+            "on_part_begin": lambda: events.append(("begin", None)),
+            "on_header_field": lambda data, start, end: events.append(("header_field", bytes(data[start:end]))),
+            "on_header_value": lambda data, start, end: events.append(("header_value", bytes(data[start:end]))),
+            "on_header_end": lambda: events.append(("header_end", None)),
+            "on_headers_finished": lambda: events.append(("headers", None)),
+            "on_part_data": lambda data, start, end: events.append(("data", bytes(data[start:end]))),
+            "on_part_end": lambda: events.append(("end", None)),
+        })
+        fields = {}
+        temp = self.partial / f"stream-{uuid.uuid4()}"
+        hasher = hashlib.sha256()
+        size = 0
+        filename = None
+        part = None  # (name, filename, field bytes)
+        headers, field, value = {}, b"", b""
+        try:
+            with open(temp, "wb") as f:
+                async for chunk in body:
+                    try:
+                        parser.write(chunk)
+                    except MultipartParseError as e:
+                        raise InvalidUpload(f"malformed multipart body: {e}")
+                    for event, data in events:
+                        if event == "begin":
+                            headers, field, value = {}, b"", b""
+                        elif event == "header_field":
+                            field += data
+                        elif event == "header_value":
+                            value += data
+                        elif event == "header_end":
+                            headers[field.lower()], field, value = value, b"", b""
+                        elif event == "headers":
+                            _, disposition = parse_options_header(headers.get(b"content-disposition", b""))
+                            name = disposition.get(b"name", b"").decode()
+                            part_filename = disposition.get(b"filename", b"").decode() or None
+                            if name == file_field:
+                                if filename is not None or part_filename is None:
+                                    raise InvalidUpload(f"expected exactly one file in the {file_field!r} field")
+                                if suffixes and not part_filename.endswith(suffixes):
+                                    raise InvalidUpload(f"{part_filename} is not one of {', '.join(suffixes)}")
+                                filename = part_filename
+                            part = (name, part_filename, bytearray())
+                        elif event == "data" and part[0] == file_field:
+                            size += len(data)
+                            if size > self.max_size:
+                                raise UploadTooLarge(f"upload is larger than {self.max_size} bytes")
+                            await asyncio.to_thread(_write, f, hasher, data)
+                        elif event == "data":
+                            part[2].extend(data)
+                            if len(part[2]) > MAX_FIELD_SIZE:
+                                raise InvalidUpload(f"form field {part[0]!r} is larger than {MAX_FIELD_SIZE} bytes")
+                        elif event == "end" and part[0] != file_field and part[1] is None:
+                            fields[part[0]] = part[2].decode(errors="replace")
+                    events.clear()
+                parser.finalize()
+            if filename is None:
+                raise InvalidUpload(f"no file in the {file_field!r} field")
+        except BaseException:
+            temp.unlink(missing_ok=True)
+            raise
+        sha = hasher.hexdigest()
+        self._commit(temp, sha)
+        return fields, filename, sha, size
+
+    def link(self, sha: str, directory, filename: str) -> Path:
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        target = directory / os.path.basename(filename)
+        with self.lock:
+            os.utime(self.blob_path(sha))
+            try:
+                os.link(self.blob_path(sha), target)
+            except OSError:
+                # other filesystem, no hardlinks
+                shutil.copyfile(self.blob_path(sha), target)
+        return target
+
+    # resumable protocol
+
+    def create(self, filename: str, size: int | None = None, sha256: str | None = None) -> dict:
+        if size is not None and size > self.max_size:
+            raise UploadTooLarge(f"upload is larger than {self.max_size} bytes")
+        upload_id = str(uuid.uuid4())
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO sessions VALUES (?, ?, ?, ?, ?)",
+                (upload_id, os.path.basename(filename), size, sha256.lower() if sha256 else None, time.time()),
+            )
+        if not self.has_blob(sha256):
+            (self.partial / upload_id).touch()
+        return self.session(upload_id)
+
+    def session(self, upload_id: str) -> dict | None:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT filename, size, sha256 FROM sessions WHERE upload_id = ?", (upload_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        filename, size, sha = row
+        partial = self.partial / upload_id
+        # a known hash needs no bytes at all
+        complete = self.has_blob(sha) and not partial.exists()
+        if complete:
+            offset = self.blob_path(sha).stat().st_size
+        else:
+            offset = partial.stat().st_size if partial.exists() else 0
+        return {"upload_id": upload_id, "filename": filename, "offset": offset, "size": size, "complete": complete}
+
+    async def append(self, upload_id: str, offset: int, chunks) -> int:
+        """Appends a chunk stream at `offset`, which has to be the current size of the partial file."""
+        partial = self.partial / upload_id
+        lock = self.appending.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            if not partial.exists():
+                raise KeyError(upload_id)
+            current = partial.stat().st_size
+            if offset != current:
+                raise OffsetMismatch(current)
+            hasher = self.hashers.get(upload_id)
+            if hasher is None or hasher[1] != current:
+                # server restarted or an earlier append failed half way
+                hasher = (await asyncio.to_thread(_hash_file, partial), current)
+            hasher, size = hasher
+            with self.lock:
+                declared = self.conn.execute("SELECT size FROM sessions WHERE upload_id = ?", (upload_id,)).fetchone()[0]
+            try:
+                with open(partial, "ab") as f:
+                    async for chunk in chunks:
+                        size += len(chunk)
+                        if declared is not None and size > declared:
+                            raise UploadTooLarge(f"upload is larger than the declared {declared} bytes")
+                        if size > self.max_size:
+                            raise UploadTooLarge(f"upload is larger than {self.max_size} bytes")
+                        await asyncio.to_thread(_write, f, hasher, chunk)
+            finally:
+                self.hashers[upload_id] = (hasher, partial.stat().st_size)
+            return size
+
+    async def complete(self, upload_id: str) -> str:
+        session = self.session(upload_id)
+        if session is None:
+            raise KeyError(upload_id)
+        with self.lock:
+            expected = self.conn.execute("SELECT sha256 FROM sessions WHERE upload_id = ?", (upload_id,)).fetchone()[0]
+        partial = self.partial / upload_id
+        if session["complete"]:
+            return expected
+        if session["size"] is not None and session["offset"] != session["size"]:
+            raise OffsetMismatch(session["offset"])
+        async with self.appending.setdefault(upload_id, asyncio.Lock()):
+            hasher = self.hashers.pop(upload_id, None)
+            if hasher is None or hasher[1] != partial.stat().st_size:
+                hasher = (await asyncio.to_thread(_hash_file, partial), None)
+            sha = hasher[0].hexdigest()
+            if expected and sha != expected:
+                raise HashMismatch(f"upload hashes to {sha}, expected {expected}")
+            self._commit(partial, sha)
+        self.appending.pop(upload_id, None)
+        with self.lock:
+            self.conn.execute("UPDATE sessions SET sha256 = ? WHERE upload_id = ?", (sha, upload_id))
+        return sha
+
+    def collect(self, session_ttl: float = SESSION_TTL, blob_ttl: float = BLOB_TTL) -> dict:
+        """Drops abandoned sessions and their partial files, and blobs no run links to (st_nlink 1) unused for blob_ttl."""
+        now = time.time()
+        with self.lock:
+            expired = self.conn.execute(
+                "SELECT upload_id FROM sessions WHERE created_at < ?", (now - session_ttl,)
+            ).fetchall()
+            self.conn.executemany("DELETE FROM sessions WHERE upload_id = ?", expired)
+            # hashes a live session may still complete or link
+            wanted = {row[0] for row in self.conn.execute("SELECT sha256 FROM sessions WHERE sha256 IS NOT NULL")}
+        removed = {"sessions": len(expired), "partial": 0, "blobs": 0}
+        for (upload_id,) in expired:
+            self.hashers.pop(upload_id, None)
+            self.appending.pop(upload_id, None)
+        with self.lock:
+            live = {row[0] for row in self.conn.execute("SELECT upload_id FROM sessions")}
+        for path in self.partial.iterdir():
+            # partial files of expired sessions, stream-* files of interrupted write_stream() calls
+            if path.name not in live and now - path.stat().st_mtime > session_ttl:
+                path.unlink(missing_ok=True)
+                removed["partial"] += 1
+        with self.lock:
+            for path in self.blobs.iterdir():
+                stat = path.stat()
+                if stat.st_nlink == 1 and path.name not in wanted and now - stat.st_mtime > blob_ttl:
+                    path.unlink(missing_ok=True)
+                    removed["blobs"] += 1
+        return removed
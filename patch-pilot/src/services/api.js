@@ -53,6 +53,59 @@ export const api = {
         return response.json();
     },
 
+    /**
+     * Fetches the current status of an analysis run.
+     * @param {string} runId
+     */
+    getRun: async (runId) => {
+        const response = await fetch(`${API_BASE_URL}/runs/${runId}`);
+        if (!response.ok) {
+            throw new Error('Failed to fetch run status');
+        }
+        return response.json();
+    },
+
+    /**
+     * Cancels a queued or running analysis run.
+     * @param {string} runId
+     */
+    cancelRun: async (runId) => {
+        const response = await fetch(`${API_BASE_URL}/runs/${runId}/cancel`, { method: 'POST' });
+        if (!response.ok) {
+            throw new Error('Failed to cancel run');
+        }
+        return response.json();
+    },
+
+    /**
+     * Streams live events of a run (status, stage, document, token, patched, end).
+     * Returns a function that closes the stream.
+     * @param {string} runId
+     * @param {{onEvent?: Function, onToken?: Function, onEnd?: Function, onError?: Function}} handlers
+     */
+    streamRun: (runId, { onEvent, onToken, onEnd, onError } = {}) => {
+        const source = new EventSource(`${API_BASE_URL}/runs/${runId}/events`);
+        source.onmessage = (message) => {
+            const event = JSON.parse(message.data);
+            if (event.type === 'token') {
+                onToken?.(event);
+            } else {
+                onEvent?.(event);
+            }
+            if (event.type === 'end') {
+                source.close();
+                onEnd?.(event);
+            }
+        };
+        source.onerror = (error) => {
+            // EventSource reconnects on its own, only report when it gave up
+            if (source.readyState === EventSource.CLOSED) {
+                onError?.(error);
+            }
+        };
+        return () => source.close();
+    },
+
     // Keep existing mock methods for parts not yet refactored on backend to ensure app doesn't crash completely
     // In a full refactor, these would also be replaced.
     getDiscovery: async () => {